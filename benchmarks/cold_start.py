@@ -0,0 +1,71 @@
+"""
+Cold-start benchmark for xaiflow
+
+Measures, each in a fresh interpreter:
+  * import time of xaiflow + XaiflowPlugin() (lazy imports)
+  * import time of what `import xaiflow` used to pull in eagerly (mlflow, MlflowClient, shap, jinja2)
+and, in one process, the first report render against a second one that hits the
+template/bundle cache.
+
+Usage:
+    python benchmarks/cold_start.py [--repeats 5]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+LAZY_IMPORT = "from xaiflow import XaiflowPlugin; XaiflowPlugin()"
+EAGER_IMPORT = "import mlflow; from mlflow.tracking import MlflowClient; import shap; import jinja2; import xaiflow"
+
+
+def time_in_subprocess(statement: str, repeats: int) -> float:
+    """Median wall time in seconds of running statement in a fresh interpreter."""
+    code = f"import time; _t = time.perf_counter(); {statement}; print(time.perf_counter() - _t)"
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def time_renders(n_rows: int = 1000, n_features: int = 20) -> tuple:
+    """Wall time of the first (cold cache) and second (warm cache) render in this process."""
+    import numpy as np
+    from xaiflow import ReportGenerator
+
+    values = np.random.default_rng(0).normal(size=(n_rows, n_features))
+    report_data = dict(
+        importance_data={'features': [str(i) for i in range(n_features)], 'values': [1 / n_features] * n_features},
+        shap_values=values,
+        feature_values=values,
+        base_values=0.0,
+    )
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        ReportGenerator().render(**report_data)
+        timings.append(time.perf_counter() - start)
+    return tuple(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    lazy = time_in_subprocess(LAZY_IMPORT, args.repeats)
+    eager = time_in_subprocess(EAGER_IMPORT, args.repeats)
+    first_render, second_render = time_renders()
+
+    print(f"{'stage':<40} {'seconds':>10}")
+    print(f"{'import xaiflow + XaiflowPlugin() (lazy)':<40} {lazy:>10.3f}")
+    print(f"{'eager mlflow/shap/jinja2 imports':<40} {eager:>10.3f}")
+    print(f"{'first render (cold template/bundle)':<40} {first_render:>10.3f}")
+    print(f"{'second render (cached)':<40} {second_render:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Report size versus decode time of the compressed payload
+
+For a few representative explanation shapes, writes the report uncompressed and with
+the supported codecs/levels, and measures:
+  * the size of the report file
+  * the time to write it in Python
+  * the time to read the payload back in JavaScript with the decoder of report.html, run
+    with node: readBlock and JSON.parse, then inflateColumns (atob + DecompressionStream of
+    every compressed column). Turning the column bytes into typed arrays afterwards
+    (decodePayload) is the same with and without compression
+
+Usage:
+    python benchmarks/compression.py [--repeats 5]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from xaiflow import ReportGenerator
+
+SHAPES = [(1_000, 20), (10_000, 50), (100_000, 20)]
+# (payload_encoding, codec, level)
+SETTINGS = [
+    ("binary", None, None),
+    ("binary", "gzip", 1),
+    ("binary", "gzip", 6),
+    ("binary", "gzip", 9),
+    ("binary", "deflate-raw", 6),
+    ("json", None, None),
+    ("json", "gzip", 6),
+]
+
+# inflate, readBlock and inflateColumns of report.html
+IN_PAGE_DECODER = r"(async function inflate\(.*?async function inflateColumns\(node\) \{.*?\n        \})"
+
+NODE_DECODE = r"""
+const fs = require('fs');
+const html = fs.readFileSync(process.argv[1], 'utf8');
+const repeats = Number(process.argv[2]);
+const tag = html.match(/<script type="application\/(?:json|octet-stream)" id="xaiflow-payload"(?: data-compression="([a-z-]+)")?>([\s\S]*?)<\/script>/);
+const element = {dataset: {compression: tag[1]}, textContent: tag[2]};
+%(decoder)s
+(async () => {
+  const timings = [];
+  for (let i = 0; i < repeats; i++) {
+    const start = performance.now();
+    await inflateColumns(JSON.parse(await readBlock(element)));
+    timings.push(performance.now() - start);
+  }
+  timings.sort((a, b) => a - b);
+  process.stdout.write(String(timings[Math.floor(timings.length / 2)] / 1000));
+})();
+"""
+
+
+def make_report_data(n_rows: int, n_features: int) -> dict:
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(scale=0.1, size=(n_rows, n_features))
+    feature_values = np.column_stack([
+        rng.integers(0, 5, n_rows) if j % 4 == 0 else rng.normal(size=n_rows)
+        for j in range(n_features)
+    ])
+    names = [f"feature_{j}" for j in range(n_features)]
+    return dict(
+        importance_data={'features': names, 'values': [1 / n_features] * n_features},
+        shap_values=shap_values,
+        feature_values=feature_values,
+        group_labels=rng.choice(["train", "test", "holdout"], n_rows),
+        feature_names=names,
+        round_decimals=4,
+    )
+
+
+def node_decode_seconds(path: str, decoder: str, repeats: int) -> float:
+    script = NODE_DECODE % {"decoder": decoder}
+    output = subprocess.run(["node", "-e", script, path, str(repeats)], check=True, capture_output=True, text=True)
+    return float(output.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    generator = ReportGenerator()
+    has_node = shutil.which("node") is not None
+    print("| shape (rows x features) | payload_encoding | codec | level | report size | write | decode (JS) |")
+    print("|---|---|---|---|---|---|---|")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "report.html")
+        for n_rows, n_features in SHAPES:
+            report_data = make_report_data(n_rows, n_features)
+            for payload_encoding, codec, level in SETTINGS:
+                options = {"payload_encoding": payload_encoding}
+                if codec is not None:
+                    options.update(compression=codec, compression_level=level)
+                start = time.perf_counter()
+                generator.write(path, **options, **report_data)
+                write_seconds = time.perf_counter() - start
+                size = os.path.getsize(path)
+                decode = "n/a (no node)"
+                if has_node:
+                    with open(path, encoding="utf-8") as f:
+                        decoder = re.search(IN_PAGE_DECODER, f.read(), re.S).group(1)
+                    decode = f"{node_decode_seconds(path, decoder, args.repeats) * 1000:.1f} ms"
+                print(
+                    f"| {n_rows:,} x {n_features} | {payload_encoding} | {codec or 'none'} | {level or '-'} "
+                    f"| {size / 1e6:.2f} MB | {write_seconds * 1000:.0f} ms | {decode} |"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Benchmark suite: how report generation and page load scale with rows, features and dtypes
+
+For every case of a grid of rows x features x dtypes, on a synthetic shap.Explanation
+(fixed seeds, so runs are comparable), measures:
+  * Python: generation time per stage (prepare, aggregate, render, median of --repeats),
+    peak traced memory (one separate run with tracemalloc) and the report size
+  * headless Chromium (playwright, as in tests/test_mlflow_plugin.py): time to first chart
+    (navigation start until the importance chart is drawn), and the time to switch the
+    selected feature and the selected group until the next frame is drawn, median of
+    --repeats switches
+
+dtypes: "float64" and "float32" SHAP and feature values, "mixed" float32 SHAP values and an
+object array of feature values with string categories in every 4th and booleans in every
+following column.
+
+Results are written as JSON with --output. --baseline compares them against an earlier
+result file, prints the ratio per metric and exits with status 1 if a metric got worse
+by more than --tolerance.
+
+Usage:
+    python benchmarks/report_suite.py --output results.json
+    python benchmarks/report_suite.py --rows 1000 10000 --features 20 --no-browser
+    python benchmarks/report_suite.py --output new.json --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from xaiflow import XaiflowPlugin, __version__
+from xaiflow.instrumentation import StageRecorder, output_size
+
+ROWS = [1_000, 10_000, 100_000]
+FEATURES = [10, 50]
+DTYPES = ["float64", "float32", "mixed"]
+GROUPS = ["train", "test", "holdout"]
+
+# Case keys and the metrics compared against a baseline, lower is better for all of them
+CASE_KEYS = ("rows", "features", "dtype")
+METRICS = (
+    "prepare_seconds", "aggregate_seconds", "render_seconds", "generate_seconds", "peak_bytes", "report_bytes",
+    "first_chart_ms", "feature_switch_ms", "group_switch_ms",
+)
+
+# Resolves with performance.now() once the next frame is drawn
+NEXT_FRAME = "new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(() => resolve(performance.now()))))"
+CHART_DRAWN = """
+    () => {
+        const canvas = document.querySelector('.importance-chart-container canvas');
+        return canvas !== null && canvas.width > 0 && canvas.height > 0;
+    }
+"""
+# Rows of (x, y) page coordinates a little inside the left end of a colored horizontal bar
+FIND_BARS = """
+    (canvas) => {
+        const {data, width, height} = canvas.getContext('2d').getImageData(0, 0, canvas.width, canvas.height);
+        const rect = canvas.getBoundingClientRect();
+        const points = [];
+        for (let y = 0; y < height; y += 2) {
+            let run = 0;
+            for (let x = 1; x < width; x++) {
+                const i = (y * width + x) * 4;
+                const colored = data[i + 3] === 255 && !(data[i] === data[i + 1] && data[i + 1] === data[i + 2]);
+                const same = data[i] === data[i - 4] && data[i + 1] === data[i - 3] && data[i + 2] === data[i - 2];
+                run = colored && same ? run + 1 : 0;
+                if (run === 8) {
+                    points.push([rect.left + (x - 4) * rect.width / width, rect.top + y * rect.height / height]);
+                    break;
+                }
+            }
+        }
+        return points;
+    }
+"""
+TEXT_CHANGED = """
+    ([selector, previous]) => {
+        const element = document.querySelector(selector);
+        return element !== null && element.textContent !== previous;
+    }
+"""
+
+
+def make_explanation(n_rows: int, n_features: int, dtype: str):
+    """Synthetic explanation with SHAP values that depend on the feature values, and group labels"""
+    import shap
+
+    rng = np.random.default_rng(0)
+    float_dtype = np.float64 if dtype == "float64" else np.float32
+    feature_values = rng.normal(size=(n_rows, n_features)).astype(float_dtype)
+    weights = rng.uniform(0.05, 1.0, n_features)
+    shap_values = (feature_values * weights + rng.normal(scale=0.05, size=(n_rows, n_features))).astype(float_dtype)
+    data = feature_values
+    if dtype == "mixed":
+        # string categories in every 4th column and booleans in the column after it, dictionary-encoded in the report
+        data = feature_values.astype(object)
+        for j in range(0, n_features, 4):
+            data[:, j] = np.array(["low", "medium", "high", "very high", "unknown"])[rng.integers(0, 5, n_rows)]
+            if j + 1 < n_features:
+                data[:, j + 1] = feature_values[:, j + 1] > 0
+    explanation = shap.Explanation(
+        values=shap_values,
+        base_values=np.full(n_rows, 0.5),
+        data=data,
+        feature_names=[f"feature_{j}" for j in range(n_features)],
+    )
+    return explanation, rng.choice(GROUPS, n_rows).tolist()
+
+
+def generate(plugin: XaiflowPlugin, path: str, explanation, group_labels, trace_memory: bool):
+    """Write the report the way log_xai_report does (without logging it), returns its StageRecords"""
+    recorder = StageRecorder(os.path.basename(path), trace_memory=trace_memory)
+    try:
+        job = plugin._prepare_recorded_job(recorder, **plugin._bind_report_arguments(
+            explanation.feature_names,
+            explanation,
+            group_labels=group_labels,
+            run_id="benchmark",
+        ))
+        plugin._write_report(job, path, recorder)
+    finally:
+        recorder.close()
+    return recorder.finish()
+
+
+def measure_python(explanation, group_labels, path: str, repeats: int) -> Dict[str, Any]:
+    plugin = XaiflowPlugin()
+    # warm the template and bundle cache, the first render of a process is not what is measured
+    generate(plugin, path, explanation, group_labels, trace_memory=False)
+    runs = [generate(plugin, path, explanation, group_labels, trace_memory=False) for _ in range(repeats)]
+    result = {
+        f"{stage}_seconds": statistics.median(run[stage].seconds for run in runs)
+        for stage in ("prepare", "aggregate", "render")
+    }
+    result["generate_seconds"] = statistics.median(sum(record.seconds for record in run.values()) for run in runs)
+    traced = generate(plugin, path, explanation, group_labels, trace_memory=True)
+    result["peak_bytes"] = max(record.peak_bytes for record in traced.values())
+    result["report_bytes"] = output_size(path)
+    return result
+
+
+def find_bars(canvas) -> List[Tuple[float, float]]:
+    """Page coordinates to click the bars of a horizontal bar chart, top to bottom"""
+    bars: List[List[Tuple[float, float]]] = []
+    for x, y in canvas.evaluate(FIND_BARS):
+        if bars and y - bars[-1][-1][1] <= 4:
+            bars[-1].append((x, y))
+        else:
+            bars.append([(x, y)])
+    if len(bars) < 2:
+        raise RuntimeError("Could not find two bars in the importance chart.")
+    return [bar[len(bar) // 2] for bar in bars]
+
+
+def switch_ms(page, action, selector: str) -> float:
+    """Milliseconds from action until the text of selector changed and the next frame is drawn"""
+    previous = page.eval_on_selector(selector, "element => element.textContent")
+    start = page.evaluate("performance.now()")
+    action()
+    page.wait_for_function(TEXT_CHANGED, arg=[selector, previous], polling="raf")
+    return page.evaluate(NEXT_FRAME) - start
+
+
+def measure_browser(browser, path: str, repeats: int) -> Dict[str, Any]:
+    page = browser.new_page(viewport={"width": 1400, "height": 1000})
+    try:
+        page.goto(f"file://{os.path.abspath(path)}", wait_until="commit")
+        page.wait_for_function(CHART_DRAWN, polling="raf", timeout=300_000)
+        result = {"first_chart_ms": page.evaluate(NEXT_FRAME)}
+
+        # alternate between the two most important features (the top bars of the importance chart)
+        bars = itertools.cycle(find_bars(page.query_selector(".importance-chart-container canvas"))[:2])
+        page.mouse.click(*next(bars))
+        page.wait_for_selector(".selected-info")
+        result["feature_switch_ms"] = statistics.median(
+            switch_ms(page, lambda: page.mouse.click(*next(bars)), ".selected-info") for _ in range(repeats)
+        )
+
+        groups = itertools.cycle(GROUPS)
+        result["group_switch_ms"] = statistics.median(
+            switch_ms(page, lambda: page.select_option("#group-dropdown", next(groups)), ".selected-info")
+            for _ in range(repeats)
+        )
+    finally:
+        page.close()
+    return result
+
+
+def run(rows: List[int], features: List[int], dtypes: List[str], repeats: int, browser_name: Optional[str]) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="xaiflow-benchmark-") as tmp_dir, _launch(browser_name) as browser:
+        path = os.path.join(tmp_dir, "report.html")
+        for n_rows, n_features, dtype in itertools.product(rows, features, dtypes):
+            explanation, group_labels = make_explanation(n_rows, n_features, dtype)
+            result = {"rows": n_rows, "features": n_features, "dtype": dtype}
+            result.update(measure_python(explanation, group_labels, path, repeats))
+            if browser is not None:
+                result.update(measure_browser(browser, path, repeats))
+            results.append(result)
+            print(_format_row(result), flush=True)
+    return {"environment": _environment(browser_name), "results": results}
+
+
+class _launch:
+    """Headless browser of playwright as a context manager, None without browser_name"""
+
+    def __init__(self, browser_name: Optional[str]):
+        self.browser_name = browser_name
+        self.playwright = None
+
+    def __enter__(self):
+        if self.browser_name is None:
+            return None
+        from playwright.sync_api import sync_playwright
+
+        self.playwright = sync_playwright().start()
+        self.browser = getattr(self.playwright, self.browser_name).launch()
+        return self.browser
+
+    def __exit__(self, *exc_info):
+        if self.playwright is not None:
+            self.browser.close()
+            self.playwright.stop()
+
+
+def _environment(browser_name: Optional[str]) -> Dict[str, Any]:
+    return {
+        "xaiflow": __version__,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "browser": browser_name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def _format_row(result: Dict[str, Any]) -> str:
+    browser = " ".join(
+        f"{name}={result[name]:.0f}ms" for name in ("first_chart_ms", "feature_switch_ms", "group_switch_ms") if name in result
+    )
+    return (
+        f"{result['rows']:>9,} x {result['features']:<4} {result['dtype']:<8} "
+        f"generate={result['generate_seconds'] * 1000:.0f}ms peak={result['peak_bytes'] / 1e6:.1f}MB "
+        f"size={result['report_bytes'] / 1e6:.2f}MB {browser}"
+    )
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Ratio of every metric to the baseline, for the cases and metrics present in both
+
+    Returns:
+        List[str]: Metrics that got worse by more than tolerance, as "<case> <metric>"
+    """
+    baseline_cases = {tuple(result[key] for key in CASE_KEYS): result for result in baseline["results"]}
+    regressions = []
+    print(f"{'case':<28} {'metric':<20} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for result in results["results"]:
+        case = tuple(result[key] for key in CASE_KEYS)
+        if case not in baseline_cases:
+            continue
+        label = f"{case[0]:,} x {case[1]} {case[2]}"
+        for metric in METRICS:
+            before, after = baseline_cases[case].get(metric), result.get(metric)
+            if before is None or after is None or before <= 0:
+                continue
+            ratio = after / before
+            flag = ""
+            if ratio > 1 + tolerance:
+                regressions.append(f"{label} {metric}")
+                flag = "  worse"
+            print(f"{label:<28} {metric:<20} {before:>12.4g} {after:>12.4g} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--features", type=int, nargs="+", default=FEATURES)
+    parser.add_argument("--dtypes", nargs="+", default=DTYPES, choices=DTYPES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--browser", default="chromium", choices=["chromium", "firefox", "webkit"])
+    parser.add_argument("--no-browser", action="store_true", help="only measure the Python side")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase of a metric")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.features, args.dtypes, args.repeats, None if args.no_browser else args.browser)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) worse than the baseline by more than {args.tolerance:.0%}:")
+            print("\n".join(f"  {regression}" for regression in regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ import typescript from '@rollup/plugin-typescript';
 
 const production = !process.env.ROLLUP_WATCH;
 
-export default {
+export default [{
   input: 'src/xaiflow/templates/main.js',
   output: {
     sourcemap: true,
@@ -39,4 +39,25 @@ export default {
   watch: {
     clearScreen: false
   }
-};
+}, {
+  // The data engine as a Web Worker script, see templates/worker.ts
+  input: 'src/xaiflow/templates/worker.ts',
+  output: {
+    sourcemap: true,
+    format: 'iife',
+    file: 'src/xaiflow/templates/assets/worker.js'
+  },
+  plugins: [
+    typescript({
+      sourceMap: !production,
+      inlineSources: !production
+    }),
+    resolve({
+      browser: true
+    }),
+    production && terser()
+  ],
+  watch: {
+    clearScreen: false
+  }
+}];
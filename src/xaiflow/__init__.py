@@ -5,10 +5,28 @@ This package provides MLflow integration for generating interactive HTML reports
 with SHAP analysis using Svelte and Chart.js.
 """
 
-from .mlflow_plugin import XaiflowPlugin
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .mlflow_plugin import XaiflowPlugin
+    from .report_generator import ReportGenerator
 
 __version__ = "0.1.0"
 __author__ = "CloudExplain Team"
 __email__ = "tobias@cloudexplain.eu"
 
-__all__ = ["CEMLflowPlugin"]
\ No newline at end of file
+__all__ = ["XaiflowPlugin", "ReportGenerator"]
+
+# Submodules are imported on first attribute access, so `import xaiflow` stays cheap
+_lazy_imports = {
+    "XaiflowPlugin": ".mlflow_plugin",
+    "ReportGenerator": ".report_generator",
+}
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        import importlib
+        module = importlib.import_module(_lazy_imports[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
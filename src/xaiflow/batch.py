@@ -0,0 +1,169 @@
+"""
+Batch rendering of many reports on a process pool
+Numeric arrays are handed to the workers through shared memory instead of being pickled
+"""
+
+import mmap
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .report_generator import ReportGenerator
+
+
+class SharedArray(NamedTuple):
+    """Reference to an array in a shared memory segment, pickled in place of the array"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class MappedArray(NamedTuple):
+    """Reference to a memory-mapped file, pickled in place of the np.memmap and mapped again by the worker"""
+    filename: str
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+    order: str
+
+
+class SharedArrays:
+    """
+    Shared memory segments for the arrays of a batch, one segment per distinct array
+
+    Arrays referenced by several jobs (e.g. the feature matrix of per-class reports) are
+    copied into shared memory once. Memory-mapped files are not copied, the workers map
+    them again. Object arrays and lists are left as they are and get pickled. Use as a
+    context manager, the segments are unlinked on exit.
+    """
+
+    def __init__(self):
+        self._segments: Dict[int, Tuple[np.ndarray, shared_memory.SharedMemory, SharedArray]] = {}
+
+    def share(self, value: Any) -> Any:
+        """Copy value into shared memory and return its SharedArray, other values are returned as is"""
+        if not isinstance(value, np.ndarray) or value.dtype.hasobject or value.nbytes == 0:
+            return value
+        # only a memmap owning its mapping knows its offset in the file, views are copied
+        if isinstance(value, np.memmap) and isinstance(value.base, mmap.mmap) and value.filename:
+            order = "F" if value.flags.f_contiguous and not value.flags.c_contiguous else "C"
+            return MappedArray(value.filename, value.offset, value.shape, value.dtype.str, order)
+        key = id(value)
+        if key not in self._segments:
+            segment = shared_memory.SharedMemory(create=True, size=value.nbytes)
+            np.ndarray(value.shape, value.dtype, buffer=segment.buf)[...] = value
+            # value is kept referenced so its id is not reused within the batch
+            self._segments[key] = (value, segment, SharedArray(segment.name, value.shape, value.dtype.str))
+        return self._segments[key][2]
+
+    def share_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: self.share(value) for key, value in job.items()}
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc_info):
+        for _, segment, _ in self._segments.values():
+            segment.close()
+            segment.unlink()
+        self._segments.clear()
+
+
+def _attach(value: Any, segments: List[shared_memory.SharedMemory]) -> Any:
+    """Inverse of SharedArrays.share inside a worker, returns a read-only view on the segment"""
+    if isinstance(value, MappedArray):
+        return np.memmap(value.filename, np.dtype(value.dtype), mode="r", offset=value.offset,
+                         shape=value.shape, order=value.order)
+    if not isinstance(value, SharedArray):
+        return value
+    segment = shared_memory.SharedMemory(name=value.name)
+    segments.append(segment)
+    array = np.ndarray(value.shape, np.dtype(value.dtype), buffer=segment.buf)
+    array.flags.writeable = False
+    return array
+
+
+# Report generator of a worker process, created once by _init_worker
+_worker_plugin = None
+
+
+def _init_worker(template_dir: str):
+    """Create the worker's plugin and fill the template and bundle caches once per worker"""
+    global _worker_plugin
+    from .mlflow_plugin import XaiflowPlugin
+
+    _worker_plugin = XaiflowPlugin()
+    _worker_plugin.report_generator = ReportGenerator(template_dir)
+    _worker_plugin.report_generator.preload()
+
+
+def _render_job(job: Dict[str, Any]) -> Tuple[str, float]:
+    """Write the report of a shared job to a temporary file, runs in a worker"""
+    start = time.perf_counter()
+    segments: List[shared_memory.SharedMemory] = []
+    job = {key: _attach(value, segments) for key, value in job.items()}
+    fd, path = tempfile.mkstemp(suffix='.html')
+    os.close(fd)
+    try:
+        _worker_plugin._write_report(job, path)
+    except BaseException:
+        _worker_plugin._remove_report_files(path)
+        raise
+    finally:
+        del job
+        for segment in segments:
+            try:
+                segment.close()
+            except BufferError:
+                # a view is still referenced (e.g. by a traceback), the mapping is released with it
+                pass
+    return path, time.perf_counter() - start
+
+
+def render_reports(
+    jobs: Sequence[Dict[str, Any]],
+    template_dir: str,
+    max_workers: Optional[int] = None,
+    mp_context: Any = None,
+) -> Iterator[Tuple[int, Optional[str], Optional[BaseException], float]]:
+    """
+    Render prepared jobs (see XaiflowPlugin._prepare_report_job) on a process pool
+
+    Warm the caches of the calling process first (ReportGenerator.preload) so forked
+    workers inherit the compiled template and the bundle.
+
+    Args:
+        jobs: Prepared report jobs
+        template_dir: Template directory of the report generator
+        max_workers: Number of worker processes, defaults to min(len(jobs), os.cpu_count())
+        mp_context: Optional multiprocessing context, e.g. multiprocessing.get_context("spawn")
+
+    Yields:
+        Tuple[int, Optional[str], Optional[BaseException], float]: (job index, path of the
+            written report or None, error or None, render seconds) in completion order.
+            The caller owns (and deletes) the written files, including the shards of split reports
+    """
+    if len(jobs) == 0:
+        return
+    max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    with SharedArrays() as shared:
+        shared_jobs = [shared.share_job(job) for job in jobs]
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(template_dir,),
+        ) as executor:
+            futures = {executor.submit(_render_job, job): index for index, job in enumerate(shared_jobs)}
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    yield futures[future], None, error, float("nan")
+                else:
+                    path, seconds = future.result()
+                    yield futures[future], path, None, seconds
@@ -0,0 +1,160 @@
+"""
+On-disk cache of rendered reports, keyed by a content hash of everything the report depends on
+Rendering is deterministic, so a report whose inputs hash the same as a cached one is not
+rendered again, and a report that is already logged at the same place is not uploaded again
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+ENTRY_FILE = "entry.json"
+REPORT_FILE = "report.html"
+
+# Default upper bound for the size of the cache directory, oldest entries are removed first
+DEFAULT_CACHE_BYTES = 1024 ** 3
+
+# Bytes hashed at a time for large (e.g. memory-mapped) arrays
+_HASH_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def _update_array(digest: Any, values: Any):
+    """Feed dtype, shape and content of an array to digest, block by block"""
+    array = np.asarray(values)
+    digest.update(f"{array.dtype.str}{array.shape}".encode())
+    if array.ndim == 0:
+        array = array.reshape(1)
+    block_rows = max(1, _HASH_BLOCK_BYTES // max(1, array[:1].nbytes))
+    for start in range(0, array.shape[0], block_rows):
+        block = array[start:start + block_rows]
+        if block.dtype.hasobject:
+            digest.update(json.dumps(block.tolist(), default=repr).encode())
+        else:
+            digest.update(np.ascontiguousarray(block).data)
+
+
+def content_hash(arrays: Dict[str, Any], options: Dict[str, Any], assets: List[str]) -> str:
+    """
+    Hex digest over the input arrays, the options and the assets of a report
+
+    Args:
+        arrays: Arrays (or None) by name, e.g. shap_values, feature_values and group_labels
+        options: JSON serializable arguments that change the output
+        assets: Contents of the template and the bundle
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    for asset in assets:
+        digest.update(hashlib.sha256(asset.encode("utf-8")).digest())
+    digest.update(json.dumps(options, sort_keys=True, default=repr).encode())
+    for name in sorted(arrays):
+        digest.update(name.encode())
+        if arrays[name] is None:
+            digest.update(b"None")
+        else:
+            _update_array(digest, arrays[name])
+    return digest.hexdigest()
+
+
+class ReportCache:
+    """
+    Directory of rendered reports, one entry per content hash
+
+    An entry <key>/ holds report.html (plus report_data/ for split reports) and
+    entry.json, which records where the report was logged: [{"run_id", "artifact_path"}].
+    Entries are written to a temporary directory and renamed, so concurrent writers
+    never see a partial entry. Least recently used entries are removed beyond max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached report.html of key, None on a miss"""
+        path = os.path.join(self._entry(key), REPORT_FILE)
+        if not os.path.exists(path):
+            return None
+        # mark as recently used
+        os.utime(self._entry(key))
+        return path
+
+    def put(self, key: str, render: Callable[[str], Any]) -> str:
+        """
+        Render a report into the cache
+
+        Args:
+            key: Content hash of the report
+            render: Called with the path to write report.html to
+
+        Returns:
+            str: Path of the cached report.html
+        """
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.directory)
+        try:
+            render(os.path.join(staging, REPORT_FILE))
+            with open(os.path.join(staging, ENTRY_FILE), "w", encoding="utf-8") as f:
+                json.dump({"logged": []}, f)
+            try:
+                os.rename(staging, self._entry(key))
+            except OSError:
+                # rendered concurrently by another caller, its entry is identical
+                pass
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.prune(keep=key)
+        return os.path.join(self._entry(key), REPORT_FILE)
+
+    def logged(self, key: str) -> List[Dict[str, str]]:
+        """Where the report of key was logged, in order"""
+        try:
+            with open(os.path.join(self._entry(key), ENTRY_FILE), encoding="utf-8") as f:
+                return json.load(f)["logged"]
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def record(self, key: str, run_id: str, artifact_path: str):
+        """Remember that the report of key was logged to run_id at artifact_path"""
+        with self._lock:
+            logged = self.logged(key)
+            location = {"run_id": run_id, "artifact_path": artifact_path}
+            if location in logged or not os.path.isdir(self._entry(key)):
+                return
+            path = os.path.join(self._entry(key), ENTRY_FILE)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"logged": logged + [location]}, f)
+            os.replace(path + ".tmp", path)
+
+    def prune(self, keep: Optional[str] = None):
+        """Remove the least recently used entries (but keep) until the cache fits into max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = self._entry(name)
+                if name.startswith(".") or not os.path.isdir(path):
+                    continue
+                size = sum(
+                    os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files
+                )
+                entries.append((os.path.getmtime(path), size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if keep is not None and path == self._entry(keep):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
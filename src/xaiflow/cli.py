@@ -0,0 +1,187 @@
+"""
+Command line interface
+`xaiflow render` renders reports from SHAP arrays saved with numpy (e.g. on the cluster that
+computed them) on a process pool, and writes them to disk or logs them to an MLflow run
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .encoding import PAYLOAD_ENCODINGS
+from .streaming import load_npz
+
+
+# Arrays read from an input, a directory holds them as <name>.npy
+ARRAY_NAMES = ("shap_values", "data", "base_values", "group_labels", "feature_names", "output_names")
+
+
+def load_arrays(path: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the arrays of an input
+
+    Args:
+        path: An uncompressed .npz file (np.savez) or a directory of .npy files, holding
+            arrays named like ARRAY_NAMES
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays by name, shap_values and data are required
+
+    Raises:
+        ValueError: If the input is neither or lacks a required array
+    """
+    if os.path.isdir(path):
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_NAMES
+            if os.path.exists(os.path.join(path, f"{name}.npy"))
+        }
+    elif path.endswith(".npz"):
+        arrays = load_npz(path)
+    else:
+        raise ValueError(f"{path} is neither an .npz file nor a directory of .npy files.")
+    for name in ("shap_values", "data"):
+        if name not in arrays:
+            raise ValueError(f"{path} holds no {name} array.")
+    return arrays
+
+
+def report_name_of(path: str) -> str:
+    """Report name of an input, e.g. runs/fold_1.npz -> fold_1.html"""
+    name = os.path.basename(os.path.normpath(path))
+    return (name[:-len(".npz")] if name.endswith(".npz") else name) + ".html"
+
+
+def report_spec(arrays: Dict[str, np.ndarray], report_name: str, **options) -> Dict[str, Any]:
+    """
+    log_xai_report keyword arguments of an input
+
+    Missing feature names default to "Feature <j>", missing base values to 0, and a single
+    base value (or one per output) is used for every row.
+    """
+    import shap
+
+    values = arrays["shap_values"]
+    n_rows, n_features = values.shape[:2]
+    if "feature_names" in arrays:
+        feature_names = [str(name) for name in arrays["feature_names"]]
+    else:
+        feature_names = [f"Feature {j}" for j in range(n_features)]
+    base_values = np.asarray(arrays.get("base_values", 0.0), dtype=float)
+    if base_values.shape[:1] != (n_rows,):
+        base_values = np.broadcast_to(base_values, (n_rows,) + values.shape[2:])
+    spec = {
+        "feature_names": feature_names,
+        "shap_values": shap.Explanation(
+            values=values, base_values=base_values, data=arrays["data"], feature_names=feature_names
+        ),
+        "report_name": report_name,
+        **options,
+    }
+    if "group_labels" in arrays:
+        spec["group_labels"] = np.asarray(arrays["group_labels"])
+    if "output_names" in arrays:
+        spec["output_names"] = [str(name) for name in arrays["output_names"]]
+    return spec
+
+
+def _format_result(result: Dict[str, Any], source: str, done: int, total: int) -> str:
+    """Progress line of a finished report"""
+    prefix = f"[{done}/{total}] {source}"
+    if result["error"] is not None:
+        return f"{prefix} failed: {result['error']}"
+    timings = " ".join(
+        f"{stage} {seconds:.2f}s" for stage, seconds in result["timings"].items() if seconds is not None
+    )
+    return f"{prefix} -> {result['artifact_path']} ({timings})"
+
+
+def render(args: argparse.Namespace) -> int:
+    """The render command, returns the exit code"""
+    from .mlflow_plugin import XaiflowPlugin
+
+    if args.tracking_uri is not None:
+        import mlflow
+
+        mlflow.set_tracking_uri(args.tracking_uri)
+    options = {
+        "artifact_path": args.artifact_path,
+        "payload_encoding": args.payload_encoding,
+        "max_points_per_feature": args.max_points_per_feature,
+        "compression": args.compression,
+        "split": args.split,
+    }
+    if args.run_id is not None:
+        options["run_id"] = args.run_id
+
+    names = [report_name_of(path) for path in args.inputs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        print(f"xaiflow: inputs with the same report name: {', '.join(duplicates)}", file=sys.stderr)
+        return 2
+    try:
+        specs = [report_spec(load_arrays(path), name, **options) for path, name in zip(args.inputs, names)]
+    except (OSError, ValueError) as e:
+        print(f"xaiflow: {e}", file=sys.stderr)
+        return 2
+
+    sources = {name: path for path, name in zip(args.inputs, names)}
+    done = 0
+
+    def progress(result: Dict[str, Any]):
+        nonlocal done
+        done += 1
+        print(_format_result(result, sources[result["report_name"]], done, len(specs)), file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    try:
+        results = XaiflowPlugin().log_xai_reports(
+            specs, max_workers=args.workers, output_dir=args.output_dir, progress=progress
+        )
+    except ValueError as e:
+        print(f"xaiflow: {e}", file=sys.stderr)
+        return 2
+    failed = sum(result["error"] is not None for result in results)
+    print(f"{len(results) - failed}/{len(results)} reports in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="xaiflow", description="Interactive SHAP reports for MLflow.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "render",
+        help="render reports from saved SHAP arrays",
+        description="Render one report per input in parallel. An input is an uncompressed .npz file (np.savez) "
+                    "or a directory of .npy files with the arrays shap_values and data, and optionally "
+                    "base_values, group_labels, feature_names and output_names. Arrays are memory-mapped.",
+    )
+    command.add_argument("inputs", nargs="+", help=".npz files or directories of .npy files")
+    target = command.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output-dir", help="write the reports (and their summary sidecars) to this directory")
+    target.add_argument("--run-id", help="log the reports to this MLflow run")
+    command.add_argument("--tracking-uri", help="MLflow tracking URI, defaults to MLFLOW_TRACKING_URI")
+    command.add_argument("--artifact-path", default="reports", help="artifact directory of the logged reports")
+    command.add_argument("--workers", type=int, default=None, help="worker processes, defaults to one per CPU")
+    command.add_argument("--payload-encoding", choices=PAYLOAD_ENCODINGS, default="binary")
+    command.add_argument("--max-points-per-feature", type=int, default=None,
+                         help="downsample the SHAP scatter plot to this many points per feature")
+    command.add_argument("--compression", default=None, help="compress the payload with this codec, e.g. gzip")
+    command.add_argument("--split", action="store_true",
+                         help="write a small HTML shell and the matrices as shards next to it")
+    command.set_defaults(func=render)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
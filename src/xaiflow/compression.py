@@ -0,0 +1,81 @@
+"""
+Compression of the data embedded in the report
+Binary payloads compress the raw bytes of every column (base64 is applied once, to the
+compressed bytes), JSON payloads and the bundle are compressed as text. The page
+decompresses them with the browser's native DecompressionStream before mounting the charts
+"""
+
+import base64
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+
+# DecompressionStream format -> zlib wbits producing that container
+COMPRESSION_CODECS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+    "deflate-raw": -zlib.MAX_WBITS,
+}
+
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Compressed bytes collected before a base64 piece is emitted, a multiple of 3 avoids padding
+_PIECE_BYTES = 65536 * 3
+
+
+def check_codec(codec: Optional[str]) -> Optional[str]:
+    """Validate a compression codec name, None means no compression"""
+    if codec is not None and codec not in COMPRESSION_CODECS:
+        raise ValueError(f"compression must be one of {tuple(COMPRESSION_CODECS)} or None, got '{codec}'.")
+    return codec
+
+
+def iter_compressed_buffers(
+    buffers: Iterable[Any],
+    codec: str,
+    level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Iterator[str]:
+    """
+    Compress streamed bytes and yield them as base64, without holding all of them
+
+    Args:
+        buffers: Bytes-like pieces, e.g. encoding.iter_column_buffers
+        codec: Key of COMPRESSION_CODECS, the format passed to DecompressionStream
+        level: zlib compression level, 1 (fastest) to 9 (smallest)
+
+    Yields:
+        str: Pieces of one base64 string (only the last piece carries padding)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, COMPRESSION_CODECS[codec])
+    buffer = bytearray()
+    for piece in buffers:
+        buffer += compressor.compress(piece)
+        if len(buffer) >= _PIECE_BYTES:
+            cut = len(buffer) - len(buffer) % 3
+            yield base64.b64encode(buffer[:cut]).decode("ascii")
+            del buffer[:cut]
+    buffer += compressor.flush()
+    yield base64.b64encode(buffer).decode("ascii")
+
+
+def iter_compressed(
+    pieces: Iterable[str],
+    codec: str,
+    level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Iterator[str]:
+    """Compress streamed text (UTF-8), see iter_compressed_buffers"""
+    return iter_compressed_buffers((piece.encode("utf-8") for piece in pieces), codec, level)
+
+
+def compress(text: str, codec: str, level: int = DEFAULT_COMPRESSION_LEVEL) -> str:
+    """Compress a complete text, see iter_compressed"""
+    return "".join(iter_compressed([text], codec, level))
+
+
+def inflate(data: str, codec: str) -> bytes:
+    """Inverse of iter_compressed_buffers, mirrors inflate in templates/report.html"""
+    return zlib.decompress(base64.b64decode(data), COMPRESSION_CODECS[codec])
+
+
+def decompress(data: str, codec: str) -> str:
+    """Inverse of compress, mirrors readBlock in templates/report.html"""
+    return inflate(data, codec).decode("utf-8")
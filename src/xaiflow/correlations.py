@@ -0,0 +1,208 @@
+"""
+Correlations between the columns of the feature and SHAP matrices
+Pearson correlations are accumulated from row blocks that fit a memory budget, the blocks
+are spread over threads (numpy releases the GIL in its matrix products), and only the
+strongest partners of every feature are embedded in the report
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .encoding import _as_numeric
+
+
+# Partners embedded per feature
+DEFAULT_CORRELATION_TOP = 5
+# Upper bound for the float64 copies of the row blocks of all threads together
+DEFAULT_CORRELATION_BYTES = 256 * 1024 * 1024
+# float64 copies made of a block: values, finite mask, zero-filled values and their squares
+_BLOCK_COPIES = 4
+
+
+class CorrelationSums:
+    """
+    Pairwise sums of a (samples x columns) matrix, from which the Pearson correlation of
+    every pair of columns follows
+
+    Rows with a NaN or infinite value in either column of a pair are left out of that pair
+    only. Values are shifted by the first finite value of their column, so that large
+    offsets do not cancel out in the sums.
+    """
+
+    def __init__(self, shift: np.ndarray):
+        """
+        Args:
+            shift: Value subtracted from every column
+        """
+        n_columns = len(shift)
+        self.shift = shift
+        self.count = np.zeros((n_columns, n_columns))
+        # sums[i, j] and squares[i, j] over the rows where column j is finite as well
+        self.sums = np.zeros((n_columns, n_columns))
+        self.squares = np.zeros((n_columns, n_columns))
+        self.products = np.zeros((n_columns, n_columns))
+
+    def update(self, block: np.ndarray) -> None:
+        """Add a (rows x columns) float64 block"""
+        finite = np.isfinite(block)
+        mask = finite.astype(np.float64)
+        values = np.where(finite, block - self.shift, 0.0)
+        self.count += mask.T @ mask
+        self.sums += values.T @ mask
+        self.squares += (values * values).T @ mask
+        self.products += values.T @ values
+
+    def merge(self, other: "CorrelationSums") -> None:
+        self.count += other.count
+        self.sums += other.sums
+        self.squares += other.squares
+        self.products += other.products
+
+    def correlations(self) -> np.ndarray:
+        """(columns x columns) correlations, NaN for pairs of constant or too few rows"""
+        n = self.count
+        covariance = n * self.products - self.sums * self.sums.T
+        variance = n * self.squares - self.sums ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = covariance / np.sqrt(variance * variance.T)
+        result[(n < 2) | ~(variance > 0) | ~(variance.T > 0)] = np.nan
+        return np.clip(result, -1.0, 1.0)
+
+
+def _numeric_columns(matrix: np.ndarray) -> Optional[np.ndarray]:
+    """Columns of an object matrix that hold numbers only, None if the matrix is numeric"""
+    if matrix.dtype != object:
+        return None
+    dtypes = [_as_numeric(matrix[:, j]).dtype for j in range(matrix.shape[1])]
+    return np.array([np.issubdtype(dtype, np.number) or dtype == np.bool_ for dtype in dtypes], dtype=bool)
+
+
+def _float_block(matrix: np.ndarray, start: int, stop: int, numeric: Optional[np.ndarray]) -> np.ndarray:
+    """Rows start:stop as (rows x columns) float64, non-numeric columns NaN"""
+    block = np.asarray(matrix[start:stop])
+    if numeric is None:
+        return block.astype(np.float64).reshape(len(block), -1)
+    result = np.full(block.shape, np.nan)
+    for j in np.flatnonzero(numeric):
+        result[:, j] = _as_numeric(block[:, j]).astype(np.float64)
+    return result
+
+
+def correlation_matrix(
+    matrix: np.ndarray,
+    max_bytes: int = DEFAULT_CORRELATION_BYTES,
+    max_workers: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Pearson correlation of every pair of columns, without a full size copy of the matrix
+
+    Args:
+        matrix: (samples x columns) numeric matrix, or an object matrix whose non-numeric
+            columns get NaN correlations. Trailing axes are flattened in C order, see
+            encoding.iter_columns. Memory-mapped matrices are read block by block
+        max_bytes: Upper bound for the float64 copies of the row blocks in flight
+        max_workers: Number of threads, defaults to os.cpu_count()
+
+    Returns:
+        np.ndarray: (columns x columns) correlations, NaN where undefined
+    """
+    n_rows = matrix.shape[0]
+    n_columns = int(np.prod(matrix.shape[1:], dtype=np.int64))
+    max_workers = max(1, max_workers or os.cpu_count() or 1)
+    numeric = _numeric_columns(matrix) if matrix.ndim == 2 else None
+    block_rows = max(1, max_bytes // (max_workers * _BLOCK_COPIES * 8 * max(n_columns, 1)))
+    starts = list(range(0, n_rows, block_rows))
+
+    # the first finite value of every column (NaN shifts become 0)
+    shift = np.full(n_columns, np.nan)
+    for start in starts:
+        missing = np.isnan(shift)
+        if not missing.any():
+            break
+        block = _float_block(matrix, start, start + block_rows, numeric)
+        finite = np.isfinite(block[:, missing])
+        found = finite.any(axis=0)
+        columns = np.flatnonzero(missing)[found]
+        shift[columns] = block[finite[:, found].argmax(axis=0), columns]
+    shift = np.nan_to_num(shift)
+
+    def accumulate(worker: int) -> CorrelationSums:
+        sums = CorrelationSums(shift)
+        for start in starts[worker::max_workers]:
+            sums.update(_float_block(matrix, start, start + block_rows, numeric))
+        return sums
+
+    total = CorrelationSums(shift)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="xaiflow-correlation") as executor:
+        for sums in executor.map(accumulate, range(min(max_workers, len(starts)))):
+            total.merge(sums)
+    return total.correlations()
+
+
+def strongest_partners(correlations: np.ndarray, top: int) -> Dict[str, List[List[Any]]]:
+    """
+    The top partners of every column by absolute correlation (strongest first), leaving out
+    the column itself and undefined correlations
+
+    Returns:
+        Dict[str, List[List[Any]]]: {"partners": column indices, "values": correlations}, one
+            list per column
+    """
+    strength = np.abs(correlations)
+    np.fill_diagonal(strength, np.nan)
+    partners, values = [], []
+    for i in range(len(strength)):
+        candidates = np.flatnonzero(~np.isnan(strength[i]))
+        order = candidates[np.argsort(-strength[i, candidates], kind="stable")][:top]
+        partners.append(order.tolist())
+        values.append(correlations[i, order].tolist())
+    return {"partners": partners, "values": values}
+
+
+def correlation_payload(
+    shap_values: np.ndarray,
+    feature_values: Optional[np.ndarray],
+    top: int = DEFAULT_CORRELATION_TOP,
+    max_bytes: int = DEFAULT_CORRELATION_BYTES,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    The "correlations" entry of the report payload
+
+    SHAP columns are correlated with the SHAP columns of the other features for the same
+    output (one pass over the rows per output), so the partners of a multi-output
+    explanation are feature indices per output.
+
+    Args:
+        shap_values: SHAP values matrix (samples x features), or (samples x features x outputs)
+        feature_values: Optional feature values matrix (samples x features)
+        top: Partners kept per feature
+        max_bytes: See correlation_matrix
+        max_workers: See correlation_matrix
+
+    Returns:
+        Dict[str, Any]: {"top", "shap", "features"}, "shap" with one entry per SHAP column
+            (in the column order of encoding.iter_columns) and "features" one per feature or
+            None without feature values, see strongest_partners
+    """
+    if top < 1:
+        raise ValueError("correlation_top must be a positive integer.")
+    n_features = shap_values.shape[1]
+    output_shape = shap_values.shape[2:]
+    n_outputs = int(np.prod(output_shape, dtype=np.int64))
+    shap = {"partners": [None] * (n_features * n_outputs), "values": [None] * (n_features * n_outputs)}
+    for o in range(n_outputs):
+        # one (features x features) matrix per output rather than all pairs of SHAP columns,
+        # read from a view of the output (reshaping a non-contiguous tensor would copy it)
+        per_output = shap_values[(slice(None), slice(None)) + np.unravel_index(o, output_shape)]
+        partners = strongest_partners(correlation_matrix(per_output, max_bytes, max_workers), top)
+        for j in range(n_features):
+            shap["partners"][j * n_outputs + o] = partners["partners"][j]
+            shap["values"][j * n_outputs + o] = partners["values"][j]
+    features = None
+    if feature_values is not None:
+        features = strongest_partners(correlation_matrix(feature_values, max_bytes, max_workers), top)
+    return {"top": top, "shap": shap, "features": features}
@@ -0,0 +1,141 @@
+"""
+Density mode of the SHAP dependence scatter
+2D histograms of (feature value, SHAP value) per column, computed at report build time so
+the report draws a heatmap whose cost depends on the number of bins instead of the rows
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .encoding import encode_column, prepare_column
+from .groups import GroupIndex
+
+
+# Bins per axis of every histogram
+DEFAULT_DENSITY_BINS = 64
+# The report draws individual points while at most this many rows are in view
+DEFAULT_DENSITY_THRESHOLD = 5000
+
+
+def _bin_range(values: np.ndarray) -> List[float]:
+    """[low, high] of the finite values, widened around a single value so every bin has a width"""
+    low, high = float(values.min()), float(values.max())
+    if high <= low:
+        return [low - 0.5, high + 0.5]
+    return [low, high]
+
+
+def _bin_index(values: np.ndarray, bin_range: List[float], n_bins: int) -> np.ndarray:
+    """Uniform bin of every value, the upper edge belongs to the last bin"""
+    low, high = bin_range
+    index = ((values - low) * (n_bins / (high - low))).astype(np.int64)
+    return np.clip(index, 0, n_bins - 1)
+
+
+def density_column(
+    feature_column: np.ndarray,
+    shap_column: np.ndarray,
+    n_bins: int = DEFAULT_DENSITY_BINS,
+    group_codes: Optional[np.ndarray] = None,
+    n_groups: int = 1,
+) -> Optional[Dict[str, Any]]:
+    """
+    2D histogram of one SHAP column against its (numeric or dictionary-encoded) feature values
+
+    Rows with a NaN or infinite value on either axis are not counted.
+
+    Args:
+        feature_column: Numeric feature values or dictionary codes as stored in the report
+        shap_column: SHAP values of the same rows
+        n_bins: Bins per axis
+        group_codes: Optional group code per row, counts are kept per group then
+        n_groups: Number of groups, the length of the GroupIndex the codes come from
+
+    Returns:
+        Optional[Dict[str, Any]]: {"x": [low, high], "y": [low, high], "counts": ...} with
+            counts of shape (n_groups x n_bins x n_bins), SHAP bins (y) before feature bins
+            (x), or None if no row is finite
+    """
+    x = np.asarray(feature_column, dtype=np.float64)
+    y = np.asarray(shap_column, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return None
+    x, y = x[finite], y[finite]
+    x_range, y_range = _bin_range(x), _bin_range(y)
+    cells = _bin_index(y, y_range, n_bins) * n_bins + _bin_index(x, x_range, n_bins)
+    if group_codes is not None:
+        cells += np.asarray(group_codes)[finite] * (n_bins * n_bins)
+    counts = np.bincount(cells, minlength=n_groups * n_bins * n_bins)
+    return {"x": x_range, "y": y_range, "counts": counts.reshape(n_groups, n_bins, n_bins)}
+
+
+def density_histograms(
+    shap_values: np.ndarray,
+    feature_values: np.ndarray,
+    n_bins: int = DEFAULT_DENSITY_BINS,
+    group_index: Optional[GroupIndex] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    density_column of every SHAP column, one feature column in memory at a time
+
+    Feature columns that are neither numeric nor dictionary-encodable get None (the report
+    plots their points).
+
+    Args:
+        shap_values: SHAP values matrix (samples x features), or (samples x features x outputs)
+        feature_values: Feature values matrix (samples x features)
+        n_bins: Bins per axis
+        group_index: Optional group index, the counts are kept per group
+
+    Returns:
+        List[Optional[Dict[str, Any]]]: One histogram per SHAP column in the column order of
+            encoding.iter_columns
+    """
+    if n_bins < 1:
+        raise ValueError("density_bins must be a positive integer.")
+    group_codes = group_index.codes if group_index is not None else None
+    n_groups = len(group_index) if group_index is not None else 1
+    columns_per_feature = int(np.prod(shap_values.shape[2:], dtype=np.int64))
+    histograms = []
+    for j in range(shap_values.shape[1]):
+        # the same codes as the feature column embedded in the report
+        _, feature_column = prepare_column(feature_values[:, j])
+        numeric = np.issubdtype(feature_column.dtype, np.number) or feature_column.dtype == np.bool_
+        shap_columns = np.asarray(shap_values[:, j]).reshape(len(shap_values), columns_per_feature)
+        for o in range(columns_per_feature):
+            histograms.append(
+                density_column(feature_column, shap_columns[:, o], n_bins, group_codes, n_groups) if numeric else None
+            )
+    return histograms
+
+
+def density_payload(
+    histograms: List[Optional[Dict[str, Any]]],
+    n_bins: int,
+    threshold: int,
+    payload_encoding: str = "binary",
+) -> Dict[str, Any]:
+    """
+    The "density" entry of the report payload, decoded by decodeDensity in payload.ts
+
+    Args:
+        histograms: See density_histograms
+        n_bins: Bins per axis the histograms were computed with
+        threshold: The report shows points while at most this many rows are in view
+        payload_encoding: "binary" or "json", see encoding.encode_column
+
+    Returns:
+        Dict[str, Any]: {"bins", "threshold", "columns"}, the counts of every column
+            flattened and encoded like a payload column
+    """
+    return {
+        "bins": n_bins,
+        "threshold": threshold,
+        "columns": [
+            {**histogram, "counts": encode_column(histogram["counts"].ravel(), payload_encoding)}
+            if histogram is not None else None
+            for histogram in histograms
+        ],
+    }
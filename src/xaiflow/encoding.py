@@ -0,0 +1,438 @@
+"""
+Payload encodings for the data embedded in the HTML report
+Matrices are stored column by column so the frontend can read a single feature without touching the rest
+"""
+
+import base64
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .compression import DEFAULT_COMPRESSION_LEVEL, inflate, iter_compressed_buffers
+
+
+PAYLOAD_ENCODINGS = ("binary", "json")
+
+# dtype name in the payload -> numpy dtype of the little-endian buffer
+BINARY_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float64": np.dtype("<f8"),
+    "int32": np.dtype("<i4"),
+    "uint8": np.dtype("u1"),
+}
+
+# Booleans are bit-packed (8 rows per byte, little bit order) and decoded to 0/1 codes
+BIT_PACKED_DTYPE = "bits"
+BOOL_CATEGORIES = ["False", "True"]
+
+# Rows encoded per piece when streaming, a multiple of 3 keeps base64 pieces free of padding
+# (and a multiple of 24 keeps bit-packed pieces byte aligned as well)
+DEFAULT_BLOCK_ROWS = 65536 * 3
+
+_INT32_MIN, _INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+# Element types of object columns that are numbers (None is a missing number)
+_NUMBER_TYPES = (int, float, np.number, np.bool_, type(None))
+
+
+def _binary_dtype_name(values: np.ndarray) -> Optional[str]:
+    """
+    Pick the smallest typed array the frontend can decode without losing information
+
+    Args:
+        values: 1D numpy array
+
+    Returns:
+        Optional[str]: Key of BINARY_DTYPES, "bits" or None if the column has to stay JSON
+    """
+    if values.dtype == np.bool_:
+        return BIT_PACKED_DTYPE
+    if np.issubdtype(values.dtype, np.integer):
+        if values.size == 0:
+            return "uint8"
+        low, high = values.min(), values.max()
+        if low >= 0 and high <= 255:
+            return "uint8"
+        if low >= _INT32_MIN and high <= _INT32_MAX:
+            return "int32"
+        return "float64"
+    if np.issubdtype(values.dtype, np.floating):
+        return "float32"
+    return None
+
+
+def _as_numeric(values: np.ndarray) -> np.ndarray:
+    """
+    Convert object columns holding only numbers to bool, int64 or float64 (None becomes NaN),
+    leave anything else untouched
+
+    Strings are never parsed: a column of codes like "001" stays a string column.
+    """
+    if values.dtype != object:
+        return values
+    types = set(map(type, values))
+    if not all(issubclass(t, _NUMBER_TYPES) for t in types):
+        return values
+    if types and all(issubclass(t, (bool, np.bool_)) for t in types):
+        return values.astype(bool)
+    if types and all(issubclass(t, (int, np.integer)) for t in types):
+        try:
+            return values.astype(np.int64)
+        except OverflowError:
+            pass
+    return values.astype(np.float64)
+
+
+def _json_safe(values: np.ndarray) -> List[Any]:
+    """Convert a column to a JSON compatible list, NaN and inf become null"""
+    if np.issubdtype(values.dtype, np.floating):
+        finite = np.isfinite(values)
+        if finite.all():
+            return values.tolist()
+        values = values.astype(object)
+        values[~finite] = None
+        return values.tolist()
+    return [
+        None if isinstance(item, float) and not np.isfinite(item) else item
+        for item in values.tolist()
+    ]
+
+
+def dictionary_encode(values: np.ndarray) -> Tuple[Optional[List[str]], np.ndarray]:
+    """
+    Replace categorical values by small integer codes into a dictionary of labels
+
+    Booleans keep their values (encoded as 0/1 codes) with the categories "False"/"True".
+    Non-numeric object and string columns are coded against their sorted unique values
+    as strings, so None and NaN become the categories "None" and "nan".
+
+    Args:
+        values: 1D numpy array, see _as_numeric for object columns
+
+    Returns:
+        Tuple[Optional[List[str]], np.ndarray]: (categories, codes), categories is None
+        and values are returned unchanged for numeric columns
+    """
+    if values.dtype == np.bool_:
+        return list(BOOL_CATEGORIES), values
+    if values.dtype == object or values.dtype.kind in "US":
+        categories, codes = np.unique(values.astype(str), return_inverse=True)
+        return categories.tolist(), codes.ravel()
+    return None, values
+
+
+def column_dtype(values: np.ndarray, payload_encoding: str = "binary") -> str:
+    """
+    Payload dtype of a column, "json" if it cannot be stored as a typed array
+
+    Args:
+        values: 1D numpy array, see _as_numeric for object columns
+        payload_encoding: "binary" for base64 typed arrays, "json" for plain lists
+
+    Returns:
+        str: Key of BINARY_DTYPES, "bits" or "json"
+    """
+    if payload_encoding != "binary":
+        return "json"
+    return _binary_dtype_name(values) or "json"
+
+
+def iter_column_buffers(
+    values: np.ndarray,
+    dtype_name: str,
+    round_decimals: Optional[int] = None,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+) -> Iterator[memoryview]:
+    """
+    Raw little-endian bytes of a column with a binary dtype, block by block
+
+    Bit-packed blocks are 24 rows aligned, so the concatenated bytes are the packing of
+    the whole column and every piece is also a multiple of 3 bytes long.
+
+    Args:
+        values: 1D numpy array
+        dtype_name: Key of BINARY_DTYPES or "bits", see column_dtype
+        round_decimals: Optional number of decimals to round floating point columns to
+        block_rows: Number of rows encoded per piece
+
+    Yields:
+        memoryview: Bytes of consecutive blocks of the column
+    """
+    alignment = 24 if dtype_name == BIT_PACKED_DTYPE else 3
+    block_rows = max(alignment, block_rows - block_rows % alignment)
+    for start in range(0, len(values), block_rows):
+        block = values[start:start + block_rows]
+        if round_decimals is not None and np.issubdtype(block.dtype, np.floating):
+            block = np.round(block, round_decimals)
+        if dtype_name == BIT_PACKED_DTYPE:
+            yield np.packbits(block, bitorder="little").data
+        else:
+            yield np.ascontiguousarray(block, dtype=BINARY_DTYPES[dtype_name]).data
+
+
+def iter_column_data(
+    values: np.ndarray,
+    dtype_name: str,
+    round_decimals: Optional[int] = None,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+    compression: Optional[str] = None,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Iterator[str]:
+    """
+    Encode a column block by block, so that only block_rows values are copied at a time
+
+    For binary dtypes the pieces concatenate to one base64 string (block_rows is
+    rounded to a multiple of 3 so that no padding ends up in the middle). For
+    "json" the pieces concatenate to the comma separated items of a JSON list.
+
+    Args:
+        values: 1D numpy array
+        dtype_name: Result of column_dtype
+        round_decimals: Optional number of decimals to round floating point columns to
+        block_rows: Number of rows encoded per piece
+        compression: Optional codec (see compression.COMPRESSION_CODECS) the bytes of
+            binary dtypes are compressed with before base64 encoding
+        compression_level: zlib compression level
+
+    Yields:
+        str: Encoded pieces of the column
+    """
+    if dtype_name != "json":
+        buffers = iter_column_buffers(values, dtype_name, round_decimals, block_rows)
+        if compression is not None:
+            yield from iter_compressed_buffers(buffers, compression, compression_level)
+            return
+        for buffer in buffers:
+            yield base64.b64encode(buffer).decode("ascii")
+        return
+    block_rows = max(3, block_rows - block_rows % 3)
+    first = True
+    for start in range(0, len(values), block_rows):
+        block = values[start:start + block_rows]
+        if round_decimals is not None and np.issubdtype(block.dtype, np.floating):
+            block = np.round(block, round_decimals)
+        if block.dtype == np.bool_:
+            block = block.view(np.uint8)
+        piece = dumps_for_script(_json_safe(block))[1:-1]
+        if not piece:
+            continue
+        yield piece if first else "," + piece
+        first = False
+
+
+def prepare_column(values: Any, payload_encoding: str = "binary") -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    Header and values to store of a column (numeric conversion and dictionary encoding)
+
+    Args:
+        values: 1D array-like with one entry per observation
+        payload_encoding: "binary" or "json"
+
+    Returns:
+        Tuple[Dict[str, Any], np.ndarray]: ({"dtype", ["length"], ["categories"]}, values
+            or dictionary codes to encode with iter_column_data)
+    """
+    values = _as_numeric(np.asarray(values).ravel())
+    categories, values = dictionary_encode(values)
+    dtype_name = column_dtype(values, payload_encoding)
+    header = {"dtype": dtype_name}
+    if dtype_name == BIT_PACKED_DTYPE:
+        header["length"] = len(values)
+    if categories is not None:
+        header["categories"] = categories
+    return header, values
+
+
+def iter_encoded_column(
+    values: Any,
+    payload_encoding: str = "binary",
+    round_decimals: Optional[int] = None,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+    compression: Optional[str] = None,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Iterator[str]:
+    """
+    Stream the JSON text of encode_column(values) in pieces
+
+    Args:
+        values: 1D array-like with one entry per observation
+        payload_encoding: "binary" or "json"
+        round_decimals: Optional number of decimals to round floating point columns to
+        block_rows: Number of rows encoded per piece
+        compression: Optional codec of the column bytes, ignored for "json" columns
+        compression_level: zlib compression level
+
+    Yields:
+        str: Pieces of '{"dtype":...,["length":...,]["categories":[...],]["compression":...,]"data":...}'
+    """
+    header, values = prepare_column(values, payload_encoding)
+    if header["dtype"] == "json":
+        compression = None
+    elif compression is not None:
+        header["compression"] = compression
+    opening, closing = ("[", "]") if header["dtype"] == "json" else ('"', '"')
+    yield f'{dumps_for_script(header)[:-1]},"data":{opening}'
+    yield from iter_column_data(
+        values, header["dtype"], round_decimals, block_rows, compression, compression_level
+    )
+    yield closing + "}"
+
+
+def encode_column(
+    values: Any,
+    payload_encoding: str = "binary",
+    round_decimals: Optional[int] = None,
+    compression: Optional[str] = None,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Dict[str, Any]:
+    """
+    Encode a single column for the report payload
+
+    Numeric columns stay numeric. Boolean, string and other non-numeric columns are
+    dictionary-encoded (see dictionary_encode): the codes are stored like a numeric
+    column and the labels in "categories", booleans are bit-packed in binary mode.
+
+    Args:
+        values: 1D array-like with one entry per observation
+        payload_encoding: "binary" for base64 typed arrays, "json" for plain lists
+        round_decimals: Optional number of decimals to round floating point columns to
+        compression: Optional codec the bytes of binary columns are compressed with
+        compression_level: zlib compression level
+
+    Returns:
+        Dict[str, Any]: {"dtype": ..., "data": ...} where data is a base64 string for
+        binary dtypes and a list for "json", plus "categories" for dictionary-encoded
+        columns, "length" for bit-packed ones and "compression" for compressed ones
+    """
+    return json.loads("".join(iter_encoded_column(
+        values, payload_encoding, round_decimals, compression=compression, compression_level=compression_level
+    )))
+
+
+def decode_column(column: Dict[str, Any]) -> np.ndarray:
+    """
+    Inverse of encode_column, mirrors decodeColumn in templates/utils/payload.ts
+
+    Args:
+        column: Encoded column as produced by encode_column
+
+    Returns:
+        np.ndarray: Decoded values, the codes for dictionary-encoded columns
+            (index into column["categories"]), booleans for bit-packed columns
+    """
+    dtype_name = column["dtype"]
+    if dtype_name == "json":
+        return np.asarray(column["data"])
+    if "compression" in column:
+        data = inflate(column["data"], column["compression"])
+    else:
+        data = base64.b64decode(column["data"])
+    if dtype_name == BIT_PACKED_DTYPE:
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=column["length"], bitorder="little")
+        return bits.astype(bool)
+    return np.frombuffer(data, dtype=BINARY_DTYPES[dtype_name])
+
+
+def as_2d(matrix: Any) -> np.ndarray:
+    """View matrix as a 2D array, a 1D input is treated as a single observation"""
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def iter_columns(matrix: np.ndarray) -> Iterator[np.ndarray]:
+    """
+    Views of the columns of a matrix, for more than 2 dimensions in C order of the trailing axes
+
+    A (samples x features x outputs) tensor gives column j * n_outputs + o for feature j
+    and output o, without copying a non-contiguous tensor the way reshape would.
+    """
+    for index in np.ndindex(*matrix.shape[1:]):
+        yield matrix[(slice(None),) + index]
+
+
+def encode_matrix(
+    matrix: Any,
+    payload_encoding: str = "binary",
+    round_decimals: Optional[int] = None,
+    compression: Optional[str] = None,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Dict[str, Any]:
+    """
+    Encode a (samples x features) matrix column-major, one encoded column per feature
+
+    Args:
+        matrix: 2D array-like, a 1D input is treated as a single observation. Higher
+            dimensional arrays are encoded as the columns of iter_columns
+        payload_encoding: "binary" or "json", see encode_column
+        round_decimals: Optional number of decimals to round floating point columns to
+        compression: Optional codec of the column bytes, see encode_column
+        compression_level: zlib compression level
+
+    Returns:
+        Dict[str, Any]: {"shape": [n_rows, n_columns], "columns": [...]}
+    """
+    matrix = as_2d(matrix)
+    return {
+        "shape": list(matrix.shape),
+        "columns": [
+            encode_column(column, payload_encoding, round_decimals, compression, compression_level)
+            for column in iter_columns(matrix)
+        ],
+    }
+
+
+def iter_encoded_matrix(
+    matrix: Any,
+    payload_encoding: str = "binary",
+    round_decimals: Optional[int] = None,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+    compression: Optional[str] = None,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> Iterator[str]:
+    """
+    Stream the JSON text of encode_matrix(matrix) column by column and block by block
+
+    Args:
+        matrix: Array-like, see encode_matrix
+        payload_encoding: "binary" or "json"
+        round_decimals: Optional number of decimals to round floating point columns to
+        block_rows: Number of rows encoded per piece
+        compression: Optional codec of the column bytes, see encode_column
+        compression_level: zlib compression level
+
+    Yields:
+        str: Pieces of '{"shape":[...],"columns":[...]}'
+    """
+    matrix = as_2d(matrix)
+    yield f'{{"shape":{json.dumps(list(matrix.shape))},"columns":['
+    for j, column in enumerate(iter_columns(matrix)):
+        if j > 0:
+            yield ","
+        yield from iter_encoded_column(
+            column, payload_encoding, round_decimals, block_rows, compression, compression_level
+        )
+    yield "]}"
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_for_script(obj: Any) -> str:
+    """
+    Serialize obj to JSON that can be placed inside a <script type="application/json"> tag
+
+    Args:
+        obj: JSON serializable object, numpy scalars and arrays are converted
+
+    Returns:
+        str: JSON string with "</" escaped so the payload cannot close the script tag
+    """
+    return json.dumps(obj, default=_json_default, separators=(",", ":")).replace("</", "<\\/")
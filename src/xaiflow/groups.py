@@ -0,0 +1,112 @@
+"""
+Group index for group_labels
+Dictionary-encodes the labels and precomputes the rows of every group, so the report
+can switch groups with an index lookup instead of scanning all rows
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .compression import DEFAULT_COMPRESSION_LEVEL
+from .encoding import DEFAULT_BLOCK_ROWS, dumps_for_script, iter_encoded_column
+from .tables import label_codes
+
+
+class GroupIndex:
+    """
+    Dictionary encoding of group labels with the row indices of every group
+
+    Attributes:
+        labels: Sorted unique labels (as strings), the dictionary of the codes
+        codes: Group code per row, index into labels
+        order: Row indices sorted by group code, rows of group g are
+            order[offsets[g]:offsets[g + 1]] in ascending row order
+        offsets: Start of every group in order, plus the total number of rows
+    """
+
+    def __init__(self, group_labels: Sequence[Any]):
+        # categorical pandas and Arrow labels come with their dictionary, see tables.label_codes
+        coded = label_codes(group_labels)
+        if coded is None:
+            labels, codes = np.unique(np.asarray(group_labels), return_inverse=True)
+            coded = [str(label) for label in labels], codes
+        self.labels: List[str] = coded[0]
+        self.codes: np.ndarray = coded[1].ravel()
+        self.order: np.ndarray = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes, minlength=len(self.labels))
+        self.offsets: np.ndarray = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def counts(self) -> List[int]:
+        return np.diff(self.offsets).tolist()
+
+    def rows(self, group: int) -> np.ndarray:
+        """Row indices of group number group (a view, no copy)"""
+        return self.order[self.offsets[group]:self.offsets[group + 1]]
+
+    def mean_abs(self, matrix: np.ndarray, block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+        """
+        Per-group column-wise mean of |matrix|, i.e. the mean |SHAP| importance of every group
+
+        Args:
+            matrix: 2D array (samples x features) or (samples x features x outputs)
+            block_rows: Number of rows gathered at a time
+
+        Returns:
+            np.ndarray: (groups x features), or (groups x features x outputs)
+        """
+        totals = np.zeros((len(self),) + matrix.shape[1:], dtype=np.float64)
+        # Consecutive row blocks (sequential reads, also for memory-mapped matrices),
+        # summed per group after sorting the block by group code
+        for start in range(0, matrix.shape[0], block_rows):
+            codes = self.codes[start:start + block_rows]
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            firsts = np.flatnonzero(np.concatenate([[True], sorted_codes[1:] != sorted_codes[:-1]]))
+            block = np.abs(np.asarray(matrix[start:start + block_rows], dtype=np.float64))
+            totals[sorted_codes[firsts]] += np.add.reduceat(block[order], firsts, axis=0)
+        counts = np.maximum(np.diff(self.offsets), 1).reshape((-1,) + (1,) * (matrix.ndim - 1))
+        return totals / counts
+
+    def metadata(self, shap_values: np.ndarray, block_rows: int = DEFAULT_BLOCK_ROWS, decimals: int = 6) -> Dict[str, Any]:
+        """Labels, offsets and per-group importance, the group index without the per-row columns"""
+        return {
+            "labels": self.labels,
+            "offsets": self.offsets.tolist(),
+            "importance": np.round(self.mean_abs(shap_values, block_rows), decimals).reshape(len(self), -1).tolist(),
+        }
+
+    def iter_json(
+        self,
+        shap_values: np.ndarray,
+        payload_encoding: str = "binary",
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        decimals: int = 6,
+    ) -> Iterator[str]:
+        """
+        Stream the group index as JSON for the report payload
+
+        Args:
+            shap_values: SHAP values matrix, used for the per-group importance. For a
+                multi-output tensor the importance has one column per feature and output
+            payload_encoding: "binary" or "json", see encoding.encode_column
+            block_rows: Number of rows encoded per piece
+            compression: Optional codec of the column bytes, see encoding.encode_column
+            compression_level: zlib compression level
+            decimals: Number of decimals kept for the importances
+
+        Yields:
+            str: Pieces of '{"labels":...,"offsets":...,"importance":...,"codes":...,"order":...}'
+        """
+        yield dumps_for_script(self.metadata(shap_values, block_rows, decimals))[:-1]
+        yield ',"codes":'
+        yield from iter_encoded_column(self.codes, payload_encoding, None, block_rows, compression, compression_level)
+        yield ',"order":'
+        yield from iter_encoded_column(self.order, payload_encoding, None, block_rows, compression, compression_level)
+        yield "}"
@@ -0,0 +1,467 @@
+"""
+Incremental reports for monitoring: batches of rows are appended to a report store
+Every batch is written to its own shards (see shards.py) and importance, summaries and
+scatter sample are kept as mergeable running aggregates, so an append writes the batch,
+the aggregates and the small HTML shell, independent of the rows appended before
+"""
+
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .encoding import DEFAULT_BLOCK_ROWS, encode_column
+from .sampling import StreamingScatterSample, hash_uniform
+from .shards import DEFAULT_SHARD_ROWS, SplitPayload, _write_column, write_shards
+from .streaming import _CategoryCodes, encode_feature_block, feature_codes
+from .summaries import DEFAULT_QUANTILE_SAMPLE, RunningSummary, summarize_stream
+
+STATE_FILE = "state.json"
+AGGREGATES_FILE = "aggregates.npz"
+STORE_VERSION = 1
+
+# Every column of an appended batch is stored as float32 (feature values dictionary-encoded
+# against the categories of the store), so one header per column holds for all batches
+_COLUMN_DTYPE = "float32"
+_CODES_DTYPE = "int32"
+
+
+class RunningAggregates:
+    """
+    Mergeable aggregates of appended rows
+
+    Sum of |SHAP| overall and per group, and optionally the running summaries (overall and
+    per group) and the scatter sample. Rows are identified by their position in the store,
+    which is never reused after eviction, so the hash-keyed samples do not depend on how
+    the rows were batched.
+    """
+
+    def __init__(
+        self,
+        n_columns: int,
+        compute_summaries: bool = True,
+        max_points_per_feature: Optional[int] = None,
+        seed: int = 0,
+        sample_size: int = DEFAULT_QUANTILE_SAMPLE,
+    ):
+        self.n_columns = n_columns
+        self.compute_summaries = compute_summaries
+        self.max_points_per_feature = max_points_per_feature
+        self.seed = seed
+        self.sample_size = sample_size
+        self.n_rows = 0
+        self.sum_abs = np.zeros(n_columns)
+        self.group_counts = np.zeros(0, dtype=np.int64)
+        self.group_sum_abs = np.zeros((0, n_columns))
+        self.overall = RunningSummary(n_columns, sample_size) if compute_summaries else None
+        self.groups: List[RunningSummary] = []
+        self.scatter = None
+        if max_points_per_feature is not None:
+            self.scatter = StreamingScatterSample(n_columns, max_points_per_feature, seed)
+
+    def _grow(self, n_groups: int):
+        """Make room for groups that appeared in a later batch"""
+        missing = n_groups - len(self.group_counts)
+        if missing <= 0:
+            return
+        self.group_counts = np.concatenate([self.group_counts, np.zeros(missing, dtype=np.int64)])
+        self.group_sum_abs = np.concatenate([self.group_sum_abs, np.zeros((missing, self.n_columns))])
+        if self.compute_summaries:
+            self.groups.extend(RunningSummary(self.n_columns, self.sample_size) for _ in range(missing))
+
+    def update(self, block: np.ndarray, rows: np.ndarray, codes: Optional[np.ndarray] = None):
+        """
+        Add rows
+
+        Args:
+            block: (rows x columns) SHAP values
+            rows: Positions of the rows in the store
+            codes: Optional group code per row
+        """
+        block = np.asarray(block, dtype=np.float64)
+        abs_block = np.abs(block)
+        self.sum_abs += abs_block.sum(axis=0)
+        keys = hash_uniform(rows, self.n_columns, self.seed) if self.compute_summaries else None
+        if self.overall is not None:
+            self.overall.update(block, keys)
+        if codes is not None and len(codes) > 0:
+            self._grow(int(codes.max()) + 1)
+            for group in np.unique(codes):
+                in_group = codes == group
+                self.group_counts[group] += int(in_group.sum())
+                self.group_sum_abs[group] += abs_block[in_group].sum(axis=0)
+                if self.compute_summaries:
+                    self.groups[group].update(block[in_group], keys[in_group])
+        if self.scatter is not None:
+            self.scatter.update(block, rows)
+        self.n_rows += len(block)
+
+    def merge(self, other: "RunningAggregates"):
+        """Add the rows aggregated by other (created with the same arguments)"""
+        self.n_rows += other.n_rows
+        self.sum_abs += other.sum_abs
+        self._grow(len(other.group_counts))
+        n_groups = len(other.group_counts)
+        self.group_counts[:n_groups] += other.group_counts
+        self.group_sum_abs[:n_groups] += other.group_sum_abs
+        if self.compute_summaries:
+            self.overall.merge(other.overall)
+            for summary, other_summary in zip(self.groups, other.groups):
+                summary.merge(other_summary)
+        if self.scatter is not None:
+            self.scatter.merge(other.scatter)
+
+    def save(self, path: str):
+        """Write the aggregates to an .npz file"""
+        arrays = {
+            "n_rows": np.asarray(self.n_rows),
+            "sum_abs": self.sum_abs,
+            "group_counts": self.group_counts,
+            "group_sum_abs": self.group_sum_abs,
+        }
+        if self.compute_summaries:
+            arrays.update({f"overall.{name}": value for name, value in self.overall.state().items()})
+            for group, summary in enumerate(self.groups):
+                arrays.update({f"group_{group}.{name}": value for name, value in summary.state().items()})
+        if self.scatter is not None:
+            arrays.update({f"scatter.{name}": value for name, value in self.scatter.state().items()})
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        compute_summaries: bool = True,
+        max_points_per_feature: Optional[int] = None,
+        seed: int = 0,
+        sample_size: int = DEFAULT_QUANTILE_SAMPLE,
+    ) -> "RunningAggregates":
+        """Aggregates written by save, the arguments have to be those they were created with"""
+        with np.load(path) as stored:
+            arrays = dict(stored)
+
+        def state(prefix: str) -> Dict[str, np.ndarray]:
+            return {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)}
+
+        aggregates = cls(len(arrays["sum_abs"]), compute_summaries, max_points_per_feature, seed, sample_size)
+        aggregates.n_rows = int(arrays["n_rows"])
+        aggregates.sum_abs = arrays["sum_abs"]
+        aggregates.group_counts = arrays["group_counts"]
+        aggregates.group_sum_abs = arrays["group_sum_abs"]
+        if compute_summaries:
+            aggregates.overall = RunningSummary.from_state(state("overall."), sample_size)
+            aggregates.groups = [
+                RunningSummary.from_state(state(f"group_{group}."), sample_size)
+                for group in range(len(aggregates.group_counts))
+            ]
+        if max_points_per_feature is not None:
+            aggregates.scatter = StreamingScatterSample.from_state(state("scatter."), max_points_per_feature, seed)
+        return aggregates
+
+
+class ReportStore:
+    """
+    Directory of a report that batches of rows are appended to
+
+    Holds state.json (options, categories, group labels and the shard files of every batch
+    in the window), aggregates.npz (running aggregates of the window) and a batch_<id>/
+    directory per batch with its shards and its own aggregates.npz. The directory may be
+    a partial local copy of the store, e.g. of MLflow artifacts: appending reads
+    state.json and aggregates.npz only, and when batches are evicted from the window the
+    aggregates of the remaining batches, which are requested from fetch if missing.
+    """
+
+    def __init__(self, directory: str, fetch: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            directory: Local directory of the store, created if needed
+            fetch: Optional callable copying a file of the store (path relative to the
+                store) into directory
+        """
+        self.directory = directory
+        self.fetch = fetch
+        os.makedirs(directory, exist_ok=True)
+        self.state: Optional[Dict[str, Any]] = None
+        if os.path.exists(self._path(STATE_FILE)):
+            with open(self._path(STATE_FILE), encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def _path(self, relative_path: str) -> str:
+        return os.path.join(self.directory, relative_path)
+
+    def _aggregates(self, relative_path: str) -> RunningAggregates:
+        """Aggregates file of the store, fetched first if it is not in the local copy"""
+        if not os.path.exists(self._path(relative_path)) and self.fetch is not None:
+            self.fetch(relative_path)
+        state = self.state
+        return RunningAggregates.load(
+            self._path(relative_path),
+            state["compute_summaries"],
+            state["max_points_per_feature"],
+            state["sample_seed"],
+            state["sample_size"],
+        )
+
+    def create(
+        self,
+        feature_names: Sequence[str],
+        column_shape: Sequence[int],
+        output_names: Optional[Sequence[str]] = None,
+        round_decimals: Optional[int] = 4,
+        max_points_per_feature: Optional[int] = None,
+        sample_seed: int = 0,
+        compute_summaries: bool = True,
+        sample_size: int = DEFAULT_QUANTILE_SAMPLE,
+        shard_rows: int = DEFAULT_SHARD_ROWS,
+    ):
+        """Start an empty store, the options are fixed for all batches appended to it"""
+        if shard_rows < 1:
+            raise ValueError(f"shard_rows must be positive, got {shard_rows}.")
+        if max_points_per_feature is not None and max_points_per_feature < 1:
+            raise ValueError("max_points_per_feature must be a positive integer.")
+        self.state = {
+            "version": STORE_VERSION,
+            "feature_names": list(feature_names),
+            "column_shape": list(column_shape),
+            "output_names": list(output_names) if output_names is not None else None,
+            "round_decimals": round_decimals,
+            "max_points_per_feature": max_points_per_feature,
+            "sample_seed": sample_seed,
+            "compute_summaries": compute_summaries,
+            "sample_size": sample_size,
+            "shard_rows": shard_rows,
+            "base_values": [0],
+            "categories": None,
+            "group_labels": None,
+            "next_batch": 0,
+            "next_row": 0,
+            "batches": [],
+        }
+
+    def append(
+        self,
+        shap_values: np.ndarray,
+        feature_values: Optional[Any] = None,
+        group_labels: Optional[Sequence[Any]] = None,
+        base_values: Optional[Any] = None,
+        window: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Append a batch of rows and update the running aggregates
+
+        Args:
+            shap_values: SHAP values of the batch (rows x features), or (rows x features x outputs)
+            feature_values: Optional feature values (rows x features). Non-numeric and boolean
+                columns (decided by the first batch) are dictionary-encoded against the
+                categories of the store, new labels are added
+            group_labels: Group label per row, required if and only if the first batch had them
+            base_values: Optional base value(s) shown in the report from now on
+            window: Optional maximum number of batches kept. Older batches are evicted: they
+                are dropped from the report and the aggregates are merged again from the
+                aggregates of the remaining batches
+
+        Returns:
+            List[str]: Paths (relative to the store) written by this append: the new
+                batch directory, aggregates.npz and state.json
+        """
+        state = self.state
+        if state is None:
+            raise ValueError("The report store has not been created yet.")
+        if window is not None and window < 1:
+            raise ValueError(f"window must be a positive number of batches, got {window}.")
+        shap_values = np.asarray(shap_values)
+        column_shape = tuple(state["column_shape"])
+        if shap_values.ndim < 2 or shap_values.shape[1:] != column_shape:
+            raise ValueError(f"Appended SHAP values must have the features (and outputs) of the report, "
+                             f"expected {column_shape} got {shap_values.shape[1:]}.")
+        n_rows = shap_values.shape[0]
+        if n_rows == 0:
+            raise ValueError("The appended batch holds no rows.")
+        has_groups = group_labels is not None
+        if state["batches"] and has_groups != (state["group_labels"] is not None):
+            raise ValueError("group_labels must be passed for every appended batch or for none.")
+        if has_groups and len(group_labels) != n_rows:
+            raise ValueError("group_labels length must match the number of samples in shap_values.")
+
+        if state["batches"] and (feature_values is not None) != (state["categories"] is not None):
+            raise ValueError("Feature values (data) must be passed for every appended batch or for none.")
+        # The new categories and group labels are only stored once the batch is written
+        feature_block, categories = None, state["categories"]
+        if feature_values is not None:
+            if np.shape(feature_values) != (n_rows, column_shape[0]):
+                raise ValueError("Feature values (data) must be of shape samples x features.")
+            if state["categories"] is None:
+                codes = feature_codes(feature_values)
+            else:
+                codes = [None if labels is None else _CategoryCodes(labels) for labels in state["categories"]]
+            feature_block = encode_feature_block(feature_values, codes)
+            categories = [None if column is None else column.labels for column in codes]
+
+        group_codes, store_group_labels = None, state["group_labels"]
+        if has_groups:
+            labels = _CategoryCodes(state["group_labels"] or [])
+            group_codes = labels.encode(np.asarray(group_labels, dtype=object)).astype(np.int64)
+            store_group_labels = labels.labels
+
+        batch_id, first_row = state["next_batch"], state["next_row"]
+        batch_dir = f"batch_{batch_id}"
+        rows = np.arange(first_row, first_row + n_rows)
+        aggregates = RunningAggregates(
+            int(np.prod(column_shape)),
+            state["compute_summaries"],
+            state["max_points_per_feature"],
+            state["sample_seed"],
+            state["sample_size"],
+        )
+        aggregates.update(shap_values.reshape(n_rows, -1), rows, group_codes)
+
+        written = write_shards(
+            self._path(batch_dir),
+            "",
+            shap_values,
+            feature_block,
+            round_decimals=state["round_decimals"],
+            shard_rows=state["shard_rows"],
+        ).manifest
+        groups = None
+        if group_codes is not None:
+            groups = {"path": "groups.bin", "columns": []}
+            with open(os.path.join(self._path(batch_dir), groups["path"]), "wb") as f:
+                groups["columns"].append(
+                    _write_column(f, "groups", 0, group_codes.astype(np.int32), _CODES_DTYPE, None, DEFAULT_BLOCK_ROWS)
+                )
+        aggregates.save(os.path.join(self._path(batch_dir), AGGREGATES_FILE))
+
+        state["categories"], state["group_labels"] = categories, store_group_labels
+        if base_values is not None:
+            state["base_values"] = np.atleast_1d(np.asarray(base_values, dtype=float)).tolist()
+        state["batches"].append({
+            "id": batch_id,
+            "first_row": first_row,
+            "rows": n_rows,
+            "features": written["features"],
+            "row_blocks": written["row_blocks"],
+            "groups": groups,
+        })
+        state["next_batch"] = batch_id + 1
+        state["next_row"] = first_row + n_rows
+
+        if window is not None and len(state["batches"]) > window:
+            for evicted in state["batches"][:-window]:
+                shutil.rmtree(self._path(f"batch_{evicted['id']}"), ignore_errors=True)
+            state["batches"] = state["batches"][-window:]
+            total = None
+            for batch in state["batches"]:
+                batch_aggregates = self._aggregates(f"batch_{batch['id']}/{AGGREGATES_FILE}")
+                if total is None:
+                    total = batch_aggregates
+                else:
+                    total.merge(batch_aggregates)
+        elif len(state["batches"]) > 1:
+            total = self._aggregates(AGGREGATES_FILE)
+            total.merge(aggregates)
+        else:
+            total = aggregates
+        total.save(self._path(AGGREGATES_FILE))
+        with open(self._path(STATE_FILE), "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        return [batch_dir, AGGREGATES_FILE, STATE_FILE]
+
+    @property
+    def n_rows(self) -> int:
+        """Number of rows in the window"""
+        return sum(batch["rows"] for batch in self.state["batches"])
+
+    def report_data(self, url: str, decimals: int = 6) -> Dict[str, Any]:
+        """
+        Keyword arguments of ReportGenerator.iter_payload for the shell of the window
+
+        Args:
+            url: URL of the store as seen from the report, e.g. "report_data/"
+            decimals: Number of decimals kept for importances and summaries
+
+        Returns:
+            Dict[str, Any]: "shap_values" and "feature_values" only carry the shapes,
+                "importance" is the mean |SHAP| per column (column_shape) to normalize
+        """
+        state = self.state
+        aggregates = self._aggregates(AGGREGATES_FILE)
+        column_shape = tuple(state["column_shape"])
+        n_rows = self.n_rows
+        start = state["batches"][0]["first_row"]
+
+        features = [{"parts": []} for _ in range(column_shape[0])]
+        row_blocks, group_parts = [], []
+        offset = 0
+        for batch in state["batches"]:
+            prefix = f"batch_{batch['id']}/"
+            stop = offset + batch["rows"]
+            for feature, written in zip(features, batch["features"]):
+                feature["parts"].append({**written, "path": prefix + written["path"], "start": offset, "stop": stop})
+            row_blocks.extend(
+                {**block, "path": prefix + block["path"], "start": offset + block["start"], "stop": offset + block["stop"]}
+                for block in batch["row_blocks"]
+            )
+            if batch["groups"] is not None:
+                group_parts.append({**batch["groups"], "path": prefix + batch["groups"]["path"], "start": offset, "stop": stop})
+            offset = stop
+
+        scatter_samples = aggregates.scatter.indices() if aggregates.scatter is not None else None
+        if scatter_samples is not None:
+            scatter_samples = [indices - start for indices in scatter_samples]
+        feature_headers = []
+        if state["categories"] is not None:
+            for labels in state["categories"]:
+                header = {"dtype": _COLUMN_DTYPE}
+                if labels is not None:
+                    header["categories"] = labels
+                feature_headers.append(header)
+        headers = {
+            "shap_values": [{"dtype": _COLUMN_DTYPE} for _ in range(aggregates.n_columns)],
+            "feature_values": feature_headers,
+            "scatter_samples": [encode_column(indices) for indices in scatter_samples or []],
+            "groups": [{"dtype": _CODES_DTYPE}, {"dtype": _CODES_DTYPE}],
+        }
+
+        labels = state["group_labels"]
+        groups = None
+        if labels is not None:
+            counts = aggregates.group_counts
+            importance = aggregates.group_sum_abs / np.maximum(counts, 1)[:, None]
+            groups = {
+                "labels": labels,
+                "offsets": np.concatenate([[0], np.cumsum(counts)]).tolist(),
+                "importance": np.round(importance, decimals).tolist(),
+            }
+        manifest = {
+            "url": url,
+            "rows": n_rows,
+            "features": features,
+            "row_blocks": row_blocks,
+            "groups": {"parts": group_parts} if labels is not None else None,
+        }
+
+        summaries = None
+        if state["compute_summaries"]:
+            summaries = summarize_stream(
+                aggregates.overall,
+                aggregates.groups if labels is not None else None,
+                labels,
+                aggregates.group_counts.tolist(),
+                decimals,
+            )
+        return {
+            "importance": (aggregates.sum_abs / max(n_rows, 1)).reshape(column_shape),
+            # split payloads only read the shapes of the matrices
+            "shap_values": np.broadcast_to(np.float32(0), (n_rows,) + column_shape),
+            "feature_values": (
+                np.broadcast_to(np.float32(0), (n_rows, column_shape[0])) if state["categories"] is not None else None
+            ),
+            "base_values": state["base_values"],
+            "feature_names": state["feature_names"],
+            "scatter_samples": scatter_samples,
+            "summaries": summaries,
+            "shards": SplitPayload(manifest, headers, groups),
+        }
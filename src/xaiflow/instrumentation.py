@@ -0,0 +1,186 @@
+"""
+Stage-level instrumentation of report generation
+Wall time, peak traced memory and output bytes of every stage (prepare, aggregate, render,
+log), handed to a callback, optionally logged as MLflow metrics and returned with the
+artifact path
+"""
+
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional
+
+STAGES = ("prepare", "aggregate", "render", "log")
+
+# tracemalloc is process-wide: tracing runs while at least one recorder needs it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+class StageRecord(NamedTuple):
+    """
+    Measurements of one stage of one report
+
+    Attributes:
+        run_id: Run the report is logged to
+        report_name: Name of the report file
+        stage: One of STAGES
+        seconds: Wall time
+        peak_bytes: Peak of the memory traced by tracemalloc during the stage, above the
+            traced memory at its start. None unless memory is traced. Process-wide, so
+            reports rendered concurrently count towards each other's peaks
+        output_bytes: Bytes written (render) or uploaded (log), None for other stages
+    """
+    run_id: Optional[str]
+    report_name: str
+    stage: str
+    seconds: float
+    peak_bytes: Optional[int] = None
+    output_bytes: Optional[int] = None
+
+
+class ReportPath(str):
+    """Artifact path returned by log_xai_report, carrying the StageRecord of every stage in .stages"""
+
+    stages: Dict[str, StageRecord]
+
+    def __new__(cls, path: str, stages: Optional[Dict[str, StageRecord]] = None):
+        report_path = super().__new__(cls, path)
+        report_path.stages = stages or {}
+        return report_path
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            # traced by the caller, never stopped here
+            _tracing_users += 1
+        elif _tracing_users == 0:
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+def directory_size(path: str) -> int:
+    """Size of all files below a directory in bytes, 0 if it does not exist"""
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def output_size(path: str) -> int:
+    """Size of a written report in bytes, including the shard directory of split reports"""
+    from .shards import shard_directory
+
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return size + directory_size(shard_directory(path))
+
+
+class StageRecorder:
+    """
+    Records the stages of one report
+
+    Use stage() as a context manager around every stage and finish() once the report is
+    logged, which hands the records to the callback and returns them.
+    """
+
+    def __init__(
+        self,
+        report_name: str,
+        run_id: Optional[str] = None,
+        trace_memory: bool = False,
+        callback: Optional[Callable[[StageRecord], Any]] = None,
+    ):
+        """
+        Args:
+            report_name: Name of the report file
+            run_id: Run the report is logged to, can be set later
+            trace_memory: Trace the peak memory of every stage with tracemalloc (slows
+                down allocations while a report is generated)
+            callback: Optional callable receiving every StageRecord in finish
+        """
+        self.report_name = report_name
+        self.run_id = run_id
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.records: Dict[str, StageRecord] = {}
+        self._tracing = False
+        if trace_memory:
+            _start_tracing()
+            self._tracing = True
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """
+        Measure a stage, set "output_bytes" in the yielded dict to record the output size
+
+        A stage entered twice (e.g. render of a retried report) adds up its measurements.
+        """
+        measured: Dict[str, Any] = {}
+        start_memory = None
+        if self._tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield measured
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] - start_memory if start_memory is not None else None
+            self.record(name, time.perf_counter() - start, peak, measured.get("output_bytes"))
+
+    def record(self, name: str, seconds: float, peak_bytes: Optional[int] = None, output_bytes: Optional[int] = None):
+        """Add a stage measured elsewhere, e.g. in a worker process"""
+        previous = self.records.get(name)
+        if previous is not None:
+            seconds += previous.seconds
+            peaks = [peak for peak in (peak_bytes, previous.peak_bytes) if peak is not None]
+            peak_bytes = max(peaks) if peaks else None
+            output_bytes = output_bytes if output_bytes is not None else previous.output_bytes
+        self.records[name] = StageRecord(self.run_id, self.report_name, name, seconds, peak_bytes, output_bytes)
+
+    def close(self):
+        """Stop tracing memory for this recorder"""
+        if self._tracing:
+            self._tracing = False
+            _stop_tracing()
+
+    def finish(self) -> Dict[str, StageRecord]:
+        """Stop tracing, hand the records to the callback and return them in stage order"""
+        self.close()
+        records = {
+            name: record._replace(run_id=self.run_id)
+            for name, record in sorted(self.records.items(), key=lambda item: _stage_order(item[0]))
+        }
+        self.records = records
+        if self.callback is not None:
+            for record in records.values():
+                self.callback(record)
+        return records
+
+    def metrics(self) -> Dict[str, float]:
+        """MLflow metrics of the records, xaiflow/<report name>/<stage>/<seconds|peak_bytes|output_bytes>"""
+        metrics = {}
+        for record in self.records.values():
+            for field in ("seconds", "peak_bytes", "output_bytes"):
+                value = getattr(record, field)
+                if value is not None:
+                    metrics[f"xaiflow/{self.report_name}/{record.stage}/{field}"] = float(value)
+        return metrics
+
+
+def _stage_order(name: str) -> int:
+    return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+def stage(recorder: Optional[StageRecorder], name: str) -> "contextlib.AbstractContextManager[Dict[str, Any]]":
+    """recorder.stage(name), or a context that measures nothing if there is no recorder"""
+    return recorder.stage(name) if recorder is not None else contextlib.nullcontext({})
+
@@ -4,16 +4,58 @@ Integrates the report generator with MLflow for storing HTML reports as artifact
 """
 
 import os
+import sys
 import json
-import warnings
+import inspect
+import itertools
+import threading
+import time
 import tempfile
 import shutil
-import mlflow
-from mlflow.tracking import MlflowClient
-from typing import Dict, List, Optional, Any
+from collections.abc import Iterable as IterableABC
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Any, Sequence, Tuple
 import numpy as np
-from shap import Explanation
-from jinja2 import Environment, FileSystemLoader
+
+if TYPE_CHECKING:
+    # mlflow and shap are slow to import, they are only imported where they are used
+    from mlflow.tracking import MlflowClient
+    from shap import Explanation
+
+from . import __version__
+from .cache import DEFAULT_CACHE_BYTES, ReportCache, content_hash
+from .compression import DEFAULT_COMPRESSION_LEVEL, check_codec
+from .correlations import DEFAULT_CORRELATION_BYTES, correlation_payload
+from .density import DEFAULT_DENSITY_BINS, DEFAULT_DENSITY_THRESHOLD, density_histograms, density_payload
+from .encoding import PAYLOAD_ENCODINGS
+from .groups import GroupIndex
+from .incremental import AGGREGATES_FILE, STATE_FILE, ReportStore
+from .instrumentation import ReportPath, StageRecord, StageRecorder, directory_size, output_size, stage
+from .observations import DEFAULT_OBSERVATION_K, ObservationIndex
+from .report_generator import ReportGenerator, read_cached
+from .shards import DEFAULT_SHARD_ROWS, shard_directory
+from .sidecar import compare_summaries, explanation_summary, read_summary, summary_path, write_summary
+from .streaming import StreamingAggregates, is_out_of_core, spill_batches, stream_arrays
+from .sampling import sample_scatter_indices
+from .summaries import mean_abs, summarize_features
+from .tables import is_table, table_features
+
+
+ON_DUPLICATE = ("upload", "reference")
+
+# Job entries hashed as arrays by the report cache, and entries that do not change the rendering
+_HASHED_JOB_ARRAYS = ("shap_values", "feature_values", "base_values", "importance_values", "group_labels")
+_UNHASHED_JOB_KEYS = _HASHED_JOB_ARRAYS + ("batches", "run_id", "artifact_path", "on_duplicate")
+
+
+def _is_explanation(obj: Any) -> bool:
+    """
+    isinstance(obj, shap.Explanation) without importing shap
+
+    If shap has never been imported in this process, obj cannot be an Explanation.
+    """
+    shap = sys.modules.get("shap")
+    return shap is not None and isinstance(obj, shap.Explanation)
 
 
 class XaiflowPlugin:
@@ -21,201 +63,1298 @@ class XaiflowPlugin:
     CE MLflow Extension Plugin for generating and storing interactive HTML reports
     """
     
-    def __init__(self):
-        self.client = MlflowClient()
-        self.template_dir = os.path.join(os.path.dirname(__file__), 'templates')
-        self.env = Environment(loader=FileSystemLoader(self.template_dir))
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 8,
+        cache_dir: Optional[str] = None,
+        max_cache_bytes: int = DEFAULT_CACHE_BYTES,
+        trace_memory: bool = False,
+        log_stage_metrics: bool = False,
+        stage_callback: Optional[Callable[[StageRecord], Any]] = None,
+    ):
+        """
+        Args:
+            max_workers: Number of background threads of log_xai_report_async
+            max_pending: Maximum number of queued or running async reports, further
+                calls block until a slot is free (bounds the memory held by the queue)
+            cache_dir: Optional directory of a report cache (see cache.py). Reports are
+                keyed by a hash of their inputs: identical reports are rendered once, and
+                not uploaded again to a run that already holds them (e.g. retried steps)
+            max_cache_bytes: Size limit of cache_dir, least recently used reports are removed
+            trace_memory: Record the peak memory of every stage of a report (prepare,
+                aggregate, render, log) with tracemalloc, which slows down allocations
+            log_stage_metrics: Log the wall time, peak memory and output bytes of every stage
+                as metrics xaiflow/<report name>/<stage>/<seconds|peak_bytes|output_bytes>
+            stage_callback: Optional callable receiving the StageRecord of every stage once
+                a report is logged (see instrumentation.py)
+        """
+        self._client = None
+        self.report_generator = ReportGenerator()
+        self.cache = ReportCache(cache_dir, max_cache_bytes) if cache_dir is not None else None
+        self.trace_memory = trace_memory
+        self.log_stage_metrics = log_stage_metrics
+        self.stage_callback = stage_callback
+        self.template_dir = self.report_generator.template_dir
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: List[Future] = []
+        self._pending_lock = threading.Lock()
+
+    @property
+    def env(self):
+        """Jinja environment used to render the report"""
+        return self.report_generator.env
+
+    @property
+    def client(self) -> "MlflowClient":
+        """MlflowClient, created on first use"""
+        if self._client is None:
+            from mlflow.tracking import MlflowClient
+            self._client = MlflowClient()
+        return self._client
 
     def log_xai_report(
         self,
-        feature_names: List[str],
-        shap_values: Explanation,
+        feature_names: Optional[List[str]],
+        shap_values: "Explanation",
         feature_encodings: Optional[Dict[str, Dict[int, str]]] = None,
         importance_values: List[float] | np.ndarray = None,
         group_labels: Optional[List[str]] = None,
         run_id: Optional[str] = None,
         artifact_path: str = "reports",
         report_name: str = "feature_importance_report.html",
-        round_decimals: int = 4
-    ) -> str:
+        round_decimals: int = 4,
+        payload_encoding: str = "binary",
+        max_points_per_feature: Optional[int] = None,
+        sample_seed: int = 0,
+        density_bins: Optional[int] = DEFAULT_DENSITY_BINS,
+        density_threshold: int = DEFAULT_DENSITY_THRESHOLD,
+        observation_k: Optional[int] = DEFAULT_OBSERVATION_K,
+        similar_observations: bool = False,
+        correlation_top: Optional[int] = None,
+        correlation_bytes: int = DEFAULT_CORRELATION_BYTES,
+        compute_summaries: bool = True,
+        output_names: Optional[List[str]] = None,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        compress_bundle: bool = False,
+        split: bool = False,
+        shard_rows: int = DEFAULT_SHARD_ROWS,
+        shard_url: Optional[str] = None,
+        on_duplicate: str = "upload",
+    ) -> ReportPath:
         """
         Log an interactive feature importance report as an MLflow artifact
         
         Args:
-            feature_names: List of feature names
+            feature_names: List of feature names, None takes the column names of a table
+                passed as shap_values.data
             importance_values: List of importance values corresponding to features
-            shap_values: Optional SHAP values matrix (samples x features)
-            group_labels: Optional list of group labels for each sample
+            shap_values: shap.Explanation (samples x features, or samples x features x outputs).
+                The feature values (data) can be a pandas DataFrame or a pyarrow Table: numeric
+                columns are read from their buffers without an intermediate object array (a
+                DataFrame of a single numeric dtype is not copied at all), categorical (and
+                Arrow dictionary), boolean and string columns are stored as their dictionary
+                codes and their categories fill in feature_encodings.
+                For explanations larger than memory, pass an Explanation of memory-mapped arrays
+                (np.load(..., mmap_mode="r") or streaming.load_npz) or an iterable of Explanation
+                batches. These are read in a single streaming pass with bounded memory: the
+                percentiles of the summaries are then estimated from a sample of
+                summaries.DEFAULT_QUANTILE_SAMPLE values per feature and the scatter sample
+                is uniform plus the SHAP extremes (not stratified)
+            group_labels: Optional list of group labels for each sample, a categorical pandas
+                Series or an Arrow (dictionary) array is grouped by its codes
             run_id: MLflow run ID (uses active run if None)
             artifact_path: Path within MLflow artifacts to store the report
             report_name: Name of the HTML report file
             round_decimals: Number of decimals to round feature values and SHAP values
+            payload_encoding: "binary" embeds every matrix column as a base64 typed array,
+                "json" embeds plain lists (larger, but human readable)
+            max_points_per_feature: Optional maximum number of points in the SHAP scatter plot
+                of a feature. Larger explanations are downsampled per feature, stratified by
+                feature-value quantiles and always keeping the SHAP extremes
+            sample_seed: Seed of the downsampling, the same seed gives the same points
+            density_bins: Bins per axis of the 2D histogram of (feature value, SHAP value)
+                of every feature. It is only computed (from all rows) for explanations with
+                more than density_threshold rows: the scatter plot draws it as a heatmap and
+                switches to the points once at most density_threshold rows are in view (zoom
+                with the mouse wheel). None always draws the points
+            density_threshold: Maximum number of rows in view drawn as individual points
+            observation_k: Number of rows the deep dive can jump to at each end of every
+                precomputed list: the highest and lowest SHAP values of every feature and the
+                highest and lowest predictions (base value plus the sum of the SHAP values),
+                overall and per group. None embeds no observation index
+            similar_observations: Also embed a quantized nearest-neighbour index over the SHAP
+                vectors to list the observations most similar to the selected one. Off by
+                default: it runs k-means over all rows and adds one byte per row and SHAP
+                column to the report. Not available for split reports
+            correlation_top: Number of interaction partners suggested per feature in the SHAP
+                scatter plot: the features whose SHAP values (and feature values) are the
+                strongest correlated, computed from all rows (e.g. 5). None (the default)
+                computes no correlations, which take a pass over all rows per output
+            correlation_bytes: Memory budget of the correlation computation, the rows are
+                read in blocks whose float64 copies stay below it together
+            compute_summaries: Embed per-feature SHAP summary statistics (mean, std, min, max,
+                percentiles and importance), overall and per group
+            output_names: Optional names of the outputs (classes or targets) of a multi-output
+                explanation, defaults to shap_values.output_names or "Output <i>"
+            compression: Optional codec ("gzip", "deflate" or "deflate-raw") to compress the
+                embedded data with (every binary column, or the whole JSON payload), the report
+                decompresses it in the browser (DecompressionStream)
+            compression_level: zlib compression level, 1 (fastest) to 9 (smallest)
+            compress_bundle: Compress the inlined bundle.js with the same codec as well
+            split: For very large explanations: log a small HTML shell and the matrices as
+                binary shards in <report name>_data/ next to it. The report fetches the shard
+                of a feature when it is selected and the rows of an observation when it is
+                opened in the deep dive, so it has to be served over HTTP (not opened as a file)
+            shard_rows: Number of rows per row-block shard of a split report
+            shard_url: Optional URL the shards are fetched from, defaults to the shard
+                directory relative to the report
+            on_duplicate: With a report cache (cache_dir), what to do when an identical report
+                was logged before: "upload" logs the cached rendering to this run, "reference"
+                only sets the run tag xaiflow.report_reference.<artifact path> to the runs:/ URI
+                of the first copy and returns that URI. Reports already logged to this run at
+                the same path are never uploaded again
             
         Returns:
-            str: Path to the logged artifact
+            ReportPath: Path to the logged artifact, a str whose .stages holds the
+                StageRecord of every stage by name
         """
-        
-        if not isinstance(shap_values, Explanation):
-            raise ValueError("shap_values must be an instance of shap.Explanation. Pls call explainer(X) or similar to get a valid Explanation object.")
-        if np.issubdtype(shap_values.data.dtype, np.floating):
-            feature_values = np.round(shap_values.data, round_decimals)
-        else:
-            feature_values = shap_values.data
-        base_values = np.round(shap_values.base_values, round_decimals)[0]
-        shap_values = np.round(shap_values.values, round_decimals)
-        if feature_values.ndim != shap_values.ndim:
-            if shap_values.ndim - feature_values.ndim > 1:
-                NotImplementedError("It looks like you're using multi-target regression or multi-output classification. Currently we don't support this."
-                              " You can still use the plugin, just hand over shap_values[..., <target_index>] to get the SHAP values for a specific target/class."
-                              " Please ensure that the shap_values.dim - feature_values.dim is 1 or less.")
-            else:
-                warnings.warn("Feature values and SHAP values dimensions do not match. This can be due to multi-target regression or (multi-target) classification."
-                              " If you want a specific target/class, please hand over shap_values[..., <target_index>] to get the SHAP values for that target/class."
-                              " We fall back to shap_values[..., -1] in this case."
+        recorder = self._stage_recorder(report_name)
+        job = self._prepare_recorded_job(
+            recorder,
+            feature_names=feature_names,
+            shap_values=shap_values,
+            feature_encodings=feature_encodings,
+            importance_values=importance_values,
+            group_labels=group_labels,
+            run_id=run_id,
+            artifact_path=artifact_path,
+            report_name=report_name,
+            round_decimals=round_decimals,
+            payload_encoding=payload_encoding,
+            max_points_per_feature=max_points_per_feature,
+            sample_seed=sample_seed,
+            density_bins=density_bins,
+            density_threshold=density_threshold,
+            observation_k=observation_k,
+            similar_observations=similar_observations,
+            correlation_top=correlation_top,
+            correlation_bytes=correlation_bytes,
+            compute_summaries=compute_summaries,
+            output_names=output_names,
+            compression=compression,
+            compression_level=compression_level,
+            compress_bundle=compress_bundle,
+            split=split,
+            shard_rows=shard_rows,
+            shard_url=shard_url,
+            on_duplicate=on_duplicate,
+        )
+        return self._run_report_job(job, recorder)
+
+    def append_xai_report(
+        self,
+        feature_names: List[str],
+        shap_values: "Explanation",
+        group_labels: Optional[List[str]] = None,
+        run_id: Optional[str] = None,
+        artifact_path: str = "reports",
+        report_name: str = "feature_importance_report.html",
+        window: Optional[int] = None,
+        feature_encodings: Optional[Dict[str, Dict[int, str]]] = None,
+        round_decimals: int = 4,
+        max_points_per_feature: Optional[int] = None,
+        sample_seed: int = 0,
+        compute_summaries: bool = True,
+        output_names: Optional[List[str]] = None,
+        shard_rows: int = DEFAULT_SHARD_ROWS,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> ReportPath:
+        """
+        Append a batch of rows to an incremental report, e.g. the explanations of every scoring batch
+
+        The report is a split report (see log_xai_report) whose rows live in one shard
+        directory per batch in <report name>_data/, next to the running aggregates of all
+        rows (see incremental.py). An append downloads the aggregates, uploads the shards of
+        the new batch and the updated aggregates and re-logs the small HTML shell, so its
+        cost does not grow with the number of rows appended before. The first append
+        creates the report, round_decimals, max_points_per_feature, sample_seed,
+        compute_summaries, output_names and shard_rows are fixed by it.
+
+        Args:
+            feature_names: List of feature names, the same for every batch
+            shap_values: shap.Explanation of the batch (samples x features, or samples x
+                features x outputs)
+            group_labels: Optional group label per sample, for every batch or for none
+            run_id: MLflow run ID (uses active run if None)
+            artifact_path: Path within MLflow artifacts to store the report
+            report_name: Name of the HTML report file
+            window: Optional maximum number of batches kept in the report. Older batches are
+                evicted, their shards stay in the artifact store (MLflow cannot delete
+                artifacts) but are no longer referenced
+            feature_encodings: Optional mapping of feature name to {code: label}
+            round_decimals: Number of decimals to round feature values and SHAP values
+            max_points_per_feature: Optional maximum number of points in the SHAP scatter
+                plot of a feature, a uniform sample plus the SHAP extremes of the window
+            sample_seed: Seed of the scatter and percentile samples
+            compute_summaries: Embed per-feature SHAP summary statistics, the percentiles
+                are estimated from a sample of summaries.DEFAULT_QUANTILE_SAMPLE values
+            output_names: Optional names of the outputs of a multi-output explanation
+            shard_rows: Number of rows per row-block shard
+            compression: Optional codec to compress the embedded data with, see log_xai_report
+            compression_level: zlib compression level, 1 (fastest) to 9 (smallest)
+
+        Returns:
+            ReportPath: Path to the logged artifact, with the StageRecord of every stage in
+                .stages (prepare covers downloading the aggregates, aggregate the update)
+        """
+        recorder = self._stage_recorder(report_name)
+        try:
+            artifact_full_path = self._append_report(
+                recorder, feature_names, shap_values, group_labels, run_id, artifact_path, report_name, window,
+                feature_encodings, round_decimals, max_points_per_feature, sample_seed, compute_summaries,
+                output_names, shard_rows, compression, compression_level,
+            )
+        finally:
+            recorder.close()
+        return ReportPath(artifact_full_path, self._finish_stages(recorder))
+
+    def _append_report(
+        self,
+        recorder: StageRecorder,
+        feature_names: List[str],
+        shap_values: "Explanation",
+        group_labels: Optional[List[str]],
+        run_id: Optional[str],
+        artifact_path: str,
+        report_name: str,
+        window: Optional[int],
+        feature_encodings: Optional[Dict[str, Dict[int, str]]],
+        round_decimals: int,
+        max_points_per_feature: Optional[int],
+        sample_seed: int,
+        compute_summaries: bool,
+        output_names: Optional[List[str]],
+        shard_rows: int,
+        compression: Optional[str],
+        compression_level: int,
+    ) -> str:
+        """append_xai_report, measuring its stages with recorder"""
+        import mlflow
+
+        if not _is_explanation(shap_values):
+            raise ValueError("shap_values must be an instance of shap.Explanation. Pls call explainer(X) or similar"
+                             " to get a valid Explanation object.")
+        check_codec(compression)
+        run_id = recorder.run_id = self._resolve_run_id(run_id)
+        values = np.asarray(shap_values.values)
+        if values.ndim == 3:
+            if output_names is None:
+                output_names = getattr(shap_values, "output_names", None)
+            if output_names is None or isinstance(output_names, str):
+                output_names = [f"Output {i}" for i in range(values.shape[-1])]
+            output_names = [str(name) for name in output_names]
+        base_values = np.round(np.asarray(shap_values.base_values)[0], round_decimals)
+
+        data_dir = self._shard_dir_name(report_name)
+        store_path = f"{artifact_path}/{data_dir}"
+        with tempfile.TemporaryDirectory(prefix="xaiflow-") as tmp_dir:
+            local_dir = os.path.join(tmp_dir, *store_path.split("/"))
+
+            def fetch(relative_path: str):
+                # a single file is downloaded into dst_path itself
+                dst_path = os.path.dirname(os.path.join(local_dir, relative_path))
+                os.makedirs(dst_path, exist_ok=True)
+                mlflow.artifacts.download_artifacts(
+                    run_id=run_id, artifact_path=f"{store_path}/{relative_path}", dst_path=dst_path
+                )
+
+            with recorder.stage("prepare"):
+                stored = {os.path.basename(info.path) for info in self.client.list_artifacts(run_id, store_path)}
+                if STATE_FILE in stored:
+                    fetch(STATE_FILE)
+                    fetch(AGGREGATES_FILE)
+                store = ReportStore(local_dir, fetch)
+                if store.state is None:
+                    store.create(
+                        feature_names,
+                        values.shape[1:],
+                        output_names,
+                        round_decimals=round_decimals,
+                        max_points_per_feature=max_points_per_feature,
+                        sample_seed=sample_seed,
+                        compute_summaries=compute_summaries,
+                        shard_rows=shard_rows,
+                    )
+                elif store.state["feature_names"] != list(feature_names):
+                    raise ValueError(f"The report {artifact_path}/{report_name} has other features, "
+                                     f"expected {store.state['feature_names']}.")
+
+            with recorder.stage("aggregate"):
+                written = store.append(values, shap_values.data, group_labels, base_values, window)
+                report_data = store.report_data(data_dir + "/")
+                importance_data, outputs = self._importance_payload(
+                    report_data.pop("importance"), store.state["feature_names"], store.state["output_names"]
+                )
+
+            shell_path = os.path.join(tmp_dir, "report.html")
+            with recorder.stage("render") as measured:
+                self.report_generator.write(
+                    shell_path,
+                    importance_data=importance_data,
+                    outputs=outputs,
+                    feature_encodings=feature_encodings,
+                    compression=compression,
+                    compression_level=compression_level,
+                    **report_data,
+                )
+                measured["output_bytes"] = output_size(shell_path)
+                write_summary(summary_path(shell_path), explanation_summary(
+                    store.state["feature_names"],
+                    importance_data,
+                    outputs,
+                    report_data["summaries"],
+                    store.n_rows,
+                    report_data["base_values"],
+                ))
+
+            with recorder.stage("log") as measured:
+                # the shards and aggregates first, so the report never points to missing data
+                uploaded = 0
+                for relative_path in written:
+                    path = os.path.join(local_dir, relative_path)
+                    if os.path.isdir(path):
+                        mlflow.log_artifacts(path, f"{store_path}/{relative_path}", run_id=run_id)
+                        uploaded += directory_size(path)
+                    else:
+                        mlflow.log_artifact(path, store_path, run_id=run_id)
+                        uploaded += os.path.getsize(path)
+                self._log_summary(shell_path, artifact_path, report_name, run_id=run_id)
+                self._log_report_file(shell_path, artifact_path, report_name, run_id=run_id)
+                measured["output_bytes"] = uploaded + os.path.getsize(shell_path)
+
+        artifact_full_path = f"{artifact_path}/{report_name}"
+        if "report_artifact_path" not in self.client.get_run(run_id).data.params:
+            self.client.log_param(run_id, "report_artifact_path", artifact_full_path)
+        return artifact_full_path
+
+    def log_xai_report_async(self, *args, **kwargs) -> Future:
+        """
+        Non-blocking variant of log_xai_report, rendering and uploading on a background thread
+
+        Takes the same arguments as log_xai_report. The explanation is validated and the
+        run id is resolved (from the active run if not given) before returning, so the
+        report is logged to the run that was active at call time even if the run has ended
+        or another one was started in the meantime. Blocks only if max_pending reports
+        are already queued.
+
+        The arrays of the explanation are referenced, not copied, do not modify them in
+        place until the returned future is done.
+
+        Returns:
+            Future: Resolves to the ReportPath of the logged artifact, or raises the error
+                of the background job
+        """
+        arguments = self._bind_report_arguments(*args, **kwargs)
+        recorder = self._stage_recorder(arguments["report_name"])
+        job = self._prepare_recorded_job(recorder, **arguments)
+
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(self._run_report_job, job, recorder)
+        except BaseException:
+            self._slots.release()
+            recorder.close()
+            raise
+        with self._pending_lock:
+            self._pending.append(future)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def log_xai_reports(
+        self,
+        reports: Sequence[Dict[str, Any]],
+        max_workers: Optional[int] = None,
+        mp_context: Any = None,
+        output_dir: Optional[str] = None,
+        progress: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Render many reports in parallel on a process pool and log them (or write them to disk)
+
+        Every report is validated and its run id resolved up front, so invalid arguments
+        raise before anything is rendered. Numeric arrays are passed to the workers through
+        shared memory (arrays shared between reports, e.g. explanation.data of per-class
+        explanations, are copied once), and every worker compiles the template and reads the
+        bundle only once. Reports are uploaded from this process as soon as they are rendered.
+
+        Args:
+            reports: One dict of log_xai_report keyword arguments per report, e.g.
+                {"run_id": ..., "feature_names": ..., "shap_values": explanation,
+                "group_labels": ..., "report_name": ...}
+            max_workers: Number of worker processes, defaults to one per report up to os.cpu_count()
+            mp_context: Optional multiprocessing context for the pool
+            output_dir: Optional local directory to write the reports to (with their sidecars
+                and the shards of split reports) instead of logging them. No run is needed then
+            progress: Optional callable receiving the result of every report as soon as it
+                is logged or has failed, in completion order
+
+        Returns:
+            List[Dict[str, Any]]: Per report, in input order: {"run_id", "report_name",
+                "artifact_path" (the local path with output_dir, None if it failed), "error"
+                (the exception or None),
+                "timings": {"prepare", "render", "log"} in seconds, "stages": the StageRecord
+                of every stage by name, aggregate and render are measured together as render
+                in the workers}
+        """
+        from .batch import render_reports
+
+        jobs, results, recorders = [], [], []
+        try:
+            for spec in reports:
+                arguments = self._bind_report_arguments(**spec)
+                recorder = self._stage_recorder(arguments["report_name"], trace_memory=False)
+                job = self._prepare_recorded_job(recorder, resolve_run_id=output_dir is None, **arguments)
+                if job["batches"] is not None:
+                    raise ValueError("log_xai_reports cannot send an iterator of Explanation batches to a worker process,"
+                                     " log it with log_xai_report or pass memory-mapped arrays.")
+                recorder.run_id = job["run_id"]
+                jobs.append(job)
+                recorders.append(recorder)
+                results.append({
+                    "run_id": job["run_id"],
+                    "report_name": job["report_name"],
+                    "artifact_path": None,
+                    "error": None,
+                    "timings": {"prepare": recorder.records["prepare"].seconds, "render": None, "log": None},
+                    "stages": {},
+                })
+        finally:
+            for recorder in recorders:
+                recorder.close()
+
+        # Forked workers inherit the compiled template and the bundle
+        self.report_generator.preload()
+        for index, path, error, seconds in render_reports(jobs, self.template_dir, max_workers, mp_context):
+            result, recorder = results[index], recorders[index]
+            result["timings"]["render"] = seconds
+            if error is not None:
+                recorder.record("render", seconds)
+                result["error"] = error
+                result["stages"] = recorder.finish()
+                if progress is not None:
+                    progress(result)
+                continue
+            recorder.record("render", seconds, output_bytes=output_size(path))
+            try:
+                with recorder.stage("log") as measured:
+                    measured["output_bytes"] = output_size(path)
+                    if output_dir is None:
+                        result["artifact_path"] = self._log_report(jobs[index], path, log_path_param=False)
+                    else:
+                        result["artifact_path"] = self._save_report(path, output_dir, jobs[index]["report_name"])
+                result["stages"] = self._finish_stages(recorder)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                self._remove_report_files(path)
+            result["timings"]["log"] = recorder.records["log"].seconds
+            if progress is not None:
+                progress(result)
+
+        # Reports are uploaded in completion order, the param of a run points to its first report in input order
+        if output_dir is None:
+            for result in results:
+                if result["error"] is None:
+                    self._log_path_param(result["run_id"], result["artifact_path"])
+        return results
+
+    @staticmethod
+    def _save_report(path: str, output_dir: str, report_name: str) -> str:
+        """
+        Move a written report, its sidecar and the shards of a split report to output_dir
+
+        Returns:
+            str: Path of the report in output_dir
+        """
+        target = os.path.join(output_dir, report_name)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        for source, destination in (
+            (shard_directory(path), shard_directory(target)),
+            (summary_path(path), summary_path(target)),
+            (path, target),
+        ):
+            if os.path.exists(source):
+                if os.path.isdir(destination):
+                    shutil.rmtree(destination)
+                shutil.move(source, destination)
+        return target
+
+    def _bind_report_arguments(self, *args, **kwargs) -> Dict[str, Any]:
+        """Arguments of a log_xai_report call by name, including the defaults"""
+        arguments = inspect.signature(self.log_xai_report).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return arguments.arguments
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._pending_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="xaiflow-report"
                 )
-                shap_values = shap_values[..., -1]
-                base_values = float(base_values[-1])
+            return self._executor
+
+    def flush(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Wait until all reports submitted with log_xai_report_async are logged
+
+        Every report submitted since the previous flush is collected here, so errors of
+        futures that were never checked are not lost.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits indefinitely
+
+        Returns:
+            List[str]: Artifact paths of the finished reports, in submission order
+
+        Raises:
+            TimeoutError: If the reports are not logged within timeout
+            Exception: The first error raised by a background job, after all jobs finished
+        """
+        with self._pending_lock:
+            futures, self._pending = self._pending, []
+        _, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            with self._pending_lock:
+                self._pending[:0] = futures
+            raise TimeoutError(f"{len(not_done)} xaiflow report(s) still pending after {timeout} seconds.")
+        return [future.result() for future in futures]
+
+    def close(self, cancel_pending: bool = False):
+        """
+        Shut down the background pool, after logging all queued reports unless cancel_pending
+
+        Errors are not raised here, call flush first to check them. The pool is recreated
+        on the next call to log_xai_report_async.
+        """
+        with self._pending_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=cancel_pending)
+
+    def compare_runs(
+        self,
+        run_ids: Sequence[str],
+        report_name: str = "feature_importance_report.html",
+        artifact_path: str = "reports",
+        output: Optional[str] = None,
+        output_path: Optional[str] = None,
+        run_id: Optional[str] = None,
+        comparison_name: str = "comparison_report.html",
+        cache_dir: Optional[str] = None,
+        max_workers: int = 8,
+    ) -> Dict[str, Any]:
+        """
+        Compare the feature importance of the reports of several runs, e.g. of a sweep
+
+        Only the summary sidecars of the reports are downloaded (a few KB per run instead
+        of the reports), concurrently with MlflowClient, and cached by run and size in
+        cache_dir. The comparison report shows the importance of every feature per run and
+        its drift from the first run.
+
+        Args:
+            run_ids: Runs to compare, the first one is the reference of the drift
+            report_name: Name of the compared report in every run
+            artifact_path: Artifact directory of the compared reports
+            output: Output compared for multi-output explanations, defaults to the last one
+            output_path: Optional local path to write the comparison report to
+            run_id: Run to log the comparison report to as artifact_path/comparison_name,
+                the active run if None. Not logged if only output_path is given
+            comparison_name: Artifact name of the logged comparison report
+            cache_dir: Directory the sidecars are cached in, defaults to the report cache
+                directory of the plugin. Without either the sidecars are downloaded every time
+            max_workers: Number of concurrent downloads
+
+        Returns:
+            Dict[str, Any]: The comparison (see sidecar.compare_summaries) with "run_names",
+                "missing" (runs without a sidecar, e.g. reports logged by older versions) and
+                "path" (output_path, or the artifact path of the logged report)
+
+        Raises:
+            ValueError: If none of the runs has a sidecar
+        """
+        if cache_dir is None and self.cache is not None:
+            # a dot directory is never pruned as a report entry
+            cache_dir = os.path.join(self.cache.directory, ".summaries")
+        sidecar = f"{artifact_path}/{os.path.basename(summary_path(report_name))}"
+        reference_tag = f"xaiflow.report_reference.{artifact_path}/{report_name}"
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(run_ids))), thread_name_prefix="xaiflow-compare") as executor:
+            fetched = list(executor.map(lambda run: self._fetch_summary(run, sidecar, reference_tag, cache_dir), run_ids))
+
+        summaries = {run: summary for run, (_, summary) in zip(run_ids, fetched) if summary is not None}
+        if not summaries:
+            raise ValueError(f"None of the runs has a summary sidecar of {artifact_path}/{report_name}, "
+                             "reports logged by older versions of xaiflow have none.")
+        comparison = compare_summaries(summaries, output)
+        names = dict(zip(run_ids, (name for name, _ in fetched)))
+        comparison["run_names"] = [names[run] for run in comparison["runs"]]
+        comparison["missing"] = [run for run in run_ids if run not in summaries]
+
+        html = self.env.get_template("comparison.html").render(
+            comparison=comparison, report_name=f"{artifact_path}/{report_name}"
+        )
+        comparison["path"] = output_path
+        if output_path is not None:
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(html)
+        if output_path is None or run_id is not None:
+            run_id = self._resolve_run_id(run_id)
+            with tempfile.TemporaryDirectory(prefix="xaiflow-") as tmp_dir:
+                path = os.path.join(tmp_dir, comparison_name)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(html)
+                self._log_report_file(path, artifact_path, comparison_name, run_id=run_id)
+            if output_path is None:
+                comparison["path"] = f"{artifact_path}/{comparison_name}"
+        return comparison
+
+    def _fetch_summary(
+        self, run_id: str, sidecar: str, reference_tag: str, cache_dir: Optional[str]
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Name of a run and the summary sidecar of its report, from cache_dir if unchanged
+
+        Reports deduplicated with on_duplicate="reference" are read from the run holding them.
+
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: Run name and sidecar, None if the run has none
+        """
+        run = self.client.get_run(run_id)
+        source_run, source_path = run_id, sidecar
+        reference = run.data.tags.get(reference_tag)
+        if reference is not None and reference.startswith("runs:/"):
+            source_run, report_path = reference[len("runs:/"):].split("/", 1)
+            source_path = summary_path(report_path)
+        infos = self.client.list_artifacts(source_run, os.path.dirname(source_path) or None)
+        size = next((info.file_size for info in infos if info.path == source_path), None)
+        if size is None:
+            return run.info.run_name, None
+
+        if cache_dir is None:
+            with tempfile.TemporaryDirectory(prefix="xaiflow-") as tmp_dir:
+                return run.info.run_name, read_summary(self.client.download_artifacts(source_run, source_path, tmp_dir))
+        cached = os.path.join(cache_dir, source_run, *source_path.split("/"))
+        if not os.path.exists(cached) or os.path.getsize(cached) != size:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix=".download-", dir=os.path.dirname(cached)) as tmp_dir:
+                os.replace(self.client.download_artifacts(source_run, source_path, tmp_dir), cached)
+        return run.info.run_name, read_summary(cached)
+
+    def _prepare_report_job(
+        self,
+        feature_names: Optional[List[str]],
+        shap_values: "Explanation",
+        feature_encodings: Optional[Dict[str, Dict[int, str]]],
+        importance_values: Optional[List[float] | np.ndarray],
+        group_labels: Optional[List[str]],
+        run_id: Optional[str],
+        artifact_path: str,
+        report_name: str,
+        round_decimals: int,
+        payload_encoding: str,
+        max_points_per_feature: Optional[int],
+        sample_seed: int,
+        density_bins: Optional[int],
+        density_threshold: int,
+        observation_k: Optional[int],
+        similar_observations: bool,
+        correlation_top: Optional[int],
+        correlation_bytes: int,
+        compute_summaries: bool,
+        output_names: Optional[List[str]],
+        compression: Optional[str],
+        compression_level: int,
+        compress_bundle: bool,
+        split: bool,
+        shard_rows: int,
+        shard_url: Optional[str],
+        on_duplicate: str = "upload",
+        resolve_run_id: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Validate the arguments of log_xai_report and resolve the run id in the calling thread
+
+        Args:
+            resolve_run_id: Resolve the run id (from the active run if None), False for
+                reports that are written to disk instead of logged
 
-        if group_labels is not None:
+        Returns:
+            Dict[str, Any]: Everything _run_report_job needs to render and log the report
+        """
+        batches = None
+        if not _is_explanation(shap_values):
+            shap_values, batches = self._peek_batches(shap_values)
+        if payload_encoding not in PAYLOAD_ENCODINGS:
+            raise ValueError(f"payload_encoding must be one of {PAYLOAD_ENCODINGS}, got '{payload_encoding}'.")
+        check_codec(compression)
+        if compress_bundle and compression is None:
+            raise ValueError("compress_bundle requires a compression codec.")
+        if split and payload_encoding != "binary":
+            raise ValueError("Split reports store binary shards, payload_encoding must be 'binary'.")
+        if split and shard_rows < 1:
+            raise ValueError(f"shard_rows must be positive, got {shard_rows}.")
+        if density_bins is not None and density_bins < 1:
+            raise ValueError(f"density_bins must be a positive integer, got {density_bins}.")
+        if observation_k is not None and observation_k < 1:
+            raise ValueError(f"observation_k must be a positive integer, got {observation_k}.")
+        if correlation_top is not None and correlation_top < 1:
+            raise ValueError(f"correlation_top must be a positive integer, got {correlation_top}.")
+        if on_duplicate not in ON_DUPLICATE:
+            raise ValueError(f"on_duplicate must be one of {ON_DUPLICATE}, got '{on_duplicate}'.")
+        # No rounded copies here, values are rounded block by block while the report is written
+        feature_values = shap_values.data
+        if batches is None and is_table(feature_values):
+            table_names, feature_values, categories = table_features(feature_values)
+            if feature_names is None:
+                feature_names = table_names
+            elif len(feature_names) != len(table_names):
+                raise ValueError(f"feature_names must have one name per column of the feature table ({len(table_names)}),"
+                                 f" got {len(feature_names)}.")
+            # mappings passed by the caller take precedence
+            feature_encodings = {**{feature_names[j]: labels for j, labels in categories.items()}, **(feature_encodings or {})}
+        if feature_names is None:
+            raise ValueError("feature_names is required unless shap_values.data is a pandas DataFrame or an Arrow table.")
+        base_values = np.round(np.asarray(shap_values.base_values)[0], round_decimals)
+        output_names = output_names if output_names is not None else getattr(shap_values, "output_names", None)
+        shap_values = shap_values.values
+        if shap_values.ndim - feature_values.ndim > 1:
+            raise NotImplementedError("It looks like your SHAP values have more than one output axis. Currently we support a single output axis"
+                                      " (multi-target regression or multi-class classification, shap_values.values of shape samples x features x outputs)."
+                                      " Please ensure that the shap_values.dim - feature_values.dim is 1 or less.")
+        if shap_values.ndim - feature_values.ndim == 1:
+            # Multi-output: the report embeds the features once and the SHAP tensor once, with an output selector
+            n_outputs = shap_values.shape[-1]
+            if output_names is None or isinstance(output_names, str):
+                output_names = [f"Output {i}" for i in range(n_outputs)]
+            output_names = [str(name) for name in output_names]
+            if len(output_names) != n_outputs:
+                raise ValueError(f"output_names must have one name per output ({n_outputs}), got {len(output_names)}.")
+            base_values = np.broadcast_to(base_values, (n_outputs,))
+        else:
+            output_names = None
+
+        # the number of rows of an iterator of batches is checked after the streaming pass
+        if group_labels is not None and batches is None:
             if len(group_labels) != shap_values.shape[0]:
                 raise ValueError("group_labels length must match the number of samples in shap_values.")
 
+        if resolve_run_id:
+            run_id = self._resolve_run_id(run_id)
+
+        return dict(
+            feature_names=feature_names,
+            shap_values=shap_values,
+            feature_values=feature_values,
+            batches=batches,
+            base_values=base_values,
+            feature_encodings=feature_encodings,
+            importance_values=importance_values,
+            group_labels=group_labels,
+            run_id=run_id,
+            artifact_path=artifact_path,
+            report_name=report_name,
+            round_decimals=round_decimals,
+            payload_encoding=payload_encoding,
+            max_points_per_feature=max_points_per_feature,
+            sample_seed=sample_seed,
+            density_bins=density_bins,
+            density_threshold=density_threshold,
+            observation_k=observation_k,
+            similar_observations=similar_observations,
+            correlation_top=correlation_top,
+            correlation_bytes=correlation_bytes,
+            compute_summaries=compute_summaries,
+            output_names=output_names,
+            compression=compression,
+            compression_level=compression_level,
+            compress_bundle=compress_bundle,
+            split=split,
+            shard_rows=shard_rows,
+            shard_url=shard_url,
+            on_duplicate=on_duplicate,
+        )
+
+    @staticmethod
+    def _resolve_run_id(run_id: Optional[str]) -> str:
+        """run_id, or the id of the active run if None"""
         # Use active run if no run_id provided
         if run_id is None:
+            import mlflow
+
             active_run = mlflow.active_run()
             if active_run is None:
                 raise ValueError("No active MLflow run found. Please start a run or provide run_id.")
             run_id = active_run.info.run_id
-        
-        # Normalize importance values to sum to 1
-        if importance_values is None:
-            importance_values = np.abs(shap_values).mean(axis=0).tolist()
-        total_importance = sum(importance_values)
-        if total_importance > 0:
-            normalized_importance = [v / total_importance for v in importance_values]
-        else:
-            normalized_importance = importance_values
-        
-        # Prepare data for the report
-        importance_data = {
-            "features": feature_names,
-            "values": normalized_importance
-        }
-        
-        # Create temporary file for the HTML report (with inlined JS)
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as tmp_file:
-            temp_path = tmp_file.name
-        
+        return run_id
+
+    @staticmethod
+    def _peek_batches(batches: Any) -> Tuple["Explanation", Iterator["Explanation"]]:
+        """
+        First batch of an iterable of Explanation batches, and an iterator over all batches
+
+        Raises:
+            ValueError: If batches is neither an Explanation nor an iterable of them
+        """
+        first = None
+        if isinstance(batches, IterableABC) and not isinstance(batches, (str, bytes, np.ndarray)):
+            batches = iter(batches)
+            first = next(batches, None)
+        if not _is_explanation(first):
+            raise ValueError("shap_values must be an instance of shap.Explanation (or an iterable of Explanation batches)."
+                             " Pls call explainer(X) or similar to get a valid Explanation object.")
+        return first, itertools.chain([first], batches)
+
+    def _run_report_job(self, job: Dict[str, Any], recorder: Optional[StageRecorder] = None) -> str:
+        """
+        Write the report to a temporary file and log it to job["run_id"]
+
+        Returns:
+            str: Path to the logged artifact, a ReportPath with the stages of recorder if given
+        """
         try:
-            # Generate the HTML report with inlined bundle.js
-            html_content = self._generate_html_content(
-                importance_data=importance_data,
+            if self.cache is not None and job["batches"] is None:
+                artifact_full_path = self._run_cached_report_job(job, recorder)
+            else:
+                # Create temporary file for the HTML report (with inlined JS)
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as tmp_file:
+                    temp_path = tmp_file.name
+
+                try:
+                    self._write_report(job, temp_path, recorder)
+                    with stage(recorder, "log") as measured:
+                        artifact_full_path = self._log_report(job, temp_path)
+                        measured["output_bytes"] = output_size(temp_path)
+                finally:
+                    # Clean up temporary file
+                    self._remove_report_files(temp_path)
+        finally:
+            if recorder is not None:
+                recorder.close()
+        if recorder is None:
+            return artifact_full_path
+        recorder.run_id = job["run_id"]
+        return ReportPath(artifact_full_path, self._finish_stages(recorder))
+
+    def _run_cached_report_job(self, job: Dict[str, Any], recorder: Optional[StageRecorder] = None) -> str:
+        """
+        _run_report_job through the report cache: render on a miss, skip duplicate uploads
+
+        Returns:
+            str: Path to the logged artifact, or the runs:/ URI of the referenced copy
+        """
+        key = self._report_key(job)
+        run_id = job["run_id"]
+        artifact_full_path = f"{job['artifact_path']}/{job['report_name']}"
+        with stage(recorder, "log") as measured:
+            measured["output_bytes"] = 0
+            logged = [location for location in self.cache.logged(key) if self._artifact_exists(**location)]
+            if {"run_id": run_id, "artifact_path": artifact_full_path} in logged:
+                print(f"Identical report already logged to MLflow: {artifact_full_path}")
+                return artifact_full_path
+            if job["on_duplicate"] == "reference" and logged:
+                source = f"runs:/{logged[0]['run_id']}/{logged[0]['artifact_path']}"
+                self.client.set_tag(run_id, f"xaiflow.report_reference.{artifact_full_path}", source)
+                print(f"Identical report referenced in MLflow: {source}")
+                return source
+
+        path = self.cache.get(key)
+        if path is None:
+            path = self.cache.put(key, lambda report_path: self._write_report(job, report_path, recorder))
+        with stage(recorder, "log") as measured:
+            result = self._log_report(job, path)
+            measured["output_bytes"] = output_size(path)
+        self.cache.record(key, run_id, artifact_full_path)
+        return result
+
+    def _stage_recorder(self, report_name: str, trace_memory: Optional[bool] = None) -> StageRecorder:
+        """StageRecorder of a report with the instrumentation options of the plugin"""
+        return StageRecorder(
+            report_name,
+            trace_memory=self.trace_memory if trace_memory is None else trace_memory,
+            callback=self.stage_callback,
+        )
+
+    def _prepare_recorded_job(self, recorder: StageRecorder, resolve_run_id: bool = True, **arguments) -> Dict[str, Any]:
+        """_prepare_report_job measured as the prepare stage of recorder"""
+        try:
+            with recorder.stage("prepare"):
+                job = self._prepare_report_job(**arguments, resolve_run_id=resolve_run_id)
+        except BaseException:
+            recorder.close()
+            raise
+        recorder.run_id = job["run_id"]
+        return job
+
+    def _finish_stages(self, recorder: StageRecorder) -> Dict[str, StageRecord]:
+        """Hand the stages of a logged report to the callback and log them as metrics if enabled"""
+        records = recorder.finish()
+        if self.log_stage_metrics and recorder.run_id is not None:
+            from mlflow.entities import Metric
+
+            timestamp = int(time.time() * 1000)
+            self.client.log_batch(
+                recorder.run_id,
+                metrics=[Metric(key, value, timestamp, 0) for key, value in recorder.metrics().items()],
+            )
+        return records
+
+    def _report_key(self, job: Dict[str, Any]) -> str:
+        """Content hash of everything the rendered report of a job depends on"""
+        options = {name: value for name, value in job.items() if name not in _UNHASHED_JOB_KEYS}
+        if not job["split"]:
+            # the name only ends up in the report as the URL of the shards
+            options.pop("report_name")
+        options["version"] = __version__
+        return content_hash(
+            {name: job[name] for name in _HASHED_JOB_ARRAYS},
+            options,
+            [
+                read_cached(os.path.join(self.template_dir, "report.html")) or "",
+                self.report_generator.load_bundle(),
+                self.report_generator.load_worker(),
+            ],
+        )
+
+    def _artifact_exists(self, run_id: str, artifact_path: str) -> bool:
+        """Whether run_id holds the artifact, False for deleted runs"""
+        try:
+            infos = self.client.list_artifacts(run_id, os.path.dirname(artifact_path) or None)
+        except Exception:
+            return False
+        return any(info.path == artifact_path for info in infos)
+
+    @staticmethod
+    def _remove_report_files(path: str):
+        """Delete a written report, its summary sidecar and the shards of a split report"""
+        for file in (path, summary_path(path)):
+            if os.path.exists(file):
+                os.unlink(file)
+        shutil.rmtree(shard_directory(path), ignore_errors=True)
+
+    def _write_report(self, job: Dict[str, Any], path: str, recorder: Optional[StageRecorder] = None) -> int:
+        """
+        Compute the aggregates of a prepared job and stream the report to path
+
+        Memory-mapped explanations and iterators of Explanation batches are read in a single
+        streaming pass (see streaming.py) that writes temporary column-major copies to the
+        system temp directory. The pass is measured as part of the aggregate stage.
+
+        Returns:
+            int: Number of characters written
+        """
+        group_labels = job["group_labels"]
+        # Dictionary-encode the group labels once, summaries and the report share the index
+        group_index = GroupIndex(group_labels) if group_labels is not None and len(group_labels) > 0 else None
+        if job["batches"] is None and not is_out_of_core(job["shap_values"], job["feature_values"]):
+            return self._write_report_data(
+                job, path, job["shap_values"], job["feature_values"], job["feature_encodings"], group_index, recorder=recorder
+            )
+
+        with tempfile.TemporaryDirectory(prefix="xaiflow-", ignore_cleanup_errors=True) as spill_dir:
+            aggregates = StreamingAggregates(
+                job["shap_values"].shape[1:],
+                group_index,
+                compute_summaries=job["compute_summaries"],
+                max_points_per_feature=job["max_points_per_feature"],
+                seed=job["sample_seed"],
+            )
+            feature_encodings = job["feature_encodings"]
+            with stage(recorder, "aggregate"):
+                if job["batches"] is not None:
+                    shap_values, feature_values, categories = spill_batches(job["batches"], spill_dir, aggregates)
+                    if group_labels is not None and len(group_labels) != shap_values.shape[0]:
+                        raise ValueError("group_labels length must match the number of samples in shap_values.")
+                    # mappings passed by the caller take precedence
+                    names = job["feature_names"]
+                    feature_encodings = {**{names[j]: labels for j, labels in categories.items()}, **(feature_encodings or {})}
+                else:
+                    shap_values, feature_values = stream_arrays(job["shap_values"], job["feature_values"], spill_dir, aggregates)
+            return self._write_report_data(job, path, shap_values, feature_values, feature_encodings, group_index, aggregates, recorder)
+
+    def _write_report_data(
+        self,
+        job: Dict[str, Any],
+        path: str,
+        shap_values: np.ndarray,
+        feature_values: Optional[np.ndarray],
+        feature_encodings: Optional[Dict[str, Dict[int, str]]],
+        group_index: Optional[GroupIndex],
+        aggregates: Optional[StreamingAggregates] = None,
+        recorder: Optional[StageRecorder] = None,
+    ) -> int:
+        """
+        Stream the report of a job to path, with aggregates of a streaming pass if given
+
+        Summaries, importance, the scatter sample, the density histograms, the observation
+        index and the correlations are measured as the aggregate stage,
+        encoding and writing the report (done together, block by block) as render.
+
+        Returns:
+            int: Number of characters written
+        """
+        with stage(recorder, "aggregate"):
+            aggregated = self._report_aggregates(job, shap_values, feature_values, group_index, aggregates)
+            write_summary(summary_path(path), explanation_summary(
+                job["feature_names"],
+                aggregated["importance_data"],
+                aggregated["outputs"],
+                aggregated["summaries"],
+                shap_values.shape[0],
+                job["base_values"],
+            ))
+
+        # Stream the HTML report with inlined bundle.js straight to the file
+        with stage(recorder, "render") as measured:
+            written = self.report_generator.write(
+                path,
                 shap_values=shap_values,
-                group_labels=group_labels or [],  # Default to empty list if None
+                group_labels=group_index,
                 feature_values=feature_values,
-                base_values=base_values,
+                base_values=job["base_values"],
                 feature_encodings=feature_encodings,
-                feature_names=feature_names,
+                feature_names=job["feature_names"],
+                payload_encoding=job["payload_encoding"],
+                round_decimals=job["round_decimals"],
+                compression=job["compression"],
+                compression_level=job["compression_level"],
+                compress_bundle=job["compress_bundle"],
+                split=job["split"],
+                shard_rows=job["shard_rows"],
+                shard_url=job["shard_url"] if job["shard_url"] is not None else self._shard_dir_name(job["report_name"]) + "/",
+                **aggregated,
             )
+            measured["output_bytes"] = output_size(path)
+        return written
 
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+    def _report_aggregates(
+        self,
+        job: Dict[str, Any],
+        shap_values: np.ndarray,
+        feature_values: Optional[np.ndarray],
+        group_index: Optional[GroupIndex],
+        aggregates: Optional[StreamingAggregates],
+    ) -> Dict[str, Any]:
+        """
+        Importance, summaries, scatter sample, density, observation index and correlations of
+        a job, from aggregates of a streaming pass if given (density, observation index and
+        correlations read the column-major copies of the pass)
 
-            # with open('test_report.html', 'w', encoding='utf-8') as f:
-            #     f.write(html_content)
-            
-            # Log the report as an MLflow artifact
-            artifact_full_path = f"{artifact_path}/{report_name}"
-            mlflow.log_artifact(temp_path, artifact_path)
-            
-            # Log metadata about the report
-            # mlflow.log_param("report_type", "feature_importance")
-            # mlflow.log_param("num_features", len(feature_names))
-            mlflow.log_param("report_artifact_path", artifact_full_path)
-            
-            # Log feature importance as metrics
-            # for feature, importance in zip(feature_names, normalized_importance):
-            #     mlflow.log_metric(f"importance_{feature}", importance)
-            
-            print(f"Feature importance report logged to MLflow: {artifact_full_path}")
-            return artifact_full_path
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+        Returns:
+            Dict[str, Any]: importance_data, outputs, summaries, scatter_samples, density,
+                observation_index and correlations keyword arguments of iter_payload
+        """
+        importance_values = job["importance_values"]
+        if aggregates is not None:
+            summaries = aggregates.summaries() if job["compute_summaries"] else None
+        else:
+            summaries = summarize_features(shap_values, group_index) if job["compute_summaries"] else None
+
+        output_names = job["output_names"]
+
+        # Importance per feature, (features x outputs) for multi-output explanations
+        if importance_values is None and summaries is not None:
+            importance = summaries["overall"][summaries["fields"].index("importance")]
+            importance = np.asarray(importance, dtype=float).reshape(shap_values.shape[1:])
+        elif importance_values is None:
+            importance = aggregates.importance() if aggregates is not None else mean_abs(shap_values)
+        else:
+            importance = np.asarray(importance_values, dtype=float)
+            if output_names is not None and importance.ndim == 1:
+                importance = np.repeat(importance[:, None], len(output_names), axis=1)
+
+        importance_data, outputs = self._importance_payload(importance, job["feature_names"], output_names)
+
+        scatter_samples = None
+        max_points_per_feature = job["max_points_per_feature"]
+        if aggregates is not None:
+            scatter_samples = aggregates.scatter_samples()
+        elif max_points_per_feature is not None and shap_values.shape[0] > max_points_per_feature:
+            scatter_samples = sample_scatter_indices(
+                shap_values, feature_values, max_points_per_feature, seed=job["sample_seed"]
+            )
+
+        density = None
+        density_bins = job["density_bins"]
+        if density_bins is not None and feature_values is not None and shap_values.shape[0] > job["density_threshold"]:
+            density = density_payload(
+                density_histograms(shap_values, feature_values, density_bins, group_index),
+                density_bins,
+                job["density_threshold"],
+                job["payload_encoding"],
+            )
+
+        observation_index = None
+        if job["observation_k"] is not None:
+            observation_index = ObservationIndex(
+                shap_values,
+                job["base_values"],
+                job["observation_k"],
+                group_index,
+                similar=job["similar_observations"] and not job["split"],
+                seed=job["sample_seed"],
+            )
+
+        correlations = None
+        if job["correlation_top"] is not None:
+            correlations = correlation_payload(
+                shap_values, feature_values, job["correlation_top"], job["correlation_bytes"]
+            )
+        return dict(
+            importance_data=importance_data,
+            outputs=outputs,
+            summaries=summaries,
+            scatter_samples=scatter_samples,
+            density=density,
+            observation_index=observation_index,
+            correlations=correlations,
+        )
+
+    @staticmethod
+    def _importance_payload(
+        importance: np.ndarray,
+        feature_names: List[str],
+        output_names: Optional[List[str]],
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Importance chart data and outputs of a report from the importance per feature (and output)
+
+        Returns:
+            Tuple[Dict[str, Any], Optional[Dict[str, Any]]]: importance_data and outputs of iter_payload
+        """
+        # Normalize importance values to sum to 1 (per output)
+        total_importance = importance.sum(axis=0)
+        normalized_importance = np.divide(importance, total_importance, out=importance.copy(), where=total_importance > 0)
+
+        # Prepare data for the report, the importance chart starts with the last output
+        importance_data = {
+            "features": feature_names,
+            "values": (normalized_importance[:, -1] if output_names is not None else normalized_importance).tolist()
+        }
+        outputs = None
+        if output_names is not None:
+            outputs = {"names": output_names, "importance": normalized_importance.T.tolist()}
+        return importance_data, outputs
+
+    @staticmethod
+    def _shard_dir_name(report_name: str) -> str:
+        """Name of the artifact directory holding the shards of a split report"""
+        return os.path.basename(shard_directory(report_name))
+
+    def _log_report(self, job: Dict[str, Any], temp_path: str, log_path_param: bool = True) -> str:
+        """
+        Log a written report as an MLflow artifact, always to the run resolved at call time
+
+        Args:
+            log_path_param: Set the report_artifact_path param of the run, False when the
+                caller sets it once all its reports are logged
+
+        Returns:
+            str: Path to the logged artifact
+        """
+        artifact_path = job["artifact_path"]
+        report_name = job["report_name"]
+        artifact_full_path = f"{artifact_path}/{report_name}"
+        if job["split"]:
+            import mlflow
+
+            # the shards first, so the report never points to missing data
+            mlflow.log_artifacts(
+                shard_directory(temp_path),
+                f"{artifact_path}/{self._shard_dir_name(report_name)}",
+                run_id=job["run_id"],
+            )
+        self._log_summary(temp_path, artifact_path, report_name, run_id=job["run_id"])
+        self._log_report_file(temp_path, artifact_path, report_name, run_id=job["run_id"])
+        
+        # Log metadata about the report
+        # mlflow.log_param("report_type", "feature_importance")
+        # mlflow.log_param("num_features", len(feature_names))
+        if log_path_param:
+            self._log_path_param(job["run_id"], artifact_full_path)
+        
+        # Log feature importance as metrics
+        # for feature, importance in zip(feature_names, normalized_importance):
+        #     mlflow.log_metric(f"importance_{feature}", importance)
+        
+        print(f"Feature importance report logged to MLflow: {artifact_full_path}")
+        return artifact_full_path
     
+    def _log_path_param(self, run_id: str, artifact_full_path: str):
+        """Params cannot be changed, with several reports per run it points to the first one"""
+        if "report_artifact_path" not in self.client.get_run(run_id).data.params:
+            self.client.log_param(run_id, "report_artifact_path", artifact_full_path)
+
+    @staticmethod
+    def _log_report_file(temp_path: str, artifact_path: str, report_name: str, run_id: Optional[str] = None):
+        """
+        Log the rendered file under artifact_path/report_name
+
+        mlflow.log_artifact keeps the basename of the local file, so the temp file is
+        linked (or copied if linking is not possible) to report_name first.
+        """
+        import mlflow
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_path = os.path.join(tmp_dir, report_name)
+            try:
+                os.link(temp_path, report_path)
+            except OSError:
+                shutil.copyfile(temp_path, report_path)
+            mlflow.log_artifact(report_path, artifact_path, run_id=run_id)
+
+    @classmethod
+    def _log_summary(cls, report_path: str, artifact_path: str, report_name: str, run_id: Optional[str] = None):
+        """Log the summary sidecar next to the report, reports cached by older versions have none"""
+        if os.path.exists(summary_path(report_path)):
+            cls._log_report_file(
+                summary_path(report_path), artifact_path, os.path.basename(summary_path(report_name)), run_id=run_id
+            )
+
     def _generate_html_content(
         self,
         importance_data: Dict[str, Any],
-        shap_values: List[List[float]],
-        feature_values: List[float] = None,
+        shap_values: List[List[float]] | np.ndarray,
+        feature_values: List[float] | np.ndarray = None,
         group_labels: List[str] = None,
-        base_values: List[float] = None,
+        base_values: List[float] | np.ndarray = None,
         feature_encodings: Optional[Dict[str, Dict[int, str]]] = None,
-        feature_names: List[str] = None
+        feature_names: List[str] = None,
+        payload_encoding: str = "binary",
     ):
         """
         Generate a custom HTML report with the provided data, inlining the bundle.js
         
         Args:
-            output_path: Path where to save the HTML report
             importance_data: Dictionary containing feature names and importance values
-            shap_values: SHAP values matrix
+            shap_values: SHAP values matrix (samples x features)
+            feature_values: Feature values matrix (samples x features)
+            group_labels: Optional list of group labels for each sample
+            base_values: Base value(s) of the explanation
+            feature_encodings: Optional mapping of feature name to {code: label}
+            feature_names: List of feature names
+            payload_encoding: "binary" or "json", see encoding.encode_column
         """
-        
-        # Load the template
-        template = self.env.get_template('report.html')
-        
-        # Read the bundle.js content to inline it
-        bundle_js_content = ""
-        bundle_path = os.path.join(
-            os.path.dirname(__file__), 'templates', 'assets', 'bundle.js'
-        )
-        
-        if os.path.exists(bundle_path):
-            with open(bundle_path, 'r', encoding='utf-8') as f:
-                bundle_js_content = f.read()
-            print(f"Loaded bundle.js content ({len(bundle_js_content)} characters)")
-        else:
-            print(f"Warning: bundle.js not found at {bundle_path}")
-        
-        # Generate metadata
-        import random
-        from datetime import datetime
-        random_number = random.randint(1, 1000)
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Convert numpy arrays to Python lists for JSON serialization
-        if isinstance(shap_values, np.ndarray):
-            shap_values = shap_values.tolist()
-        elif hasattr(shap_values, 'tolist'):
-            shap_values = shap_values.tolist()
-        
-        if feature_values is not None:
-            if isinstance(feature_values, np.ndarray):
-                feature_values = feature_values.tolist()
-            elif hasattr(feature_values, 'tolist'):
-                feature_values = feature_values.tolist()
-        
-        if base_values is not None:
-            if isinstance(base_values, np.ndarray):
-                base_values = base_values.tolist()
-            elif hasattr(base_values, 'tolist'):
-                base_values = base_values.tolist()
-        
-        # Render the template with data (no json.dumps needed since Jinja2 handles it)
-        html_content = template.render(
-            random_number=random_number,
-            timestamp=current_time,
-            importance_data=importance_data,  # Pass as Python dict
-            shap_values=shap_values,  # Pass as Python list
-            group_labels=group_labels or [],  # Pass as Python list or empty list
-            feature_values=feature_values,  # Pass as Python list or None
-            base_values=base_values or [0] * 10,  # Todo: fix this once we hand over numpy arrays
-            feature_encodings=feature_encodings or {},  # Pass as optional dict
-            feature_names=feature_names,  # Pass as list
-            bundle_js_content=bundle_js_content  # Pass the bundle content
+        return self.report_generator.render(
+            importance_data=importance_data,
+            shap_values=shap_values,
+            feature_values=feature_values,
+            group_labels=group_labels,
+            base_values=base_values,
+            feature_encodings=feature_encodings,
+            feature_names=feature_names,
+            payload_encoding=payload_encoding,
         )
-        
-        return html_content
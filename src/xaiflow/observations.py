@@ -0,0 +1,290 @@
+"""
+Observation index of the deep dive
+Precomputed row lists (the most extreme SHAP values per column and the highest and lowest
+predictions) and a quantized nearest-neighbour structure over the SHAP vectors, so the
+report can jump to extreme or similar observations without scanning the SHAP matrix
+"""
+
+from typing import Any, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .compression import DEFAULT_COMPRESSION_LEVEL
+from .encoding import DEFAULT_BLOCK_ROWS, dumps_for_script, encode_column, iter_encoded_column
+from .groups import GroupIndex
+
+
+# Rows kept at each end of every list, one page of the deep dive
+DEFAULT_OBSERVATION_K = 10
+# Rows the centroids of the similarity search are fitted on
+DEFAULT_CLUSTER_SAMPLE = 20_000
+MAX_CLUSTERS = 256
+# Rows compared with all centroids at a time, bounds the (rows x clusters) distance matrix
+CLUSTER_BLOCK_ROWS = 16384
+KMEANS_ITERATIONS = 10
+
+
+def top_bottom(values: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    The k rows with the highest values (descending) followed by the k lowest (ascending)
+
+    NaN values count as neither high nor low. Lists with fewer than k rows are padded with -1.
+    Only the selected values are copied (and only if they are not floating point or hold
+    NaN), the order is found by partitioning, without sorting all values.
+
+    Args:
+        values: 1D values, e.g. a SHAP column
+        k: Rows per end
+        rows: Optional row indices to restrict the lists to (e.g. one group), values are
+            read at these rows
+
+    Returns:
+        np.ndarray: int64 array of length 2 * k
+    """
+    selected = np.asarray(values if rows is None else values[rows])
+    if selected.dtype.kind != "f":
+        selected = selected.astype(np.float64)
+    # positions of the values that are not NaN, None if all of them are
+    missing = np.isnan(selected)
+    positions = np.flatnonzero(~missing) if missing.any() else None
+    if positions is not None:
+        selected = selected[positions]
+    result = np.full(2 * k, -1, dtype=np.int64)
+    n = min(k, len(selected))
+    if n == 0:
+        return result
+    top, bottom = _partial_order(-selected, n), _partial_order(selected, n)
+    if positions is not None:
+        top, bottom = positions[top], positions[bottom]
+    if rows is not None:
+        rows = np.asarray(rows)
+        top, bottom = rows[top], rows[bottom]
+    result[:n] = top
+    result[k:k + n] = bottom
+    return result
+
+
+def _partial_order(keys: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n smallest keys in ascending order (ties in row order), without sorting all keys"""
+    threshold = np.partition(keys, n - 1)[n - 1]
+    candidates = np.flatnonzero(keys <= threshold)
+    return candidates[np.argsort(keys[candidates], kind="stable")][:n]
+
+
+def extreme_rows(
+    columns: Iterable[np.ndarray],
+    k: int,
+    group_index: Optional[GroupIndex] = None,
+) -> List[np.ndarray]:
+    """
+    top_bottom of every column, overall and within every group
+
+    Args:
+        columns: 1D columns, e.g. the SHAP columns or the predictions per output
+        k: Rows per end
+        group_index: Optional group index
+
+    Returns:
+        List[np.ndarray]: Per column (1 + groups) * 2 * k row indices: the overall lists,
+            then those of every group
+    """
+    lists = []
+    for column in columns:
+        column = np.asarray(column)
+        parts = [top_bottom(column, k)]
+        if group_index is not None:
+            parts.extend(top_bottom(column, k, group_index.rows(g)) for g in range(len(group_index)))
+        lists.append(np.concatenate(parts))
+    return lists
+
+
+def predictions(shap_values: np.ndarray, base_values: Any, block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+    """
+    Model output of every row as base value plus the sum of its SHAP values, block by block
+
+    Returns:
+        np.ndarray: (samples x outputs) float64, one output for single-output explanations
+    """
+    n_rows, n_features = shap_values.shape[:2]
+    n_outputs = int(np.prod(shap_values.shape[2:], dtype=np.int64))
+    totals = np.zeros((n_rows, n_outputs))
+    for start in range(0, n_rows, block_rows):
+        block = np.asarray(shap_values[start:start + block_rows], dtype=np.float64)
+        totals[start:start + block_rows] = np.nansum(block.reshape(len(block), n_features, n_outputs), axis=1)
+    return totals + np.broadcast_to(np.asarray(base_values, dtype=np.float64).ravel(), (n_outputs,))
+
+
+class SimilarityIndex:
+    """
+    Inverted-file index over the SHAP vectors of all rows (all columns of a row)
+
+    Every SHAP column is scalar-quantized to 8 bit codes over its [min, max] range, and
+    every row is assigned to the nearest of up to MAX_CLUSTERS centroids fitted with k-means
+    on a sample of rows. The report finds the neighbours of a row by scanning the codes of
+    the rows in the clusters nearest to it only.
+
+    Attributes:
+        ranges: [min, max] per SHAP column
+        centroids: (clusters x columns) float64
+        clusters: Cluster of every row (uint8)
+    """
+
+    def __init__(
+        self,
+        shap_values: np.ndarray,
+        seed: int = 0,
+        sample_size: int = DEFAULT_CLUSTER_SAMPLE,
+        block_rows: int = CLUSTER_BLOCK_ROWS,
+    ):
+        """
+        Args:
+            shap_values: SHAP values matrix (samples x features), or (samples x features x outputs).
+                NaN values count as 0
+            seed: Seed of the row sample and the initial centroids
+            sample_size: Rows the centroids are fitted on
+            block_rows: Rows read at a time
+        """
+        n_rows = shap_values.shape[0]
+        self.n_columns = int(np.prod(shap_values.shape[1:], dtype=np.int64))
+        rng = np.random.default_rng(seed)
+        lows, highs = np.full(self.n_columns, np.inf), np.full(self.n_columns, -np.inf)
+        for start in range(0, n_rows, block_rows):
+            block = self._rows(shap_values, start, block_rows)
+            lows = np.minimum(lows, block.min(axis=0))
+            highs = np.maximum(highs, block.max(axis=0))
+        self.ranges = np.stack([lows, highs], axis=1)
+
+        sample = np.sort(rng.choice(n_rows, min(sample_size, n_rows), replace=False))
+        points = np.asarray(shap_values[sample], dtype=np.float64).reshape(len(sample), self.n_columns)
+        points = np.nan_to_num(points)
+        n_clusters = int(min(MAX_CLUSTERS, max(1, round(np.sqrt(n_rows))), len(sample)))
+        centroids = points[rng.choice(len(points), n_clusters, replace=False)] if n_clusters else points[:0]
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = self._nearest(points, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, points)
+            counts = np.bincount(nearest, minlength=n_clusters)[:, None]
+            # empty clusters keep their centroid
+            centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+        self.centroids = centroids
+
+        self.clusters = np.empty(n_rows, dtype=np.uint8)
+        for start in range(0, n_rows, block_rows):
+            self.clusters[start:start + block_rows] = self._nearest(self._rows(shap_values, start, block_rows), centroids)
+
+    def _rows(self, shap_values: np.ndarray, start: int, block_rows: int) -> np.ndarray:
+        block = np.asarray(shap_values[start:start + block_rows], dtype=np.float64)
+        return np.nan_to_num(block.reshape(len(block), self.n_columns))
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Index of the nearest centroid of every point"""
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * points @ centroids.T
+        return distances.argmin(axis=1)
+
+    def codes(self, column: np.ndarray, index: int) -> np.ndarray:
+        """8 bit codes of one SHAP column, code c stands for min + c * (max - min) / 255"""
+        low, high = self.ranges[index]
+        scale = 255 / (high - low) if high > low else 0.0
+        return np.rint((np.nan_to_num(np.asarray(column, dtype=np.float64)) - low) * scale).astype(np.uint8)
+
+    def iter_json(
+        self,
+        shap_values: np.ndarray,
+        payload_encoding: str = "binary",
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> Iterator[str]:
+        """
+        Stream the index as JSON for the report payload, quantizing one column at a time
+
+        Yields:
+            str: Pieces of '{"ranges":...,"centroids":...,"clusters":...,"codes":[...]}'
+        """
+        yield dumps_for_script({"ranges": self.ranges.tolist(), "centroids": self.centroids.tolist()})[:-1]
+        yield ',"clusters":'
+        yield from iter_encoded_column(
+            self.clusters, payload_encoding, None, block_rows, compression, compression_level
+        )
+        yield ',"codes":['
+        for index in range(self.n_columns):
+            if index > 0:
+                yield ","
+            column = shap_values[(slice(None),) + np.unravel_index(index, shap_values.shape[1:])]
+            yield from iter_encoded_column(
+                self.codes(column, index), payload_encoding, None, block_rows, compression, compression_level
+            )
+        yield "]}"
+
+
+class ObservationIndex:
+    """
+    Everything the deep dive jumps to: extreme SHAP values, extreme predictions and
+    (optionally) similar observations
+
+    Attributes:
+        k: Rows per end of every list
+        extremes: Per SHAP column, see extreme_rows
+        predictions: Per output, the same lists of the predictions
+        similarity: Optional SimilarityIndex
+    """
+
+    def __init__(
+        self,
+        shap_values: np.ndarray,
+        base_values: Any,
+        k: int = DEFAULT_OBSERVATION_K,
+        group_index: Optional[GroupIndex] = None,
+        similar: bool = False,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            shap_values: SHAP values matrix (samples x features), or (samples x features x outputs).
+                Read column by column and block by block, memory-mapped matrices stay on disk
+            base_values: Base value, or one per output
+            k: Rows per end of every list
+            group_index: Optional group index, the lists are kept per group as well
+            similar: Build the SimilarityIndex (it embeds one byte per row and SHAP column)
+            seed: Seed of the similarity index
+        """
+        if k < 1:
+            raise ValueError(f"observation_k must be a positive integer, got {k}.")
+        self.k = k
+        self.n_groups = len(group_index) if group_index is not None else None
+        shape = shap_values.shape[1:]
+        self.extremes = extreme_rows(
+            (shap_values[(slice(None),) + index] for index in np.ndindex(*shape)), k, group_index
+        )
+        self.predictions = extreme_rows(predictions(shap_values, base_values).T, k, group_index)
+        self.similarity = SimilarityIndex(shap_values, seed) if similar and shap_values.shape[0] > 0 else None
+
+    def iter_json(
+        self,
+        shap_values: np.ndarray,
+        payload_encoding: str = "binary",
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> Iterator[str]:
+        """
+        Stream the index as JSON for the report payload, decoded by the data engine
+
+        Yields:
+            str: Pieces of '{"k":...,"groups":...,"extremes":[...],"predictions":[...],"similar":...}'
+        """
+        yield dumps_for_script({
+            "k": self.k,
+            "groups": self.n_groups,
+            "extremes": [encode_column(rows, payload_encoding) for rows in self.extremes],
+            "predictions": [encode_column(rows, payload_encoding) for rows in self.predictions],
+        })[:-1]
+        yield ',"similar":'
+        if self.similarity is None:
+            yield "null"
+        else:
+            yield from self.similarity.iter_json(
+                shap_values, payload_encoding, block_rows, compression, compression_level
+            )
+        yield "}"
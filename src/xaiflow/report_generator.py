@@ -0,0 +1,444 @@
+"""
+Report Generator for CE MLflow Extension
+Renders the report template around the data payload and streams it to disk
+"""
+
+import io
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from .compression import DEFAULT_COMPRESSION_LEVEL, check_codec, compress, iter_compressed
+from .encoding import DEFAULT_BLOCK_ROWS, dumps_for_script, iter_encoded_column, iter_encoded_matrix
+from .groups import GroupIndex
+from .observations import ObservationIndex
+from .shards import DEFAULT_SHARD_ROWS, SplitPayload, shard_directory, write_shards
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# Process-wide caches shared by all ReportGenerator instances
+_cache_lock = threading.Lock()
+_environments: Dict[str, "Environment"] = {}
+_assets: Dict[str, Tuple[int, str]] = {}
+# (path, codec, level) -> (asset content the entry was compressed from, base64 of the compressed asset)
+_compressed_assets: Dict[Tuple[str, str, int], Tuple[str, str]] = {}
+
+
+def get_environment(template_dir: str) -> "Environment":
+    """
+    Shared Jinja environment for template_dir
+
+    Compiled templates are cached by the environment. With auto_reload (the Jinja
+    default) a cached template is recompiled when the file's mtime changes.
+
+    Args:
+        template_dir: Directory containing report.html
+
+    Returns:
+        Environment: The same instance for every call with the same directory
+    """
+    with _cache_lock:
+        if template_dir not in _environments:
+            from jinja2 import Environment, FileSystemLoader
+            _environments[template_dir] = Environment(loader=FileSystemLoader(template_dir), auto_reload=True)
+        return _environments[template_dir]
+
+
+def read_cached(path: str) -> Optional[str]:
+    """
+    Read a text asset once per process, re-reading it only when its mtime changes
+
+    Args:
+        path: Path of the asset, e.g. templates/assets/bundle.js
+
+    Returns:
+        Optional[str]: File content, None if the file does not exist
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _cache_lock:
+        cached = _assets.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    with _cache_lock:
+        _assets[path] = (mtime, content)
+    print(f"Loaded {os.path.basename(path)} content ({len(content)} characters)")
+    return content
+
+
+def clear_caches():
+    """Drop the cached environments and assets, e.g. after rebuilding the bundle in place"""
+    with _cache_lock:
+        _environments.clear()
+        _assets.clear()
+        _compressed_assets.clear()
+
+
+class ReportGenerator:
+    """
+    Generates the interactive HTML report from SHAP and feature matrices
+
+    The data payload is produced in pieces (column by column, block_rows rows at a
+    time) and handed to Jinja's template.generate, whose output is written to the
+    file piece by piece. Neither nested Python lists nor the full document are ever
+    built in memory.
+
+    Peak memory of write() alone, i.e. of rendering from prepared inputs: on top of the
+    caller's arrays, the generator holds the template, the inlined bundle.js (~225 KB)
+    and the encoding of a single block of one column. For a block of B rows that is
+    about 8*B bytes for the rounded block plus 4*B (typed array) and 2 * 4/3 * 4*B
+    (base64 bytes and str) for the binary encoding, i.e. ~23*B bytes, or ~40*B bytes
+    for the json encoding. With the default B = 196608 this stays below ~10 MB
+    independent of the number of rows and features. Exceptions: object dtype feature
+    columns are converted to float64 one whole column at a time (8 bytes per row),
+    non-numeric columns are dictionary-encoded one whole column at a time (their
+    strings plus 8 bytes of code per row), and the group index holds a code and a row
+    index per row (16 bytes per row).
+
+    XaiflowPlugin.log_xai_report prepares those inputs first and grows with the number
+    of rows: the density histogram of a feature bins float64 copies of its feature and
+    SHAP column (~60 bytes per row while one feature is binned), the observation index
+    keeps the float64 prediction of every row and output (8 bytes per row and output),
+    the summaries copy blocks of columns of up to summaries.DEFAULT_BLOCK_BYTES and the
+    correlations blocks of up to correlation_bytes. An iterable of Explanation batches (see
+    streaming) is prepared in a single pass with bounded memory instead.
+    """
+
+    def __init__(self, template_dir: Optional[str] = None):
+        self.template_dir = template_dir or DEFAULT_TEMPLATE_DIR
+
+    @property
+    def env(self) -> "Environment":
+        """Jinja environment shared by all generators using the same template_dir"""
+        return get_environment(self.template_dir)
+
+    def load_bundle(self) -> str:
+        """
+        Read the compiled Svelte bundle that gets inlined into the report (cached per process)
+
+        Returns:
+            str: Content of templates/assets/bundle.js, empty if it has not been built
+        """
+        bundle_path = os.path.join(self.template_dir, 'assets', 'bundle.js')
+        bundle_js_content = read_cached(bundle_path)
+        if bundle_js_content is None:
+            print(f"Warning: bundle.js not found at {bundle_path}")
+            return ""
+        return bundle_js_content
+
+    def load_worker(self) -> str:
+        """
+        Read the data engine worker script that gets embedded next to the bundle (cached per process)
+
+        Returns:
+            str: Content of templates/assets/worker.js, empty if it has not been built. The
+                report then runs the data engine on the page instead
+        """
+        return read_cached(os.path.join(self.template_dir, 'assets', 'worker.js')) or ""
+
+    def load_compressed_bundle(self, codec: str, level: int = DEFAULT_COMPRESSION_LEVEL) -> str:
+        """
+        The bundle compressed with codec, as base64 (cached per process until bundle.js changes)
+
+        Args:
+            codec: Key of compression.COMPRESSION_CODECS
+            level: zlib compression level
+
+        Returns:
+            str: Base64 of the compressed bundle
+        """
+        content = self.load_bundle()
+        key = (os.path.join(self.template_dir, 'assets', 'bundle.js'), codec, level)
+        with _cache_lock:
+            cached = _compressed_assets.get(key)
+        # read_cached returns the same string object until the file changes
+        if cached is not None and cached[0] is content:
+            return cached[1]
+        compressed = compress(content, codec, level)
+        with _cache_lock:
+            _compressed_assets[key] = (content, compressed)
+        return compressed
+
+    def preload(self):
+        """Compile report.html and read bundle.js and worker.js into the process-wide caches"""
+        self.env.get_template('report.html')
+        self.load_bundle()
+        self.load_worker()
+
+    def iter_payload(
+        self,
+        importance_data: Dict[str, Any],
+        shap_values: List[List[float]] | np.ndarray,
+        feature_values: List[float] | np.ndarray = None,
+        group_labels: List[str] | GroupIndex = None,
+        base_values: List[float] | np.ndarray = None,
+        feature_encodings: Optional[Dict[str, Dict[int, str]]] = None,
+        feature_names: List[str] = None,
+        payload_encoding: str = "binary",
+        round_decimals: Optional[int] = None,
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+        scatter_samples: Optional[List[np.ndarray]] = None,
+        density: Optional[Dict[str, Any]] = None,
+        observation_index: Optional[ObservationIndex] = None,
+        correlations: Optional[Dict[str, Any]] = None,
+        summaries: Optional[Dict[str, Any]] = None,
+        outputs: Optional[Dict[str, Any]] = None,
+        shards: Optional[SplitPayload] = None,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> Iterator[str]:
+        """
+        Stream the JSON text of the report payload, decoded in the browser by decodePayload
+
+        Args:
+            importance_data: Dictionary containing feature names and importance values
+            shap_values: SHAP values matrix (samples x features), or (samples x features x outputs)
+                for multi-output explanations, embedded once with one column per feature and output
+            feature_values: Feature values matrix (samples x features)
+            group_labels: Optional list of group labels for each sample, or a prebuilt GroupIndex.
+                Embedded dictionary-encoded together with the rows and importance of every group
+            base_values: Base value(s) of the explanation
+            feature_encodings: Optional mapping of feature name to {code: label}. Boolean and
+                string feature columns are dictionary-encoded (see encoding.encode_column) and
+                their categories fill in the features missing here
+            feature_names: List of feature names
+            payload_encoding: "binary" or "json", see encoding.encode_column
+            round_decimals: Optional number of decimals to round floating point values to
+            block_rows: Number of rows encoded per piece
+            scatter_samples: Optional row indices per feature to plot in the SHAP scatter,
+                see sampling.sample_scatter_indices
+            density: Optional 2D histograms drawn as the heatmap of the SHAP scatter, see
+                density.density_payload. Embedded inline in split reports as well
+            observation_index: Optional precomputed lists and similarity index of the deep
+                dive, see observations.ObservationIndex
+            correlations: Optional strongest correlated partners of every feature, suggested
+                as interaction partners in the SHAP scatter, see correlations.correlation_payload
+            summaries: Optional per-feature summary table, see summaries.summarize_features
+            outputs: Optional {"names": [...], "importance": outputs x features} of a
+                multi-output explanation, the report shows an output selector
+            shards: Optional shards the matrices were written to (see shards.write_shards),
+                only the column headers and the manifest are embedded then. If the shards
+                carry the group metadata, only the shapes of shap_values and feature_values are read
+            compression: Optional codec the bytes of every binary column are compressed with
+                (see encoding.encode_column), the metadata stays plain JSON
+            compression_level: zlib compression level
+
+        Yields:
+            str: Pieces of the payload JSON
+        """
+        metadata = {
+            "importance_data": importance_data,
+            "base_values": np.atleast_1d(np.asarray(base_values, dtype=float)).tolist() if base_values is not None else [0],
+            "feature_encodings": feature_encodings or {},
+            "feature_names": feature_names,
+            "summaries": summaries,
+            "outputs": outputs,
+            "density": density,
+            "correlations": correlations,
+        }
+        if shards is not None:
+            metadata["shards"] = shards.manifest
+        # Small entries first, the matrices are appended key by key
+        yield dumps_for_script(metadata)[:-1]
+        yield ',"groups":'
+        if shards is not None and shards.groups is not None:
+            codes, order = shards.headers["groups"]
+            yield dumps_for_script({**shards.groups, "codes": codes, "order": order})
+        elif group_labels is None or len(group_labels) == 0:
+            yield "null"
+        else:
+            group_index = group_labels if isinstance(group_labels, GroupIndex) else GroupIndex(group_labels)
+            if shards is not None:
+                codes, order = shards.headers["groups"]
+                yield dumps_for_script({**group_index.metadata(np.asarray(shap_values), block_rows), "codes": codes, "order": order})
+            else:
+                yield from group_index.iter_json(
+                    np.asarray(shap_values), payload_encoding, block_rows, compression, compression_level
+                )
+        yield ',"observation_index":'
+        if observation_index is None:
+            yield "null"
+        else:
+            yield from observation_index.iter_json(
+                shap_values, payload_encoding, block_rows, compression, compression_level
+            )
+        if shards is not None:
+            yield from self._iter_split_matrices(np.shape(shap_values), feature_values, scatter_samples, shards)
+            return
+        yield ',"shap_values":'
+        yield from iter_encoded_matrix(
+            shap_values, payload_encoding, round_decimals, block_rows, compression, compression_level
+        )
+        yield ',"feature_values":'
+        if feature_values is None:
+            yield "null"
+        else:
+            yield from iter_encoded_matrix(
+                feature_values, payload_encoding, round_decimals, block_rows, compression, compression_level
+            )
+        yield ',"scatter_samples":'
+        if scatter_samples is None:
+            yield "null"
+        else:
+            yield f'{{"total_rows":{len(shap_values)},"indices":['
+            for j, indices in enumerate(scatter_samples):
+                if j > 0:
+                    yield ","
+                yield from iter_encoded_column(
+                    indices, payload_encoding, None, block_rows, compression, compression_level
+                )
+            yield "]}"
+        yield "}"
+
+    @staticmethod
+    def _iter_split_matrices(
+        shape: Tuple[int, ...],
+        feature_values: Any,
+        scatter_samples: Optional[List[np.ndarray]],
+        shards: SplitPayload,
+    ) -> Iterator[str]:
+        """The matrix entries of a split payload: column headers without data"""
+        headers = shards.headers
+        yield ',"shap_values":'
+        yield dumps_for_script({"shape": list(shape), "columns": headers["shap_values"]})
+        yield ',"feature_values":'
+        yield dumps_for_script(
+            {"shape": list(np.shape(feature_values)), "columns": headers["feature_values"]}
+            if feature_values is not None else None
+        )
+        yield ',"scatter_samples":'
+        yield dumps_for_script(
+            {"total_rows": shape[0], "indices": headers["scatter_samples"]} if scatter_samples is not None else None
+        )
+        yield "}"
+
+    def generate(
+        self,
+        compression: Optional[str] = None,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        compress_bundle: bool = False,
+        **report_data: Any,
+    ) -> Iterator[str]:
+        """
+        Render report.html piece by piece
+
+        Args:
+            compression: Optional codec ("gzip", "deflate" or "deflate-raw"). Binary payloads
+                compress the bytes of every column before base64 encoding them, JSON payloads
+                are compressed as a whole. The page decompresses them with DecompressionStream
+            compression_level: zlib compression level, 1 (fastest) to 9 (smallest)
+            compress_bundle: Compress the inlined bundle.js with the same codec as well
+            **report_data: Keyword arguments of iter_payload
+
+        Yields:
+            str: Pieces of the HTML document
+        """
+        check_codec(compression)
+        if compress_bundle and compression is None:
+            raise ValueError("compress_bundle requires a compression codec.")
+        template = self.env.get_template('report.html')
+        payload_compression = None
+        if report_data.get("payload_encoding", "binary") == "binary":
+            payload_chunks = self.iter_payload(
+                compression=compression, compression_level=compression_level, **report_data
+            )
+        else:
+            payload_chunks = self.iter_payload(**report_data)
+            if compression is not None:
+                payload_chunks = iter_compressed(payload_chunks, compression, compression_level)
+                payload_compression = compression
+        # No timestamps or random values: equal inputs render to byte-identical reports,
+        # which the report cache (see cache.py) relies on
+        return template.generate(
+            payload_chunks=payload_chunks,
+            payload_compression=payload_compression,
+            bundle_js_content=(
+                self.load_compressed_bundle(compression, compression_level) if compress_bundle else self.load_bundle()
+            ),
+            bundle_compression=compression if compress_bundle else None,
+            worker_js_content=self.load_worker(),
+        )
+
+    def write_to(self, fileobj: TextIO, **report_data: Any) -> int:
+        """
+        Write the report to an open text file
+
+        Args:
+            fileobj: File object opened for writing text
+            **report_data: Keyword arguments of generate and iter_payload
+
+        Returns:
+            int: Number of characters written
+        """
+        written = 0
+        for chunk in self.generate(**report_data):
+            written += fileobj.write(chunk)
+        return written
+
+    def write(
+        self,
+        path: str,
+        split: bool = False,
+        shard_rows: int = DEFAULT_SHARD_ROWS,
+        shard_url: Optional[str] = None,
+        **report_data: Any,
+    ) -> int:
+        """
+        Stream the report to path, see the class docstring for the peak memory bound
+
+        Args:
+            path: Output path of the HTML report
+            split: Write the matrices to binary shards in shard_directory(path) and only a
+                small shell to path, the report fetches the shards it needs when they are used
+            shard_rows: Number of rows per row-block shard (split reports)
+            shard_url: URL the report fetches the shards from, defaults to the shard
+                directory relative to the report, e.g. "report_data/"
+            **report_data: Keyword arguments of generate and iter_payload
+
+        Returns:
+            int: Number of characters written (of the shell for split reports)
+        """
+        if split:
+            if report_data.get("payload_encoding", "binary") != "binary":
+                raise ValueError("Split reports store binary shards, payload_encoding must be 'binary'.")
+            group_labels = report_data.get("group_labels")
+            if group_labels is not None and len(group_labels) > 0 and not isinstance(group_labels, GroupIndex):
+                report_data["group_labels"] = group_labels = GroupIndex(group_labels)
+            directory = shard_directory(path)
+            report_data["shards"] = write_shards(
+                directory,
+                shard_url if shard_url is not None else os.path.basename(directory) + "/",
+                shap_values=report_data["shap_values"],
+                feature_values=report_data.get("feature_values"),
+                scatter_samples=report_data.get("scatter_samples"),
+                group_index=group_labels if isinstance(group_labels, GroupIndex) else None,
+                round_decimals=report_data.get("round_decimals"),
+                shard_rows=shard_rows,
+                block_rows=report_data.get("block_rows", DEFAULT_BLOCK_ROWS),
+            )
+        with open(path, 'w', encoding='utf-8') as f:
+            return self.write_to(f, **report_data)
+
+    def render(self, **report_data: Any) -> str:
+        """
+        Render the complete report into a string (convenient for small reports and tests)
+
+        Args:
+            **report_data: Keyword arguments of generate and iter_payload
+
+        Returns:
+            str: The HTML document
+        """
+        buffer = io.StringIO()
+        self.write_to(buffer, **report_data)
+        return buffer.getvalue()
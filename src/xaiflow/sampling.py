@@ -0,0 +1,260 @@
+"""
+Downsampling of the SHAP scatter plot for large explanations
+Picks a representative subset of rows per feature at report build time
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def _strata(feature_column: np.ndarray, n_strata: int) -> np.ndarray:
+    """
+    Assign every row to one of n_strata equal-count strata ordered by feature value
+
+    Rows are ranked by feature value (NaN last, ties broken by row order), so the
+    strata are the feature-value quantile bins. Columns that cannot be sorted fall
+    back to a single stratum.
+    """
+    n_rows = len(feature_column)
+    try:
+        order = np.argsort(feature_column, kind="stable")
+    except TypeError:
+        return np.zeros(n_rows, dtype=np.int64)
+    ranks = np.empty(n_rows, dtype=np.int64)
+    ranks[order] = np.arange(n_rows)
+    return ranks * n_strata // n_rows
+
+
+def stratified_sample(
+    feature_column: np.ndarray,
+    shap_column: np.ndarray,
+    max_points: int,
+    rng: np.random.Generator,
+    n_strata: int = 20,
+    n_extremes: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Pick at most max_points rows of one feature for the scatter plot
+
+    The n_extremes rows with the lowest and the highest SHAP values are always kept.
+    The remaining budget is split evenly across feature-value quantile strata and
+    filled with random rows of each stratum.
+
+    Args:
+        feature_column: Feature values of all rows
+        shap_column: SHAP values of all rows for the same feature
+        max_points: Maximum number of rows to keep
+        rng: Random generator, the result is deterministic given its state
+        n_strata: Number of feature-value quantile strata
+        n_extremes: Rows kept at each end of the SHAP range, defaults to 1% of max_points
+
+    Returns:
+        np.ndarray: Sorted row indices
+    """
+    n_rows = len(shap_column)
+    if n_rows <= max_points:
+        return np.arange(n_rows)
+    if n_extremes is None:
+        n_extremes = max(1, max_points // 100)
+    n_extremes = min(n_extremes, max_points // 2)
+
+    keep = np.zeros(n_rows, dtype=bool)
+    if n_extremes > 0:
+        finite_shap = np.where(np.isnan(shap_column), 0, shap_column)
+        keep[np.argpartition(finite_shap, n_extremes - 1)[:n_extremes]] = True
+        keep[np.argpartition(finite_shap, n_rows - n_extremes)[n_rows - n_extremes:]] = True
+
+    budget = max_points - int(keep.sum())
+    n_strata = max(1, min(n_strata, budget))
+    strata = _strata(feature_column, n_strata)
+
+    # Within every stratum take the rows with the smallest random keys, rows that are
+    # already kept as extremes sort last so they do not use up the stratum's quota
+    keys = rng.random(n_rows) + keep
+    order = np.lexsort((keys, strata))
+    strata_sorted = strata[order]
+    stratum_start = np.searchsorted(strata_sorted, np.arange(n_strata))
+    position = np.arange(n_rows) - stratum_start[strata_sorted]
+    quota = np.full(n_strata, budget // n_strata)
+    quota[:budget % n_strata] += 1
+    chosen = order[(position < quota[strata_sorted]) & ~keep[order]]
+    keep[chosen] = True
+    return np.flatnonzero(keep)
+
+
+def sample_scatter_indices(
+    shap_values: np.ndarray,
+    feature_values: np.ndarray,
+    max_points_per_feature: int,
+    seed: int = 0,
+) -> List[np.ndarray]:
+    """
+    Row indices to plot per feature, see stratified_sample
+
+    Args:
+        shap_values: SHAP values matrix (samples x features), or (samples x features x outputs)
+        feature_values: Feature values matrix (samples x features)
+        max_points_per_feature: Maximum number of points in the scatter plot of a feature
+        seed: Seed of the random selection, equal seeds give equal samples
+
+    Returns:
+        List[np.ndarray]: Sorted row indices, one array per feature, or per feature and
+            output in the column order of encoding.iter_columns for multi-output tensors
+    """
+    if max_points_per_feature < 1:
+        raise ValueError("max_points_per_feature must be a positive integer.")
+    return [
+        stratified_sample(
+            feature_values[:, index[0]],
+            shap_values[(slice(None),) + index],
+            max_points_per_feature,
+            np.random.default_rng([seed, column]),
+        )
+        for column, index in enumerate(np.ndindex(*shap_values.shape[1:]))
+    ]
+
+
+_SPLITMIX_INCREMENT = np.uint64(0x9E3779B97F4A7C15)
+_SPLITMIX_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+def hash_uniform(rows: np.ndarray, n_columns: int, seed: int = 0) -> np.ndarray:
+    """
+    Pseudo-random key in [0, 1) per row and column (splitmix64 of the cell position)
+
+    The key of a cell only depends on its row index, column and seed, so samples taken
+    with these keys do not depend on how the rows are split into blocks or batches.
+
+    Args:
+        rows: Row indices (1D)
+        n_columns: Number of columns
+        seed: Seed, equal seeds give equal keys
+
+    Returns:
+        np.ndarray: (len(rows) x n_columns) float64 keys
+    """
+    with np.errstate(over="ignore"):
+        z = (
+            np.asarray(rows, dtype=np.uint64)[:, None] * np.uint64(n_columns)
+            + np.arange(n_columns, dtype=np.uint64)[None, :]
+            + np.uint64(seed) * _SPLITMIX_INCREMENT
+            + _SPLITMIX_INCREMENT
+        )
+        z = (z ^ (z >> np.uint64(30))) * _SPLITMIX_MULTIPLIERS[0]
+        z = (z ^ (z >> np.uint64(27))) * _SPLITMIX_MULTIPLIERS[1]
+        z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def keep_smallest(keys: np.ndarray, payload: np.ndarray, k: int):
+    """The k smallest keys per column and the payload rows that go with them"""
+    if k <= 0:
+        return keys[:0], payload[:0]
+    if len(keys) <= k:
+        return keys, payload
+    smallest = np.argpartition(keys, k - 1, axis=0)[:k]
+    return np.take_along_axis(keys, smallest, axis=0), np.take_along_axis(payload, smallest, axis=0)
+
+
+class StreamingScatterSample:
+    """
+    Scatter plot rows per column for explanations that are read block by block
+
+    Out-of-core counterpart of sample_scatter_indices: keeps the n_extremes rows with the
+    lowest and highest SHAP values and a uniform random sample (the rows with the smallest
+    hash_uniform keys) of every column. Feature values are not needed, so the sample is
+    not stratified by feature-value quantiles. Memory is O(max_points * columns).
+    """
+
+    def __init__(self, n_columns: int, max_points: int, seed: int = 0, n_extremes: Optional[int] = None):
+        if max_points < 1:
+            raise ValueError("max_points_per_feature must be a positive integer.")
+        if n_extremes is None:
+            n_extremes = max(1, max_points // 100)
+        self.n_extremes = min(n_extremes, max_points // 2)
+        self.n_random = max_points - 2 * self.n_extremes
+        self.n_columns = n_columns
+        self.max_points = max_points
+        self.seed = seed
+        self.n_rows = 0
+        empty = np.empty((0, n_columns))
+        self._random = (empty, empty.astype(np.int64))
+        self._low = (empty, empty.astype(np.int64))
+        self._high = (empty, empty.astype(np.int64))
+
+    def update(self, shap_block: np.ndarray, rows: Optional[np.ndarray] = None):
+        """
+        Add the next rows
+
+        Args:
+            shap_block: (rows x columns) SHAP values of the rows following the previous block
+            rows: Optional row indices of the block, e.g. positions in an appended report
+                (defaults to the rows following the previous block)
+        """
+        n = len(shap_block)
+        if rows is None:
+            rows = np.arange(self.n_rows, self.n_rows + n)
+        row_matrix = np.broadcast_to(rows[:, None], (n, self.n_columns))
+        finite = np.where(np.isnan(shap_block), 0, shap_block)
+        self._random = keep_smallest(
+            np.concatenate([self._random[0], hash_uniform(rows, self.n_columns, self.seed)]),
+            np.concatenate([self._random[1], row_matrix]),
+            self.n_random,
+        )
+        if self.n_extremes > 0:
+            self._low = keep_smallest(
+                np.concatenate([self._low[0], finite]), np.concatenate([self._low[1], row_matrix]), self.n_extremes
+            )
+            high_keys, high_rows = keep_smallest(
+                np.concatenate([-self._high[0], -finite]), np.concatenate([self._high[1], row_matrix]), self.n_extremes
+            )
+            self._high = (-high_keys, high_rows)
+        self.n_rows += n
+
+    def merge(self, other: "StreamingScatterSample"):
+        """Add the rows sampled by other (with the same max_points and seed, and different row indices)"""
+        self._random = keep_smallest(
+            np.concatenate([self._random[0], other._random[0]]),
+            np.concatenate([self._random[1], other._random[1]]),
+            self.n_random,
+        )
+        self._low = keep_smallest(
+            np.concatenate([self._low[0], other._low[0]]), np.concatenate([self._low[1], other._low[1]]), self.n_extremes
+        )
+        high_keys, high_rows = keep_smallest(
+            np.concatenate([-self._high[0], -other._high[0]]), np.concatenate([self._high[1], other._high[1]]), self.n_extremes
+        )
+        self._high = (-high_keys, high_rows)
+        self.n_rows += other.n_rows
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays to restore the sample from with from_state, e.g. for np.savez"""
+        return {
+            "n_rows": np.asarray(self.n_rows),
+            "random_keys": self._random[0], "random_rows": self._random[1],
+            "low_keys": self._low[0], "low_rows": self._low[1],
+            "high_keys": self._high[0], "high_rows": self._high[1],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray], max_points: int, seed: int = 0) -> "StreamingScatterSample":
+        """Sample saved with state, max_points and seed have to be those it was created with"""
+        sample = cls(state["random_keys"].shape[1], max_points, seed)
+        sample.n_rows = int(state["n_rows"])
+        sample._random = (state["random_keys"], state["random_rows"])
+        sample._low = (state["low_keys"], state["low_rows"])
+        sample._high = (state["high_keys"], state["high_rows"])
+        return sample
+
+    def indices(self) -> Optional[List[np.ndarray]]:
+        """
+        Sorted row indices per column, None if all rows fit into max_points
+
+        Returns:
+            Optional[List[np.ndarray]]: Like sample_scatter_indices
+        """
+        if self.n_rows <= self.max_points:
+            return None
+        rows = np.concatenate([self._random[1], self._low[1], self._high[1]])
+        return [np.unique(rows[:, column]) for column in range(self.n_columns)]
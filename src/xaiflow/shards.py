@@ -0,0 +1,217 @@
+"""
+Split reports: the matrices are written to binary shard files next to a small HTML shell
+The report fetches the shard of a feature when the feature is selected and the row block
+of an observation when it is opened in the deep dive, so opening the report loads no rows
+"""
+
+import json
+import os
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .encoding import (
+    BINARY_DTYPES,
+    BIT_PACKED_DTYPE,
+    DEFAULT_BLOCK_ROWS,
+    as_2d,
+    iter_column_buffers,
+    iter_column_data,
+    iter_columns,
+    prepare_column,
+)
+from .groups import GroupIndex
+
+SHARD_DIR_SUFFIX = "_data"
+
+# Rows per row-block shard, i.e. what the deep dive fetches to show one observation
+DEFAULT_SHARD_ROWS = 65536
+
+# Columns start at multiples of 8 bytes, so the frontend can view them as typed arrays in place
+_ALIGNMENT = 8
+
+
+class SplitPayload(NamedTuple):
+    """
+    Written shards of a report
+
+    Attributes:
+        manifest: Embedded in the payload as "shards": {"url", "rows", "features",
+            "row_blocks", "groups"}. Every shard file is {"path", ["start", "stop"],
+            "columns": [{"matrix", "index", "offset", "nbytes"}]}. Features and groups of
+            appended reports are split into "parts", one shard file per batch
+        headers: Column headers per matrix ("shap_values", "feature_values",
+            "scatter_samples", "groups"), embedded in place of the encoded columns.
+            Headers with "data" (e.g. scatter samples of appended reports) are embedded as is
+        groups: Optional "labels", "offsets" and "importance" of the group index, for
+            reports whose rows are not at hand when the shell is written (see incremental.py)
+    """
+    manifest: Dict[str, Any]
+    headers: Dict[str, List[Dict[str, Any]]]
+    groups: Optional[Dict[str, Any]] = None
+
+
+def shard_directory(report_path: str) -> str:
+    """Directory holding the shards of a report, e.g. reports/report.html -> reports/report_data"""
+    return os.path.splitext(report_path)[0] + SHARD_DIR_SUFFIX
+
+
+def _write_column(
+    f: BinaryIO,
+    matrix: str,
+    index: int,
+    values: np.ndarray,
+    dtype_name: str,
+    round_decimals: Optional[int],
+    block_rows: int,
+) -> Dict[str, Any]:
+    """Append a column to an open shard file, "json" columns are stored as UTF-8 JSON text"""
+    f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+    offset = f.tell()
+    if dtype_name == "json":
+        f.write(b"[")
+        for piece in iter_column_data(values, dtype_name, round_decimals, block_rows):
+            f.write(piece.encode("utf-8"))
+        f.write(b"]")
+    else:
+        for buffer in iter_column_buffers(values, dtype_name, round_decimals, block_rows):
+            f.write(buffer)
+    return {"matrix": matrix, "index": index, "offset": offset, "nbytes": f.tell() - offset}
+
+
+def write_shards(
+    directory: str,
+    url: str,
+    shap_values: np.ndarray,
+    feature_values: Optional[np.ndarray] = None,
+    scatter_samples: Optional[List[np.ndarray]] = None,
+    group_index: Optional[GroupIndex] = None,
+    round_decimals: Optional[int] = None,
+    shard_rows: int = DEFAULT_SHARD_ROWS,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+) -> SplitPayload:
+    """
+    Write the matrices of a report to shard files, column by column
+
+    feature_<j>.bin holds every row of feature j: its SHAP column (one per output), its
+    feature values and its scatter sample indices. rows_<b>.bin holds all SHAP and feature
+    columns of shard_rows consecutive rows. groups.bin holds the codes and order of the
+    group index. Columns are stored like the binary payload encoding, without base64.
+    Every column is prepared once and appended to its feature shard and to every row
+    block, so besides the output only one (dictionary-encoded) column is held at a time.
+
+    Args:
+        directory: Directory the shards are written to, created if needed
+        url: URL of directory as seen from the report, usually relative, e.g. "report_data/"
+        shap_values: SHAP values matrix (samples x features), or (samples x features x outputs)
+        feature_values: Optional feature values matrix (samples x features)
+        scatter_samples: Optional row indices per SHAP column, see sampling.sample_scatter_indices
+        group_index: Optional group index of the rows
+        round_decimals: Optional number of decimals to round floating point values to
+        shard_rows: Number of rows per row block
+        block_rows: Number of rows encoded at a time
+
+    Returns:
+        SplitPayload: The manifest and the column headers for ReportGenerator.iter_payload
+    """
+    if shard_rows < 1:
+        raise ValueError(f"shard_rows must be positive, got {shard_rows}.")
+    os.makedirs(directory, exist_ok=True)
+    shap_values = as_2d(shap_values)
+    feature_values = as_2d(feature_values) if feature_values is not None else None
+    n_rows, n_features = shap_values.shape[:2]
+    columns_per_feature = int(np.prod(shap_values.shape[2:]))
+
+    headers: Dict[str, List[Dict[str, Any]]] = {
+        "shap_values": [], "feature_values": [], "scatter_samples": [], "groups": [],
+    }
+    features = [{"path": f"feature_{j}.bin", "columns": []} for j in range(n_features)]
+    row_blocks = [
+        {"path": f"rows_{b}.bin", "start": start, "stop": min(start + shard_rows, n_rows), "columns": []}
+        for b, start in enumerate(range(0, n_rows, shard_rows))
+    ]
+    for block in row_blocks:
+        open(os.path.join(directory, block["path"]), "wb").close()
+
+    shap_columns = iter_columns(shap_values)
+    for j, feature in enumerate(features):
+        columns: List[Tuple[str, Any]] = [("shap_values", next(shap_columns)) for _ in range(columns_per_feature)]
+        if feature_values is not None:
+            columns.append(("feature_values", feature_values[:, j]))
+        if scatter_samples is not None:
+            start = j * columns_per_feature
+            columns.extend(("scatter_samples", indices) for indices in scatter_samples[start:start + columns_per_feature])
+        with open(os.path.join(directory, feature["path"]), "wb") as f:
+            for matrix, column in columns:
+                header, values = prepare_column(column)
+                # the number of rows is that of the shard file
+                header.pop("length", None)
+                index = len(headers[matrix])
+                headers[matrix].append(header)
+                feature["columns"].append(
+                    _write_column(f, matrix, index, values, header["dtype"], round_decimals, block_rows)
+                )
+                if matrix == "scatter_samples":
+                    continue
+                for block in row_blocks:
+                    with open(os.path.join(directory, block["path"]), "ab") as block_file:
+                        block["columns"].append(_write_column(
+                            block_file, matrix, index, values[block["start"]:block["stop"]],
+                            header["dtype"], round_decimals, block_rows,
+                        ))
+
+    groups = None
+    if group_index is not None:
+        groups = {"path": "groups.bin", "columns": []}
+        with open(os.path.join(directory, groups["path"]), "wb") as f:
+            for index, column in enumerate((group_index.codes, group_index.order)):
+                header, values = prepare_column(column)
+                headers["groups"].append(header)
+                groups["columns"].append(_write_column(f, "groups", index, values, header["dtype"], None, block_rows))
+
+    manifest = {"url": url, "rows": n_rows, "features": features, "row_blocks": row_blocks, "groups": groups}
+    return SplitPayload(manifest, headers)
+
+
+def payload_headers(payload: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Column headers per matrix of a split report payload, the inverse of iter_payload"""
+    return {
+        "shap_values": payload["shap_values"]["columns"],
+        "feature_values": payload["feature_values"]["columns"] if payload["feature_values"] else [],
+        "scatter_samples": payload["scatter_samples"]["indices"] if payload["scatter_samples"] else [],
+        "groups": [payload["groups"]["codes"], payload["groups"]["order"]] if payload["groups"] else [],
+    }
+
+
+def decode_shard(
+    data: bytes,
+    shard_file: Dict[str, Any],
+    headers: Dict[str, List[Dict[str, Any]]],
+    n_rows: int,
+) -> Dict[Tuple[str, int], np.ndarray]:
+    """
+    Columns of a shard file, mirrors ShardLoader in templates/utils/payload.ts
+
+    Args:
+        data: Content of the shard file
+        shard_file: Its entry in the manifest
+        headers: Column headers, see payload_headers
+        n_rows: Number of rows of the report, manifest["rows"]
+
+    Returns:
+        Dict[Tuple[str, int], np.ndarray]: (matrix, column index) -> decoded column, the
+            codes for dictionary-encoded columns
+    """
+    rows = shard_file.get("stop", n_rows) - shard_file.get("start", 0)
+    columns = {}
+    for entry in shard_file["columns"]:
+        dtype_name = headers[entry["matrix"]][entry["index"]]["dtype"]
+        raw = data[entry["offset"]:entry["offset"] + entry["nbytes"]]
+        if dtype_name == "json":
+            column = np.asarray(json.loads(raw.decode("utf-8")))
+        elif dtype_name == BIT_PACKED_DTYPE:
+            column = np.unpackbits(np.frombuffer(raw, dtype=np.uint8), count=rows, bitorder="little").astype(bool)
+        else:
+            column = np.frombuffer(raw, dtype=BINARY_DTYPES[dtype_name])
+        columns[(entry["matrix"], entry["index"])] = column
+    return columns
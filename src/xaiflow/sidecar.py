@@ -0,0 +1,141 @@
+"""
+Explanation summary sidecar of a report
+A small JSON file logged next to every report with the normalized importances, the
+per-feature summary table and the group aggregates, so runs can be compared without
+downloading and parsing their reports
+"""
+
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from . import __version__
+from .encoding import _json_default
+
+
+SUMMARY_SUFFIX = ".summary.json"
+# Bumped when the layout of the sidecar changes
+SUMMARY_FORMAT = 1
+
+
+def summary_path(report_path: str) -> str:
+    """Sidecar of a report, e.g. reports/report.html -> reports/report.summary.json"""
+    return os.path.splitext(report_path)[0] + SUMMARY_SUFFIX
+
+
+def explanation_summary(
+    feature_names: List[str],
+    importance_data: Dict[str, Any],
+    outputs: Optional[Dict[str, Any]],
+    summaries: Optional[Dict[str, Any]],
+    n_rows: int,
+    base_values: Any,
+) -> Dict[str, Any]:
+    """
+    Content of the sidecar, from the aggregates embedded in the report
+
+    Args:
+        feature_names: Feature names
+        importance_data: importance_data of iter_payload
+        outputs: outputs of iter_payload, None for single-output explanations
+        summaries: Optional summary table, see summaries.summarize_features
+        n_rows: Number of explained rows
+        base_values: Base value(s) of the explanation
+
+    Returns:
+        Dict[str, Any]: {"format", "xaiflow_version", "rows", "feature_names",
+            "output_names", "base_values", "importance", "summaries"} with the importance
+            normalized per output (outputs x features, one row for single-output explanations)
+    """
+    return {
+        "format": SUMMARY_FORMAT,
+        "xaiflow_version": __version__,
+        "rows": int(n_rows),
+        "feature_names": list(feature_names),
+        "output_names": outputs["names"] if outputs is not None else None,
+        "base_values": np.atleast_1d(np.asarray(base_values, dtype=float)).tolist() if base_values is not None else [0],
+        "importance": outputs["importance"] if outputs is not None else [list(importance_data["values"])],
+        "summaries": summaries,
+    }
+
+
+def write_summary(path: str, summary: Dict[str, Any]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, default=_json_default)
+
+
+def read_summary(path: str) -> Dict[str, Any]:
+    """
+    Read a sidecar
+
+    Raises:
+        ValueError: If the sidecar was written in a newer format
+    """
+    with open(path, encoding="utf-8") as f:
+        summary = json.load(f)
+    if summary.get("format", 0) > SUMMARY_FORMAT:
+        raise ValueError(f"{path} was written by a newer xaiflow ({summary.get('xaiflow_version')}), please upgrade.")
+    return summary
+
+
+def compare_summaries(summaries: Dict[str, Dict[str, Any]], output: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Importance of every feature across runs, and how far it drifts
+
+    Features are matched by name, a feature missing from a run has no importance there.
+
+    Args:
+        summaries: Sidecar per run id, in the order of the comparison (the first run is the
+            reference)
+        output: Output compared for multi-output explanations, defaults to the last output
+            of every run (the one the reports start with)
+
+    Returns:
+        Dict[str, Any]: {"runs", "output", "feature_names", "importance" (features x runs,
+            None where missing), "mean", "spread" (max - min over the runs), "drift" (features x
+            runs, change from the reference run), "rows"}, features ordered by mean importance
+    """
+    runs = list(summaries)
+    if not runs:
+        raise ValueError("No summaries to compare.")
+    feature_names: List[str] = []
+    columns = []
+    for run_id in runs:
+        summary = summaries[run_id]
+        output_names = summary["output_names"]
+        row = -1
+        if output_names is not None and output is not None:
+            if output not in output_names:
+                raise ValueError(f"Run {run_id} has no output '{output}', its outputs are {output_names}.")
+            row = output_names.index(output)
+        columns.append(dict(zip(summary["feature_names"], summary["importance"][row])))
+        feature_names.extend(name for name in summary["feature_names"] if name not in feature_names)
+
+    importance = np.array([[column.get(name, np.nan) for column in columns] for name in feature_names], dtype=float)
+    importance = importance.reshape(len(feature_names), len(runs))
+    # every feature is in at least one run
+    mean = np.nanmean(importance, axis=1)
+    spread = np.nanmax(importance, axis=1) - np.nanmin(importance, axis=1)
+    drift = importance - importance[:, :1]
+    order = np.argsort(-mean, kind="stable")
+    return {
+        "runs": runs,
+        "output": output if output is not None else (summaries[runs[0]]["output_names"] or [None])[-1],
+        "feature_names": [feature_names[i] for i in order],
+        "importance": _json_table(importance[order]),
+        "mean": _json_table(mean[order]),
+        "spread": _json_table(spread[order]),
+        "drift": _json_table(drift[order]),
+        "rows": [summaries[run_id]["rows"] for run_id in runs],
+    }
+
+
+def _json_table(table: np.ndarray) -> List[Any]:
+    """Table as nested lists, NaN becomes None"""
+    return [_json_table(row) for row in table] if table.ndim > 1 else [
+        None if math.isnan(value) else float(value) for value in table
+    ]
+
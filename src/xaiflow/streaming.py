@@ -0,0 +1,337 @@
+"""
+Out-of-core input for explanations larger than memory
+Memory-mapped explanations and iterators of Explanation batches are read in a single pass
+of row blocks, which copies the matrices column-major to temporary memory-mapped files
+(the report is written column by column) and computes importance, summaries and scatter
+samples on the way, so neither a full matrix nor a full column is held in memory
+"""
+
+import os
+import struct
+import zipfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .encoding import _as_numeric
+from .groups import GroupIndex
+from .sampling import StreamingScatterSample, hash_uniform
+from .summaries import DEFAULT_BLOCK_BYTES, DEFAULT_QUANTILE_SAMPLE, RunningSummary, summarize_stream
+
+# Fixed part of a zip local file header, followed by the file name and the extra field
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def load_npz(path: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the arrays of an uncompressed .npz file (np.savez)
+
+    np.load ignores mmap_mode for .npz archives. Arrays stored without compression are
+    plain .npy files inside the zip, so they are mapped in place here.
+
+    Args:
+        path: Path of the .npz file
+
+    Returns:
+        Dict[str, np.ndarray]: Read-only np.memmap per array name
+
+    Raises:
+        ValueError: If an array is compressed (np.savez_compressed) or holds Python objects
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"'{name}' in {path} is compressed and cannot be memory-mapped, save it with np.savez.")
+            f.seek(info.header_offset)
+            fields = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+            f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + fields[-2] + fields[-1])
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"'{name}' in {path} holds Python objects and cannot be memory-mapped.")
+            if shape == ():
+                arrays[name] = np.load(path)[name]
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape, order="F" if fortran_order else "C"
+            )
+    return arrays
+
+
+def is_out_of_core(*arrays: Any) -> bool:
+    """Whether any of the arrays is memory-mapped, i.e. possibly larger than memory"""
+    return any(isinstance(array, np.memmap) for array in arrays)
+
+
+def block_rows_for(matrix: np.ndarray, max_block_bytes: int = DEFAULT_BLOCK_BYTES) -> int:
+    """Number of rows of matrix whose float64 copy stays below max_block_bytes"""
+    return max(1, max_block_bytes // (8 * max(1, int(np.prod(matrix.shape[1:])))))
+
+
+class StreamingAggregates:
+    """
+    Importance, summaries and scatter samples of an explanation that is read block by block
+
+    Call update with consecutive row blocks of the SHAP values. Memory is bounded by the
+    running summaries (see summaries.RunningSummary) and the scatter sample (see
+    sampling.StreamingScatterSample), independent of the number of rows.
+    """
+
+    def __init__(
+        self,
+        column_shape: Sequence[int],
+        group_index: Optional[GroupIndex] = None,
+        compute_summaries: bool = True,
+        max_points_per_feature: Optional[int] = None,
+        seed: int = 0,
+        sample_size: int = DEFAULT_QUANTILE_SAMPLE,
+    ):
+        """
+        Args:
+            column_shape: shap_values.shape[1:], (features,) or (features, outputs)
+            group_index: Optional group index, the summaries are computed per group as well
+            compute_summaries: Keep the running summaries (otherwise only the importance)
+            max_points_per_feature: Optional size of the scatter sample per column
+            seed: Seed of the percentile and scatter samples
+            sample_size: Values kept per column (and group) for the percentiles
+        """
+        self.column_shape = tuple(column_shape)
+        self.n_columns = int(np.prod(self.column_shape))
+        self.group_index = group_index
+        self.seed = seed
+        self.n_rows = 0
+        self.sum_abs = np.zeros(self.n_columns)
+        self.overall = RunningSummary(self.n_columns, sample_size) if compute_summaries else None
+        self.groups = None
+        if compute_summaries and group_index is not None:
+            self.groups = [RunningSummary(self.n_columns, sample_size) for _ in group_index.labels]
+        self.scatter = None
+        if max_points_per_feature is not None:
+            self.scatter = StreamingScatterSample(self.n_columns, max_points_per_feature, seed)
+
+    def update(self, shap_block: np.ndarray):
+        """
+        Add the rows following the previous block
+
+        Args:
+            shap_block: (rows x features) or (rows x features x outputs) SHAP values
+        """
+        n = len(shap_block)
+        block = np.asarray(shap_block, dtype=np.float64).reshape(n, self.n_columns)
+        rows = np.arange(self.n_rows, self.n_rows + n)
+        if self.group_index is not None and self.n_rows + n > len(self.group_index.codes):
+            raise ValueError("group_labels length must match the number of samples in shap_values.")
+        self.sum_abs += np.abs(block).sum(axis=0)
+        if self.overall is not None:
+            keys = hash_uniform(rows, self.n_columns, self.seed)
+            self.overall.update(block, keys)
+            if self.groups is not None:
+                codes = self.group_index.codes[rows]
+                for group in np.unique(codes):
+                    in_group = codes == group
+                    self.groups[group].update(block[in_group], keys[in_group])
+        if self.scatter is not None:
+            self.scatter.update(block)
+        self.n_rows += n
+
+    def importance(self) -> np.ndarray:
+        """Mean |SHAP| per column, shape column_shape"""
+        return (self.sum_abs / max(self.n_rows, 1)).reshape(self.column_shape)
+
+    def summaries(self, decimals: int = 6) -> Dict[str, Any]:
+        """Summary tables like summaries.summarize_features, requires compute_summaries"""
+        if self.group_index is None:
+            return summarize_stream(self.overall, decimals=decimals)
+        return summarize_stream(self.overall, self.groups, self.group_index.labels, self.group_index.counts, decimals)
+
+    def scatter_samples(self) -> Optional[List[np.ndarray]]:
+        """Row indices per column like sampling.sample_scatter_indices, None if nothing was sampled"""
+        return self.scatter.indices() if self.scatter is not None else None
+
+
+def iter_row_blocks(matrix: np.ndarray, block_rows: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """(first row, block) of consecutive row blocks, see block_rows_for"""
+    block_rows = block_rows or block_rows_for(matrix)
+    for start in range(0, matrix.shape[0], block_rows):
+        yield start, matrix[start:start + block_rows]
+
+
+def copy_column_major(
+    matrix: np.ndarray,
+    path: str,
+    on_block: Optional[Callable[[np.ndarray], None]] = None,
+    block_rows: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Copy a matrix to a Fortran-ordered .npy file block by block and memory-map it
+
+    Columns of a row-major memory map are strided over the whole file, so encoding the
+    report column by column would read the file once per column. After this copy every
+    column is contiguous on disk.
+
+    Args:
+        matrix: Matrix to copy, e.g. a row-major np.memmap
+        path: Path of the .npy file to create
+        on_block: Optional callback receiving every row block, e.g. StreamingAggregates.update
+        block_rows: Rows copied at a time, see block_rows_for
+
+    Returns:
+        np.ndarray: Read-only memory map of the copy
+    """
+    copy = np.lib.format.open_memmap(path, mode="w+", dtype=matrix.dtype, shape=matrix.shape, fortran_order=True)
+    for start, block in iter_row_blocks(matrix, block_rows):
+        block = np.asarray(block)
+        copy[start:start + len(block)] = block
+        if on_block is not None:
+            on_block(block)
+    copy.flush()
+    del copy
+    return np.load(path, mmap_mode="r")
+
+
+def stream_arrays(
+    shap_values: np.ndarray,
+    feature_values: Optional[np.ndarray],
+    directory: str,
+    aggregates: StreamingAggregates,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Single pass over memory-mapped SHAP values, feeding aggregates
+
+    Row-major memory maps are copied column-major to directory on the way. Numeric
+    memory-mapped feature values are copied as well, other feature values are kept.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: SHAP and feature values to write the report from
+    """
+    if shap_values.ndim > 1 and not shap_values.flags.f_contiguous:
+        shap_values = copy_column_major(shap_values, os.path.join(directory, "shap_values.npy"), aggregates.update)
+    else:
+        for _, block in iter_row_blocks(shap_values):
+            aggregates.update(block)
+    if isinstance(feature_values, np.memmap) and feature_values.ndim > 1 and not feature_values.flags.f_contiguous:
+        feature_values = copy_column_major(feature_values, os.path.join(directory, "feature_values.npy"))
+    return shap_values, feature_values
+
+
+class _CategoryCodes:
+    """Codes of a non-numeric feature column streamed in batches, in order of first appearance"""
+
+    def __init__(self, labels: Sequence[str] = ()):
+        self.codes: Dict[str, int] = {label: code for code, label in enumerate(labels)}
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        labels, first, inverse = np.unique(values.astype(str), return_index=True, return_inverse=True)
+        lookup = np.empty(len(labels), dtype=np.float64)
+        for i in np.argsort(first, kind="stable"):
+            lookup[i] = self.codes.setdefault(labels[i], len(self.codes))
+        return lookup[inverse.ravel()]
+
+    def encoding(self) -> Dict[int, str]:
+        return {code: label for label, code in self.codes.items()}
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.codes)
+
+
+def feature_codes(data: Any) -> List[Optional[_CategoryCodes]]:
+    """Per feature column of a first batch: None if it is numeric, empty category codes otherwise"""
+    categories = []
+    for j in range(np.shape(data)[1]):
+        column = _as_numeric(np.asarray(data[:, j]))
+        numeric = column.dtype != np.bool_ and np.issubdtype(column.dtype, np.number)
+        categories.append(None if numeric else _CategoryCodes())
+    return categories
+
+
+def encode_feature_block(data: Any, categories: Sequence[Optional[_CategoryCodes]]) -> np.ndarray:
+    """
+    Feature values of a batch as float64, dictionary-encoding the columns that have category codes
+
+    Args:
+        data: Feature values of the batch (rows x features)
+        categories: See feature_codes, codes of new labels are added on the way
+
+    Returns:
+        np.ndarray: (rows x features) float64
+    """
+    block = np.empty((len(data), len(categories)))
+    for j, codes in enumerate(categories):
+        column = np.asarray(data[:, j])
+        if codes is not None:
+            block[:, j] = codes.encode(_as_numeric(column))
+            continue
+        column = _as_numeric(column)
+        if column.dtype == object or column.dtype.kind in "US":
+            raise ValueError(f"Feature column {j} is numeric in the first batch but not in a later one.")
+        block[:, j] = column
+    return block
+
+
+def spill_batches(
+    batches: Iterable[Any],
+    directory: str,
+    aggregates: StreamingAggregates,
+) -> Tuple[np.ndarray, Optional[np.ndarray], Dict[int, Dict[int, str]]]:
+    """
+    Single pass over an iterator of Explanation batches, feeding aggregates
+
+    The batches are appended to row-major files in directory and copied column-major at
+    the end, only one batch is held in memory at a time. Feature values are stored as
+    float64. Non-numeric and boolean feature columns (decided by the first batch) are
+    dictionary-encoded with codes in order of first appearance.
+
+    Args:
+        batches: Iterable of shap.Explanation with the same features (and outputs)
+        directory: Directory for the temporary files
+        aggregates: Aggregates updated with every batch
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray], Dict[int, Dict[int, str]]]: Memory-mapped SHAP
+            and feature values, and {feature index: {code: label}} of the dictionary-encoded columns
+    """
+    shap_path = os.path.join(directory, "shap_values.rows")
+    feature_path = os.path.join(directory, "feature_values.rows")
+    column_shape, shap_dtype, n_features = None, None, None
+    categories: List[Optional[_CategoryCodes]] = []
+    n_rows = 0
+    with open(shap_path, "wb") as shap_file, open(feature_path, "wb") as feature_file:
+        for batch in batches:
+            values = np.asarray(getattr(batch, "values", None))
+            if values.ndim < 2:
+                raise ValueError("Every batch must be a shap.Explanation with values of shape samples x features (x outputs).")
+            if column_shape is None:
+                column_shape, shap_dtype = values.shape[1:], values.dtype
+            elif values.shape[1:] != column_shape:
+                raise ValueError(f"All batches must have the same features (and outputs), expected {column_shape} got {values.shape[1:]}.")
+            shap_file.write(np.ascontiguousarray(values, dtype=shap_dtype).data)
+            aggregates.update(values)
+
+            data = getattr(batch, "data", None)
+            if n_features is None:
+                categories = [] if data is None else feature_codes(data)
+                n_features = len(categories)
+            if n_features > 0:
+                if data is None or np.shape(data) != (len(values), n_features):
+                    raise ValueError("Every batch must have feature values (data) of shape samples x features.")
+                feature_file.write(encode_feature_block(data, categories).data)
+            n_rows += len(values)
+
+    if n_rows == 0:
+        raise ValueError("The Explanation batches hold no rows.")
+    shap_values = copy_column_major(np.memmap(shap_path, dtype=shap_dtype, mode="r", shape=(n_rows,) + column_shape),
+                                    os.path.join(directory, "shap_values.npy"))
+    feature_values = None
+    if n_features > 0:
+        feature_values = copy_column_major(np.memmap(feature_path, dtype=np.float64, mode="r", shape=(n_rows, n_features)),
+                                           os.path.join(directory, "feature_values.npy"))
+    os.unlink(shap_path)
+    os.unlink(feature_path)
+    encodings = {j: codes.encoding() for j, codes in enumerate(categories) if codes is not None}
+    return shap_values, feature_values, encodings
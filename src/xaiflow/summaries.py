@@ -0,0 +1,267 @@
+"""
+Aggregates over the SHAP and feature matrices that are computed in Python before rendering
+"""
+
+import itertools
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .encoding import DEFAULT_BLOCK_ROWS, iter_columns
+from .groups import GroupIndex
+from .sampling import keep_smallest
+
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Fields of ExplanationSummary (types/entities.ts) computed per feature, in table order
+SUMMARY_FIELDS = (
+    ("mean", "std", "min", "max")
+    + tuple(f"percentile_{p}" for p in PERCENTILES)
+    + ("importance",)
+)
+
+# Upper bound for the float64 copy of a block of columns while computing percentiles
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def mean_abs(matrix: np.ndarray, block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+    """
+    Column-wise mean of |matrix|, computed block by block so no full size copy is made
+
+    Args:
+        matrix: 2D array (samples x features), or (samples x features x outputs) for
+            multi-output explanations
+        block_rows: Number of rows processed at a time
+
+    Returns:
+        np.ndarray: One value per column, shape matrix.shape[1:]
+    """
+    total = np.zeros(matrix.shape[1:], dtype=np.float64)
+    for start in range(0, matrix.shape[0], block_rows):
+        total += np.abs(matrix[start:start + block_rows]).sum(axis=0, dtype=np.float64)
+    return total / max(matrix.shape[0], 1)
+
+
+def summarize(
+    matrix: np.ndarray,
+    rows: Optional[np.ndarray] = None,
+    max_block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> np.ndarray:
+    """
+    Compute all SUMMARY_FIELDS for every column in one vectorized pass per column block
+
+    Args:
+        matrix: 2D array of SHAP values (samples x features). The trailing axes of a
+            multi-output tensor are flattened in C order, see encoding.iter_columns
+        rows: Optional row indices to restrict the summary to (e.g. one group)
+        max_block_bytes: Maximum size of the float64 copy of a column block
+
+    Returns:
+        np.ndarray: (len(SUMMARY_FIELDS) x columns), NaN for empty selections
+    """
+    n_rows = matrix.shape[0] if rows is None else len(rows)
+    n_features = int(np.prod(matrix.shape[1:]))
+    table = np.full((len(SUMMARY_FIELDS), n_features), np.nan)
+    if n_rows == 0:
+        return table
+
+    # a multi-output tensor is read column by column, reshaping it would copy a non-contiguous one in full
+    tensor_columns = iter_columns(matrix) if matrix.ndim > 2 else None
+    columns_per_block = max(1, max_block_bytes // (8 * n_rows))
+    for start in range(0, n_features, columns_per_block):
+        columns = slice(start, min(start + columns_per_block, n_features))
+        if tensor_columns is None:
+            block = matrix[:, columns] if rows is None else matrix[rows, columns]
+            block = np.asarray(block, dtype=np.float64)
+        else:
+            block = np.empty((n_rows, columns.stop - start))
+            for k, column in enumerate(itertools.islice(tensor_columns, columns.stop - start)):
+                block[:, k] = column if rows is None else column[rows]
+        table[0, columns] = block.mean(axis=0)
+        table[1, columns] = block.std(axis=0)
+        table[2, columns] = block.min(axis=0)
+        table[3, columns] = block.max(axis=0)
+        table[4:4 + len(PERCENTILES), columns] = np.percentile(block, PERCENTILES, axis=0)
+        table[-1, columns] = np.abs(block).mean(axis=0)
+    return table
+
+
+def _to_json_table(table: np.ndarray, decimals: int) -> List[Any]:
+    """Round a table and replace non-finite values with None for embedding"""
+    rounded = np.round(table, decimals).astype(object)
+    rounded[~np.isfinite(table)] = None
+    return rounded.tolist()
+
+
+def summarize_features(
+    shap_values: np.ndarray,
+    group_labels: Optional[Sequence[Any] | GroupIndex] = None,
+    decimals: int = 6,
+    max_block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Dict[str, Any]:
+    """
+    Per-feature summary table, overall and per group, for embedding in the report
+
+    Args:
+        shap_values: SHAP values matrix (samples x features), or a multi-output tensor
+            (samples x features x outputs) whose tables have one column per feature and output
+        group_labels: Optional group label per sample, or a prebuilt GroupIndex
+        decimals: Number of decimals kept in the embedded table
+        max_block_bytes: See summarize
+
+    Returns:
+        Dict[str, Any]: {"fields": [...], "overall": fields x features,
+        "groups": {"labels": [...], "counts": [...], "values": groups x fields x features}}
+    """
+    summaries = {
+        "fields": list(SUMMARY_FIELDS),
+        "overall": _to_json_table(summarize(shap_values, max_block_bytes=max_block_bytes), decimals),
+        "groups": None,
+    }
+    if group_labels is not None and len(group_labels) > 0:
+        group_index = group_labels if isinstance(group_labels, GroupIndex) else GroupIndex(group_labels)
+        summaries["groups"] = {
+            "labels": group_index.labels,
+            "counts": group_index.counts,
+            "values": [
+                _to_json_table(summarize(shap_values, group_index.rows(group), max_block_bytes), decimals)
+                for group in range(len(group_index))
+            ],
+        }
+    return summaries
+
+
+# Values kept per column (and group) to estimate the percentiles of streamed explanations
+DEFAULT_QUANTILE_SAMPLE = 4096
+
+
+class RunningSummary:
+    """
+    SUMMARY_FIELDS of a matrix that is read block by block, e.g. a memory-mapped explanation
+
+    Count, mean, std (merged with Chan's parallel update), min, max and mean |SHAP| are
+    exact. Percentiles are computed from a uniform sample of sample_size values per column
+    (the values with the smallest sampling.hash_uniform keys), so they are exact as long
+    as there are at most sample_size rows and approximate beyond. Memory is
+    O(sample_size * columns) independent of the number of rows.
+    """
+
+    def __init__(self, n_columns: int, sample_size: int = DEFAULT_QUANTILE_SAMPLE):
+        self.sample_size = sample_size
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+        self.sum_abs = np.zeros(n_columns)
+        self.sample_keys = np.empty((0, n_columns))
+        self.sample_values = np.empty((0, n_columns))
+
+    def update(self, block: np.ndarray, keys: np.ndarray):
+        """
+        Add rows
+
+        Args:
+            block: (rows x columns) values
+            keys: (rows x columns) sampling keys of the same cells, see sampling.hash_uniform
+        """
+        n = len(block)
+        if n == 0:
+            return
+        block = np.asarray(block, dtype=np.float64)
+        block_mean = block.mean(axis=0)
+        self._add_moments(n, block_mean, ((block - block_mean) ** 2).sum(axis=0))
+        self.min = np.fmin(self.min, block.min(axis=0))
+        self.max = np.fmax(self.max, block.max(axis=0))
+        self.sum_abs += np.abs(block).sum(axis=0)
+        self._add_sample(keys, block)
+
+    def merge(self, other: "RunningSummary"):
+        """Add the rows summarized by other (disjoint from the rows added so far)"""
+        if other.count == 0:
+            return
+        self._add_moments(other.count, other.mean, other.m2)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.sum_abs += other.sum_abs
+        self._add_sample(other.sample_keys, other.sample_values)
+
+    def _add_moments(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        """Chan's parallel update of count, mean and m2"""
+        delta = mean - self.mean
+        total = self.count + count
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def _add_sample(self, keys: np.ndarray, values: np.ndarray):
+        self.sample_keys, self.sample_values = keep_smallest(
+            np.concatenate([self.sample_keys, keys]), np.concatenate([self.sample_values, values]), self.sample_size
+        )
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays to restore the summary from with from_state, e.g. for np.savez"""
+        return {
+            "count": np.asarray(self.count), "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max,
+            "sum_abs": self.sum_abs, "sample_keys": self.sample_keys, "sample_values": self.sample_values,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray], sample_size: int = DEFAULT_QUANTILE_SAMPLE) -> "RunningSummary":
+        """Summary saved with state"""
+        summary = cls(len(state["mean"]), sample_size)
+        summary.count = int(state["count"])
+        for name in ("mean", "m2", "min", "max", "sum_abs", "sample_keys", "sample_values"):
+            setattr(summary, name, np.array(state[name], dtype=np.float64))
+        return summary
+
+    def table(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (len(SUMMARY_FIELDS) x columns) like summarize, NaN if no rows were added
+        """
+        table = np.full((len(SUMMARY_FIELDS), len(self.mean)), np.nan)
+        if self.count == 0:
+            return table
+        table[0] = self.mean
+        table[1] = np.sqrt(self.m2 / self.count)
+        table[2] = self.min
+        table[3] = self.max
+        table[4:4 + len(PERCENTILES)] = np.percentile(self.sample_values, PERCENTILES, axis=0)
+        table[-1] = self.sum_abs / self.count
+        return table
+
+
+def summarize_stream(
+    overall: RunningSummary,
+    groups: Optional[Sequence[RunningSummary]] = None,
+    labels: Optional[Sequence[str]] = None,
+    counts: Optional[Sequence[int]] = None,
+    decimals: int = 6,
+) -> Dict[str, Any]:
+    """
+    The summaries of summarize_features from running summaries
+
+    Args:
+        overall: Summary of all rows
+        groups: Optional summary per group, in the order of labels
+        labels: Labels of the groups, e.g. GroupIndex.labels
+        counts: Number of rows per group
+        decimals: Number of decimals kept in the embedded table
+
+    Returns:
+        Dict[str, Any]: Same layout as summarize_features
+    """
+    summaries = {
+        "fields": list(SUMMARY_FIELDS),
+        "overall": _to_json_table(overall.table(), decimals),
+        "groups": None,
+    }
+    if groups is not None and labels is not None:
+        summaries["groups"] = {
+            "labels": list(labels),
+            "counts": [int(count) for count in counts],
+            "values": [_to_json_table(summary.table(), decimals) for summary in groups],
+        }
+    return summaries
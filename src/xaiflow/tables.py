@@ -0,0 +1,207 @@
+"""
+Feature values and group labels from pandas DataFrames and Arrow tables
+Names, categorical dictionaries and dtypes are taken from the schema and numeric column
+buffers are read in place, instead of converting the table to an object array first
+"""
+
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .encoding import BOOL_CATEGORIES
+
+
+# pandas.api.types.infer_dtype kinds of object columns holding only numbers
+_NUMERIC_KINDS = ("integer", "floating", "mixed-integer-float", "decimal", "empty")
+
+
+def is_table(obj: Any) -> bool:
+    """
+    isinstance(obj, (pandas.DataFrame, pyarrow.Table, pyarrow.RecordBatch)) without importing them
+
+    If pandas or pyarrow has never been imported in this process, obj cannot be one of its tables.
+    """
+    pandas = sys.modules.get("pandas")
+    pyarrow = sys.modules.get("pyarrow")
+    return (pandas is not None and isinstance(obj, pandas.DataFrame)) or (
+        pyarrow is not None and isinstance(obj, (pyarrow.Table, pyarrow.RecordBatch))
+    )
+
+
+def _is_column(obj: Any) -> bool:
+    """A pandas Series or Categorical, or an Arrow (chunked) array"""
+    pandas = sys.modules.get("pandas")
+    pyarrow = sys.modules.get("pyarrow")
+    return (pandas is not None and isinstance(obj, (pandas.Series, pandas.Categorical))) or (
+        pyarrow is not None and isinstance(obj, (pyarrow.Array, pyarrow.ChunkedArray))
+    )
+
+
+def _arrow_column(array: Any) -> Tuple[Optional[List[str]], np.ndarray]:
+    """
+    Categories and values (or dictionary codes) of an Arrow array
+
+    Numeric arrays without nulls are returned as views of their buffer, nulls become NaN.
+    Dictionary arrays keep their dictionary, strings and other types are dictionary-encoded
+    by hashing.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(array, pa.ChunkedArray):
+        if pa.types.is_dictionary(array.type):
+            array = array.unify_dictionaries()
+        array = array.chunk(0) if array.num_chunks == 1 else array.combine_chunks()
+    kind = array.type
+    if pa.types.is_boolean(kind):
+        if array.null_count:
+            array = pc.cast(array, pa.float64())
+        return list(BOOL_CATEGORIES), array.to_numpy(zero_copy_only=False)
+    if pa.types.is_integer(kind) or pa.types.is_floating(kind):
+        return None, array.to_numpy(zero_copy_only=False)
+    if pa.types.is_decimal(kind):
+        return None, pc.cast(array, pa.float64()).to_numpy(zero_copy_only=False)
+    if not pa.types.is_dictionary(kind):
+        if not (pa.types.is_string(kind) or pa.types.is_large_string(kind)):
+            array = pc.cast(array, pa.string())
+        array = pc.dictionary_encode(array)
+    return [str(label) for label in array.dictionary.to_pylist()], array.indices.to_numpy(zero_copy_only=False)
+
+
+def _pandas_column(column: Any) -> Tuple[Optional[List[str]], np.ndarray]:
+    """
+    Categories and values (or dictionary codes) of a pandas Series or Categorical
+
+    Numeric numpy-backed columns are returned as views, Arrow-backed ones go through
+    _arrow_column. Categoricals keep their categories, object columns holding only numbers
+    become float64 and other object columns are factorized (hashing, sorted categories).
+    """
+    import pandas as pd
+
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes = column.codes if isinstance(column, pd.Categorical) else column.cat.codes.to_numpy()
+        return [str(label) for label in dtype.categories], np.asarray(codes)
+    if isinstance(dtype, np.dtype):
+        if dtype == np.bool_:
+            return list(BOOL_CATEGORIES), column.to_numpy(copy=False)
+        if dtype.kind in "iuf":
+            return None, column.to_numpy(copy=False)
+    elif hasattr(column.array, "__arrow_array__") and (
+        isinstance(dtype, pd.ArrowDtype) or getattr(dtype, "storage", None) == "pyarrow"
+    ):
+        return _arrow_column(column.array.__arrow_array__())
+    elif dtype.kind == "b":
+        return list(BOOL_CATEGORIES), column.to_numpy(dtype=np.float64, na_value=np.nan)
+    elif dtype.kind in "iuf":
+        return None, column.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    if kind in _NUMERIC_KINDS:
+        return None, column.to_numpy(dtype=np.float64, na_value=np.nan)
+    if kind == "boolean":
+        return list(BOOL_CATEGORIES), column.to_numpy(dtype=np.float64, na_value=np.nan)
+    if kind != "string":
+        column = column.astype(str)
+    codes, categories = pd.factorize(column, sort=True)
+    return [str(label) for label in categories], codes
+
+
+def column_values(column: Any) -> Tuple[Optional[List[str]], np.ndarray]:
+    """
+    Categories and values of a table column, see _pandas_column and _arrow_column
+
+    Returns:
+        Tuple[Optional[List[str]], np.ndarray]: (categories, codes) for categorical, boolean
+            and string columns, where missing values are NaN or a negative code, and
+            (None, values) for numeric columns
+    """
+    if type(column).__module__.startswith("pandas"):
+        return _pandas_column(column)
+    return _arrow_column(column)
+
+
+def _missing(codes: np.ndarray) -> np.ndarray:
+    """Rows without a category: NaN or negative codes"""
+    if codes.dtype.kind == "f":
+        return np.isnan(codes)
+    if codes.dtype.kind == "i":
+        return codes < 0
+    return np.zeros(len(codes), dtype=bool)
+
+
+def table_features(table: Any) -> Tuple[List[str], np.ndarray, Dict[int, Dict[int, str]]]:
+    """
+    Feature matrix of a pandas DataFrame or an Arrow table
+
+    The matrix is column-major, every column is copied once from its buffer straight into
+    it. A DataFrame of a single numeric dtype is returned as a view of its block without
+    copying. Categorical, boolean and string columns are stored as their dictionary codes
+    (missing values become NaN), like the feature values of Explanation batches
+    (see streaming.spill_batches).
+
+    Args:
+        table: pandas.DataFrame, pyarrow.Table or pyarrow.RecordBatch (rows x features)
+
+    Returns:
+        Tuple[List[str], np.ndarray, Dict[int, Dict[int, str]]]: Column names, the
+            (rows x features) matrix, and {feature index: {code: label}} of the
+            dictionary-encoded columns
+    """
+    if type(table).__module__.startswith("pandas"):
+        names = [str(name) for name in table.columns]
+        columns = [column_values(table.iloc[:, j]) for j in range(table.shape[1])]
+    else:
+        names = list(table.column_names)
+        columns = [column_values(column) for column in table.columns]
+    n_rows = len(table)
+
+    encodings = {
+        j: dict(enumerate(categories)) for j, (categories, _) in enumerate(columns) if categories is not None
+    }
+    dtypes = {values.dtype for categories, values in columns if categories is None}
+    if not encodings and len(dtypes) == 1 and names and type(table).__module__.startswith("pandas") and all(
+        isinstance(dtype, np.dtype) for dtype in table.dtypes
+    ):
+        # a view of the transposed block of a consolidated frame, already column-major
+        return names, table.to_numpy(copy=False), encodings
+
+    # codes up to 2 ** 24 are exact in float32
+    dtype = np.result_type(*dtypes, *([np.float32] if encodings else [])) if columns else np.float64
+    matrix = np.empty((n_rows, len(columns)), dtype=dtype, order="F")
+    for j, (categories, values) in enumerate(columns):
+        matrix[:, j] = values
+        if categories is not None:
+            missing = _missing(values)
+            if missing.any():
+                matrix[missing, j] = np.nan
+    return names, matrix, encodings
+
+
+def label_codes(group_labels: Any) -> Optional[Tuple[List[str], np.ndarray]]:
+    """
+    Sorted labels and group codes of pandas or Arrow group labels, without sorting the rows
+
+    Categories without rows are dropped and missing labels become the label "nan".
+
+    Args:
+        group_labels: Any sequence of group labels
+
+    Returns:
+        Optional[Tuple[List[str], np.ndarray]]: (labels, codes) as in groups.GroupIndex, None
+            if the labels are not a pandas or Arrow column or are numeric
+    """
+    if not _is_column(group_labels):
+        return None
+    categories, codes = column_values(group_labels)
+    if categories is None:
+        return None
+    labels = np.array(categories + ["nan"], dtype=object)
+    missing = _missing(codes)
+    codes = np.where(missing, len(categories), codes).astype(np.intp) if missing.any() else codes.astype(np.intp)
+    used = np.flatnonzero(np.bincount(codes, minlength=len(labels)))
+    order = used[np.argsort(labels[used].astype(str), kind="stable")]
+    lookup = np.empty(len(labels), dtype=np.intp)
+    lookup[order] = np.arange(len(order))
+    return labels[order].tolist(), lookup[codes]
@@ -0,0 +1,398 @@
+(function () {
+'use strict';
+
+function dataEngine(scope) {
+    let shap = [];
+    let features = [];
+    let samples = null;
+    let codes = null;
+    let order = null;
+    let offsets = null;
+    let density = null;
+    let index = null;
+    let clusterRows = null;
+    let nOutputs = 1;
+    let nRows = 0;
+    let lastList = null;
+    function isTyped(column) {
+        return ArrayBuffer.isView(column);
+    }
+    function groupRows(group) {
+        if (group < 0 || !order || !offsets) {
+            return null;
+        }
+        const start = offsets[group];
+        const end = offsets[group + 1];
+        return isTyped(order) ? order.subarray(start, end) : order.slice(start, end);
+    }
+    function gather(column, rows) {
+        if (!rows) {
+            return isTyped(column) ? column.slice() : column.slice();
+        }
+        const out = isTyped(column) ? new column.constructor(rows.length) : new Array(rows.length);
+        for(let i = 0; i < rows.length; i++){
+            out[i] = column[rows[i]];
+        }
+        return out;
+    }
+    function selectionSize(group) {
+        return group >= 0 && offsets ? offsets[group + 1] - offsets[group] : nRows;
+    }
+    function densityGrid(column, group) {
+        const entry = density ? density.columns[column] : null;
+        if (!density || !entry) {
+            return null;
+        }
+        const cells = density.bins * density.bins;
+        const nGroups = Math.floor(entry.counts.length / cells);
+        const counts = new Float64Array(cells);
+        for(let g = 0; g < nGroups; g++){
+            if (group >= 0 && nGroups > 1 && g !== group) {
+                continue;
+            }
+            for(let c = 0, i = g * cells; c < cells; c++, i++){
+                counts[c] += entry.counts[i];
+            }
+        }
+        let max = 0;
+        for(let c = 0; c < cells; c++){
+            max = counts[c] > max ? counts[c] : max;
+        }
+        return {
+            x: entry.x,
+            y: entry.y,
+            bins: density.bins,
+            counts: counts,
+            max: max
+        };
+    }
+    function scatter(query) {
+        const column = query.feature * nOutputs + query.output;
+        const y = shap[column];
+        const x = features[query.feature];
+        const total = selectionSize(query.group);
+        const grid = densityGrid(column, query.group);
+        if (!y || !x || y.length === 0) {
+            return {
+                x: new Float64Array(0),
+                y: new Float64Array(0),
+                total: total,
+                density: grid
+            };
+        }
+        const groupSelection = groupRows(query.group);
+        let rows = groupSelection;
+        const sampled = samples ? samples[column] : null;
+        if (sampled && sampled.length > 0) {
+            rows = sampled;
+            if (groupSelection && codes) {
+                const kept = new Int32Array(sampled.length);
+                let count = 0;
+                for(let i = 0; i < sampled.length; i++){
+                    if (codes[sampled[i]] === query.group) {
+                        kept[count++] = sampled[i];
+                    }
+                }
+                rows = kept.subarray(0, count);
+            }
+        }
+        return {
+            x: gather(x, rows),
+            y: gather(y, rows),
+            total: total,
+            density: grid
+        };
+    }
+    function positionOf(row, group) {
+        const selection = groupRows(group);
+        if (!selection) {
+            return row;
+        }
+        let low = 0;
+        let high = selection.length - 1;
+        while(low < high){
+            const middle = low + high >> 1;
+            if (selection[middle] < row) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+    function listPage(rows, group) {
+        const positions = new Int32Array(rows.length);
+        for(let i = 0; i < rows.length; i++){
+            positions[i] = positionOf(rows[i], group);
+        }
+        return {
+            rows: Int32Array.from(rows),
+            positions: positions,
+            matches: rows.length
+        };
+    }
+    function extremes(lists, column, group, top) {
+        const k = index.k;
+        const list = lists[column];
+        if (!list) {
+            return [];
+        }
+        const start = (index.groups !== null && group >= 0 ? 1 + group : 0) * 2 * k + (top ? 0 : k);
+        const rows = [];
+        for(let i = start; i < start + k; i++){
+            if (list[i] >= 0) {
+                rows.push(list[i]);
+            }
+        }
+        return rows;
+    }
+    function clusterLists(clusters, nClusters) {
+        const offsets = new Int32Array(nClusters + 1);
+        for(let i = 0; i < clusters.length; i++){
+            offsets[clusters[i] + 1]++;
+        }
+        for(let c = 0; c < nClusters; c++){
+            offsets[c + 1] += offsets[c];
+        }
+        const next = offsets.slice(0, nClusters);
+        const order = new Int32Array(clusters.length);
+        for(let i = 0; i < clusters.length; i++){
+            order[next[clusters[i]]++] = i;
+        }
+        return {
+            order: order,
+            offsets: offsets
+        };
+    }
+    function similar(row, group, k) {
+        const sim = index && index.similar;
+        if (!sim || row < 0 || row >= sim.clusters.length) {
+            return [];
+        }
+        const nColumns = sim.codes.length;
+        const nClusters = sim.centroids.length;
+        if (!clusterRows) {
+            clusterRows = clusterLists(sim.clusters, nClusters);
+        }
+        const steps = new Float64Array(nColumns);
+        const query = new Float64Array(nColumns);
+        for(let d = 0; d < nColumns; d++){
+            steps[d] = (sim.ranges[d][1] - sim.ranges[d][0]) / 255;
+            query[d] = sim.ranges[d][0] + sim.codes[d][row] * steps[d];
+        }
+        const clusterDistances = sim.centroids.map((centroid, c)=>{
+            let distance = 0;
+            for(let d = 0; d < nColumns; d++){
+                distance += (centroid[d] - query[d]) * (centroid[d] - query[d]);
+            }
+            return {
+                cluster: c,
+                distance: distance
+            };
+        });
+        clusterDistances.sort((a, b)=>a.distance - b.distance || a.cluster - b.cluster);
+        const minProbes = 4;
+        const nearest = [];
+        for(let probe = 0; probe < nClusters; probe++){
+            if (probe >= minProbes && nearest.length >= k) {
+                break;
+            }
+            const cluster = clusterDistances[probe].cluster;
+            for(let i = clusterRows.offsets[cluster]; i < clusterRows.offsets[cluster + 1]; i++){
+                const candidate = clusterRows.order[i];
+                if (candidate === row || group >= 0 && codes && codes[candidate] !== group) {
+                    continue;
+                }
+                let distance = 0;
+                for(let d = 0; d < nColumns; d++){
+                    const difference = (sim.codes[d][candidate] - sim.codes[d][row]) * steps[d];
+                    distance += difference * difference;
+                }
+                if (nearest.length < k || distance < nearest[nearest.length - 1].distance) {
+                    let at = nearest.length;
+                    while(at > 0 && (nearest[at - 1].distance > distance || nearest[at - 1].distance === distance && nearest[at - 1].row > candidate)){
+                        at--;
+                    }
+                    nearest.splice(at, 0, {
+                        row: candidate,
+                        distance: distance
+                    });
+                    if (nearest.length > k) {
+                        nearest.pop();
+                    }
+                }
+            }
+        }
+        return nearest.map((entry)=>entry.row);
+    }
+    function jump(query) {
+        if (!index) {
+            return listPage([], query.group);
+        }
+        let rows = [];
+        if (query.list === 'shap-top' || query.list === 'shap-bottom') {
+            rows = query.feature >= 0 ? extremes(index.extremes, query.feature * nOutputs + query.output, query.group, query.list === 'shap-top') : [];
+        } else if (query.list === 'prediction-top' || query.list === 'prediction-bottom') {
+            rows = extremes(index.predictions, query.output, query.group, query.list === 'prediction-top');
+        } else {
+            rows = similar(query.row, query.group, index.k);
+        }
+        return listPage(rows, query.group);
+    }
+    function observations(query) {
+        const selection = groupRows(query.group);
+        const count = selectionSize(query.group);
+        const column = query.sort !== 'index' && query.feature >= 0 ? shap[query.feature * nOutputs + query.output] : null;
+        const sorted = column && column.length > 0 ? query.sort : 'index';
+        const key = [
+            query.group,
+            query.filter,
+            sorted,
+            sorted === 'index' ? -1 : query.feature,
+            query.output,
+            selection ? 1 : 0
+        ].join('|');
+        if (!lastList || lastList.key !== key) {
+            const filter = query.filter.toLowerCase();
+            let positions = new Int32Array(count);
+            let matches = 0;
+            for(let position = 0; position < count; position++){
+                if (!filter || ('#' + (position + 1)).includes(filter) || String(position).includes(filter)) {
+                    positions[matches++] = position;
+                }
+            }
+            positions = positions.slice(0, matches);
+            if (column && sorted !== 'index') {
+                const sign = sorted === 'shap-desc' ? -1 : 1;
+                const values = new Float64Array(count);
+                for(let position = 0; position < count; position++){
+                    values[position] = Number(column[selection ? selection[position] : position]);
+                }
+                positions.sort((a, b)=>sign * (values[a] - values[b]) || a - b);
+            }
+            lastList = {
+                key: key,
+                positions: positions
+            };
+        }
+        const page = lastList.positions.slice(query.offset, query.offset + query.limit);
+        const rows = new Int32Array(page.length);
+        for(let i = 0; i < page.length; i++){
+            rows[i] = selection ? selection[page[i]] : page[i];
+        }
+        return {
+            rows: rows,
+            positions: page,
+            matches: lastList.positions.length
+        };
+    }
+    function waterfall(query) {
+        const nFeatures = query.values ? query.values.features.length : Math.floor(shap.length / nOutputs);
+        const values = new Float64Array(nFeatures);
+        const featureRow = new Array(nFeatures);
+        const ranges = new Float64Array(2 * nFeatures);
+        let cumulative = query.base;
+        for(let j = 0; j < nFeatures; j++){
+            const column = j * nOutputs + query.output;
+            if (query.values) {
+                values[j] = Number(query.values.shap[column]);
+                featureRow[j] = query.values.features[j];
+            } else {
+                values[j] = Number(shap[column][query.row]);
+                featureRow[j] = features[j] ? features[j][query.row] : undefined;
+            }
+            ranges[2 * j] = cumulative;
+            cumulative += values[j];
+            ranges[2 * j + 1] = cumulative;
+        }
+        return {
+            shap: values,
+            features: featureRow,
+            ranges: ranges,
+            base: query.base,
+            prediction: cumulative
+        };
+    }
+    function transferables(result, buffers = []) {
+        if (result && typeof result === 'object') {
+            Object.keys(result).forEach((name)=>{
+                const value = result[name];
+                if (ArrayBuffer.isView(value)) {
+                    if (buffers.indexOf(value.buffer) < 0) {
+                        buffers.push(value.buffer);
+                    }
+                } else if (value && typeof value === 'object' && !Array.isArray(value)) {
+                    transferables(value, buffers);
+                }
+            });
+        }
+        return buffers;
+    }
+    const handlers = {
+        init (message) {
+            const data = message.data;
+            shap = data.shapValues;
+            features = data.featureValues;
+            samples = data.sampleIndices;
+            codes = data.groupCodes;
+            order = data.groupOrder;
+            offsets = data.groupOffsets;
+            density = data.density;
+            index = data.observationIndex;
+            clusterRows = null;
+            nOutputs = data.nOutputs;
+            nRows = data.nRows;
+            lastList = null;
+            return null;
+        },
+        columns (message) {
+            const targets = {
+                shap_values: shap,
+                feature_values: features,
+                scatter_samples: samples
+            };
+            Object.keys(message.columns).forEach((matrix)=>{
+                const target = targets[matrix];
+                if (target) {
+                    Object.keys(message.columns[matrix]).forEach((index)=>{
+                        target[Number(index)] = message.columns[matrix][index];
+                    });
+                }
+            });
+            lastList = null;
+            return null;
+        },
+        groups (message) {
+            codes = message.codes;
+            order = message.order;
+            lastList = null;
+            return null;
+        },
+        scatter: scatter,
+        observations: observations,
+        jump: jump,
+        waterfall: waterfall
+    };
+    scope.onmessage = (event)=>{
+        const message = event.data;
+        try {
+            const result = handlers[message.type](message);
+            scope.postMessage({
+                id: message.id,
+                result: result
+            }, transferables(result));
+        } catch (error) {
+            scope.postMessage({
+                id: message.id,
+                error: String(error && error.message ? error.message : error)
+            });
+        }
+    };
+    scope.postMessage({
+        type: 'ready'
+    });
+}
+
+dataEngine(self);
+
+})();
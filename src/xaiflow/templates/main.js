@@ -3,6 +3,7 @@ import ChartManager from './components/ChartManager.svelte';
 import ScatterShapValues from './components/ScatterShapValues.svelte';
 import DeepDiveManager from './components/DeepDiveManager.svelte';
 import DeepDiveChart from './components/DeepDiveChart.svelte';
+import { decodePayload } from './utils/payload';
 
 // Export components for use in HTML
 window.ImportanceChart2 = ImportanceChart2;
@@ -10,3 +11,6 @@ window.ChartManager = ChartManager;
 window.ScatterShapValues = ScatterShapValues;
 window.DeepDiveManager = DeepDiveManager;
 window.DeepDiveChart = DeepDiveChart;
+
+// Decoder for the data block embedded in report.html
+window.decodeXaiflowPayload = decodePayload;
@@ -0,0 +1,604 @@
+// Data engine of the report: owns the decoded columns and answers the slice, filter, sort and
+// waterfall queries of the components, so the UI thread only receives render-ready data.
+// It runs in a Web Worker started from assets/worker.js, a separate rollup entry point
+// (templates/worker.ts) that report.html embeds next to bundle.js. Where the report embeds no
+// worker or a worker cannot be started (no Worker, blocked blob: URLs) the same code runs on
+// the UI thread behind the same asynchronous interface.
+
+import type { Column, Density, ObservationIndex } from './payload';
+
+// Everything the engine owns, the typed arrays are transferred to the worker (not copied)
+export interface EngineData {
+  shapValues: Column[]; // feature-major: column j * nOutputs + o
+  featureValues: Column[];
+  sampleIndices: Column[] | null; // scatter sample per SHAP column
+  groupCodes: Column | null;
+  groupOrder: Column | null;
+  groupOffsets: number[] | null;
+  density: Density | null;
+  observationIndex: ObservationIndex | null;
+  nOutputs: number;
+  nRows: number;
+}
+
+// Points of the scatter plot of one feature, the number of rows they were taken from and
+// the density histogram of all these rows, if the report has one
+export interface ScatterPoints {
+  x: Column;
+  y: Column;
+  total: number;
+  density: DensityGrid | null;
+}
+
+// Histogram of one SHAP column in the selected group: counts[yBin * bins + xBin] of uniform
+// bins over the x (feature value) and y (SHAP value) ranges
+export interface DensityGrid {
+  x: [number, number];
+  y: [number, number];
+  bins: number;
+  counts: Float64Array;
+  max: number;
+}
+
+export type ObservationSort = 'index' | 'shap-desc' | 'shap-asc';
+
+// Precomputed lists of the observation index: extreme SHAP values of a feature, extreme
+// predictions, or the observations most similar to a row
+export type ObservationList = 'shap-top' | 'shap-bottom' | 'prediction-top' | 'prediction-bottom' | 'similar';
+
+// One page of the observation list: row indices and their positions within the selected group
+export interface ObservationPage {
+  rows: Int32Array;
+  positions: Int32Array;
+  matches: number;
+}
+
+// Waterfall of one observation: SHAP and feature values per feature, [start, end] of every bar
+export interface Waterfall {
+  shap: Float64Array;
+  features: any[];
+  ranges: Float64Array; // start of feature j at 2 * j, end at 2 * j + 1
+  base: number;
+  prediction: number;
+}
+
+// One row of a split report, read from its row block: all SHAP columns and all feature values
+export interface RowValues {
+  shap: ArrayLike<number>;
+  features: any[];
+}
+
+interface EnginePort {
+  onmessage: ((event: { data: any }) => void) | null;
+  postMessage(message: any, transfer?: Transferable[]): void;
+  terminate?(): void;
+}
+
+// The engine, started as dataEngine(self) in the worker
+export function dataEngine(scope: any) {
+  let shap: Column[] = [];
+  let features: Column[] = [];
+  let samples: Column[] | null = null;
+  let codes: Column | null = null;
+  let order: Column | null = null;
+  let offsets: number[] | null = null;
+  let density: Density | null = null;
+  let index: ObservationIndex | null = null;
+  // rows of every cluster of the similarity index, built on the first search
+  let clusterRows: { order: Int32Array; offsets: Int32Array } | null = null;
+  let nOutputs = 1;
+  let nRows = 0;
+  // positions of the last observation query, paging through them does not filter or sort again
+  let lastList: { key: string; positions: Int32Array } | null = null;
+
+  function isTyped(column: any): boolean {
+    return ArrayBuffer.isView(column);
+  }
+
+  // Rows of a group, all rows (null) for group < 0 or while the group index is not loaded
+  function groupRows(group: number): ArrayLike<number> | null {
+    if (group < 0 || !order || !offsets) {
+      return null;
+    }
+    const start = offsets[group];
+    const end = offsets[group + 1];
+    return isTyped(order) ? (order as any).subarray(start, end) : (order as any[]).slice(start, end);
+  }
+
+  function gather(column: Column, rows: ArrayLike<number> | null): Column {
+    if (!rows) {
+      return isTyped(column) ? (column as any).slice() : (column as any[]).slice();
+    }
+    const out = isTyped(column) ? new (column.constructor as any)(rows.length) : new Array(rows.length);
+    for (let i = 0; i < rows.length; i++) {
+      out[i] = column[rows[i]];
+    }
+    return out;
+  }
+
+  function selectionSize(group: number): number {
+    return group >= 0 && offsets ? offsets[group + 1] - offsets[group] : nRows;
+  }
+
+  // Counts of a SHAP column in a group, added up over the groups for all rows (group < 0)
+  function densityGrid(column: number, group: number): DensityGrid | null {
+    const entry = density ? density.columns[column] : null;
+    if (!density || !entry) {
+      return null;
+    }
+    const cells = density.bins * density.bins;
+    const nGroups = Math.floor(entry.counts.length / cells);
+    const counts = new Float64Array(cells);
+    for (let g = 0; g < nGroups; g++) {
+      if (group >= 0 && nGroups > 1 && g !== group) {
+        continue;
+      }
+      for (let c = 0, i = g * cells; c < cells; c++, i++) {
+        counts[c] += entry.counts[i] as number;
+      }
+    }
+    let max = 0;
+    for (let c = 0; c < cells; c++) {
+      max = counts[c] > max ? counts[c] : max;
+    }
+    return { x: entry.x, y: entry.y, bins: density.bins, counts: counts, max: max };
+  }
+
+  function scatter(query: { feature: number; output: number; group: number }): ScatterPoints {
+    const column = query.feature * nOutputs + query.output;
+    const y = shap[column];
+    const x = features[query.feature];
+    const total = selectionSize(query.group);
+    const grid = densityGrid(column, query.group);
+    if (!y || !x || y.length === 0) {
+      return { x: new Float64Array(0), y: new Float64Array(0), total: total, density: grid };
+    }
+    const groupSelection = groupRows(query.group);
+    let rows: ArrayLike<number> | null = groupSelection;
+    const sampled = samples ? samples[column] : null;
+    if (sampled && sampled.length > 0) {
+      rows = sampled as ArrayLike<number>;
+      if (groupSelection && codes) {
+        const kept = new Int32Array(sampled.length);
+        let count = 0;
+        for (let i = 0; i < sampled.length; i++) {
+          if (codes[sampled[i] as number] === query.group) {
+            kept[count++] = sampled[i] as number;
+          }
+        }
+        rows = kept.subarray(0, count);
+      }
+    }
+    return { x: gather(x, rows), y: gather(y, rows), total: total, density: grid };
+  }
+
+  // Position of a row within the rows of a group (named #<position + 1> in the list)
+  function positionOf(row: number, group: number): number {
+    const selection = groupRows(group);
+    if (!selection) {
+      return row;
+    }
+    // rows of a group are in ascending order
+    let low = 0;
+    let high = selection.length - 1;
+    while (low < high) {
+      const middle = (low + high) >> 1;
+      if (selection[middle] < row) {
+        low = middle + 1;
+      } else {
+        high = middle;
+      }
+    }
+    return low;
+  }
+
+  function listPage(rows: number[], group: number): ObservationPage {
+    const positions = new Int32Array(rows.length);
+    for (let i = 0; i < rows.length; i++) {
+      positions[i] = positionOf(rows[i], group);
+    }
+    return { rows: Int32Array.from(rows), positions: positions, matches: rows.length };
+  }
+
+  // One precomputed list of a SHAP column or an output, the lists of the group if it has some
+  function extremes(lists: Column[], column: number, group: number, top: boolean): number[] {
+    const k = index!.k;
+    const list = lists[column];
+    if (!list) {
+      return [];
+    }
+    const start = (index!.groups !== null && group >= 0 ? 1 + group : 0) * 2 * k + (top ? 0 : k);
+    const rows: number[] = [];
+    for (let i = start; i < start + k; i++) {
+      if ((list[i] as number) >= 0) {
+        rows.push(list[i] as number);
+      }
+    }
+    return rows;
+  }
+
+  // Rows of every cluster, a counting sort of the cluster of every row
+  function clusterLists(clusters: Column, nClusters: number): { order: Int32Array; offsets: Int32Array } {
+    const offsets = new Int32Array(nClusters + 1);
+    for (let i = 0; i < clusters.length; i++) {
+      offsets[(clusters[i] as number) + 1]++;
+    }
+    for (let c = 0; c < nClusters; c++) {
+      offsets[c + 1] += offsets[c];
+    }
+    const next = offsets.slice(0, nClusters);
+    const order = new Int32Array(clusters.length);
+    for (let i = 0; i < clusters.length; i++) {
+      order[next[clusters[i] as number]++] = i;
+    }
+    return { order: order, offsets: offsets };
+  }
+
+  // The k rows of the group nearest to row by the quantized SHAP vectors, scanning the clusters
+  // nearest to the row until at least minProbes clusters and k candidates were seen
+  function similar(row: number, group: number, k: number): number[] {
+    const sim = index && index.similar;
+    if (!sim || row < 0 || row >= sim.clusters.length) {
+      return [];
+    }
+    const nColumns = sim.codes.length;
+    const nClusters = sim.centroids.length;
+    if (!clusterRows) {
+      clusterRows = clusterLists(sim.clusters, nClusters);
+    }
+    const steps = new Float64Array(nColumns);
+    const query = new Float64Array(nColumns);
+    for (let d = 0; d < nColumns; d++) {
+      steps[d] = (sim.ranges[d][1] - sim.ranges[d][0]) / 255;
+      query[d] = sim.ranges[d][0] + (sim.codes[d][row] as number) * steps[d];
+    }
+    const clusterDistances = sim.centroids.map((centroid, c) => {
+      let distance = 0;
+      for (let d = 0; d < nColumns; d++) {
+        distance += (centroid[d] - query[d]) * (centroid[d] - query[d]);
+      }
+      return { cluster: c, distance: distance };
+    });
+    clusterDistances.sort((a, b) => a.distance - b.distance || a.cluster - b.cluster);
+
+    const minProbes = 4;
+    const nearest: { row: number; distance: number }[] = [];
+    for (let probe = 0; probe < nClusters; probe++) {
+      if (probe >= minProbes && nearest.length >= k) {
+        break;
+      }
+      const cluster = clusterDistances[probe].cluster;
+      for (let i = clusterRows.offsets[cluster]; i < clusterRows.offsets[cluster + 1]; i++) {
+        const candidate = clusterRows.order[i];
+        if (candidate === row || (group >= 0 && codes && codes[candidate] !== group)) {
+          continue;
+        }
+        let distance = 0;
+        for (let d = 0; d < nColumns; d++) {
+          const difference = ((sim.codes[d][candidate] as number) - (sim.codes[d][row] as number)) * steps[d];
+          distance += difference * difference;
+        }
+        if (nearest.length < k || distance < nearest[nearest.length - 1].distance) {
+          // insertion into the sorted list of the k nearest, ties keep the lower row first
+          let at = nearest.length;
+          while (at > 0 && (nearest[at - 1].distance > distance || (nearest[at - 1].distance === distance && nearest[at - 1].row > candidate))) {
+            at--;
+          }
+          nearest.splice(at, 0, { row: candidate, distance: distance });
+          if (nearest.length > k) {
+            nearest.pop();
+          }
+        }
+      }
+    }
+    return nearest.map((entry) => entry.row);
+  }
+
+  // A precomputed list as a page of the observation list
+  function jump(query: { list: ObservationList; feature: number; output: number; group: number; row: number }): ObservationPage {
+    if (!index) {
+      return listPage([], query.group);
+    }
+    let rows: number[] = [];
+    if (query.list === 'shap-top' || query.list === 'shap-bottom') {
+      rows = query.feature >= 0 ? extremes(index.extremes, query.feature * nOutputs + query.output, query.group, query.list === 'shap-top') : [];
+    } else if (query.list === 'prediction-top' || query.list === 'prediction-bottom') {
+      rows = extremes(index.predictions, query.output, query.group, query.list === 'prediction-top');
+    } else {
+      rows = similar(query.row, query.group, index.k);
+    }
+    return listPage(rows, query.group);
+  }
+
+  function observations(query: {
+    group: number; filter: string; sort: ObservationSort; feature: number; output: number; offset: number; limit: number;
+  }): ObservationPage {
+    const selection = groupRows(query.group);
+    const count = selectionSize(query.group);
+    const column = query.sort !== 'index' && query.feature >= 0 ? shap[query.feature * nOutputs + query.output] : null;
+    const sorted = column && column.length > 0 ? query.sort : 'index';
+    const key = [query.group, query.filter, sorted, sorted === 'index' ? -1 : query.feature, query.output, selection ? 1 : 0].join('|');
+    if (!lastList || lastList.key !== key) {
+      // observations are named #<position + 1> within the selection, as shown in the list
+      const filter = query.filter.toLowerCase();
+      let positions = new Int32Array(count);
+      let matches = 0;
+      for (let position = 0; position < count; position++) {
+        if (!filter || ('#' + (position + 1)).includes(filter) || String(position).includes(filter)) {
+          positions[matches++] = position;
+        }
+      }
+      positions = positions.slice(0, matches);
+      if (column && sorted !== 'index') {
+        const sign = sorted === 'shap-desc' ? -1 : 1;
+        const values = new Float64Array(count);
+        for (let position = 0; position < count; position++) {
+          values[position] = Number(column[selection ? selection[position] : position]);
+        }
+        positions.sort((a, b) => sign * (values[a] - values[b]) || a - b);
+      }
+      lastList = { key: key, positions: positions };
+    }
+    const page = lastList.positions.slice(query.offset, query.offset + query.limit);
+    const rows = new Int32Array(page.length);
+    for (let i = 0; i < page.length; i++) {
+      rows[i] = selection ? selection[page[i]] : page[i];
+    }
+    return { rows: rows, positions: page, matches: lastList.positions.length };
+  }
+
+  function waterfall(query: { row: number; values: RowValues | null; output: number; base: number }): Waterfall {
+    const nFeatures = query.values ? query.values.features.length : Math.floor(shap.length / nOutputs);
+    const values = new Float64Array(nFeatures);
+    const featureRow = new Array(nFeatures);
+    const ranges = new Float64Array(2 * nFeatures);
+    let cumulative = query.base;
+    for (let j = 0; j < nFeatures; j++) {
+      const column = j * nOutputs + query.output;
+      if (query.values) {
+        values[j] = Number(query.values.shap[column]);
+        featureRow[j] = query.values.features[j];
+      } else {
+        values[j] = Number(shap[column][query.row]);
+        featureRow[j] = features[j] ? features[j][query.row] : undefined;
+      }
+      ranges[2 * j] = cumulative;
+      cumulative += values[j];
+      ranges[2 * j + 1] = cumulative;
+    }
+    return { shap: values, features: featureRow, ranges: ranges, base: query.base, prediction: cumulative };
+  }
+
+  // Buffers of the typed arrays in a result (and its nested objects), transferred back instead of copied
+  function transferables(result: any, buffers: ArrayBuffer[] = []): ArrayBuffer[] {
+    if (result && typeof result === 'object') {
+      Object.keys(result).forEach((name) => {
+        const value = result[name];
+        if (ArrayBuffer.isView(value)) {
+          if (buffers.indexOf(value.buffer as ArrayBuffer) < 0) {
+            buffers.push(value.buffer as ArrayBuffer);
+          }
+        } else if (value && typeof value === 'object' && !Array.isArray(value)) {
+          transferables(value, buffers);
+        }
+      });
+    }
+    return buffers;
+  }
+
+  const handlers: { [type: string]: (message: any) => any } = {
+    init(message) {
+      const data: EngineData = message.data;
+      shap = data.shapValues;
+      features = data.featureValues;
+      samples = data.sampleIndices;
+      codes = data.groupCodes;
+      order = data.groupOrder;
+      offsets = data.groupOffsets;
+      density = data.density;
+      index = data.observationIndex;
+      clusterRows = null;
+      nOutputs = data.nOutputs;
+      nRows = data.nRows;
+      lastList = null;
+      return null;
+    },
+    // decoded shard columns of a split report, {matrix: {index: column}}
+    columns(message) {
+      const targets: { [matrix: string]: Column[] | null } = {
+        shap_values: shap, feature_values: features, scatter_samples: samples,
+      };
+      Object.keys(message.columns).forEach((matrix) => {
+        const target = targets[matrix];
+        if (target) {
+          Object.keys(message.columns[matrix]).forEach((index) => {
+            target[Number(index)] = message.columns[matrix][index];
+          });
+        }
+      });
+      lastList = null;
+      return null;
+    },
+    groups(message) {
+      codes = message.codes;
+      order = message.order;
+      lastList = null;
+      return null;
+    },
+    scatter: scatter,
+    observations: observations,
+    jump: jump,
+    waterfall: waterfall,
+  };
+
+  scope.onmessage = (event: { data: any }) => {
+    const message = event.data;
+    try {
+      const result = handlers[message.type](message);
+      scope.postMessage({ id: message.id, result: result }, transferables(result));
+    } catch (error: any) {
+      scope.postMessage({ id: message.id, error: String(error && error.message ? error.message : error) });
+    }
+  };
+  scope.postMessage({ type: 'ready' });
+}
+
+// The UI thread side: starts the engine and turns its messages into promises
+export class DataEngine {
+  private port: EnginePort;
+  private url: string | null = null;
+  private ready = false;
+  private queue: { message: any; transfer: Transferable[] }[] = [];
+  private pending = new Map<number, { resolve: (value: any) => void; reject: (error: Error) => void }>();
+  private nextId = 0;
+
+  constructor(data: EngineData) {
+    this.port = this.startWorker() ?? this.startLocal();
+    this.send({ type: 'init', data }, columnBuffers([
+      ...data.shapValues, ...data.featureValues, ...(data.sampleIndices ?? []), data.groupCodes, data.groupOrder,
+      ...(data.density ? data.density.columns.map((column) => (column ? column.counts : null)) : []),
+      ...(data.observationIndex ? [...data.observationIndex.extremes, ...data.observationIndex.predictions] : []),
+      ...(data.observationIndex && data.observationIndex.similar
+        ? [data.observationIndex.similar.clusters, ...data.observationIndex.similar.codes] : []),
+    ]));
+  }
+
+  // Points of the scatter plot of a feature (and output), restricted to a group (-1 for all rows)
+  scatter(query: { feature: number; output: number; group: number }): Promise<ScatterPoints> {
+    return this.request('scatter', query);
+  }
+
+  // A precomputed list of the observation index (extremes or similar observations) as one page
+  jump(query: { list: ObservationList; feature: number; output: number; group: number; row: number }): Promise<ObservationPage> {
+    return this.request('jump', query);
+  }
+
+  // A page of the observation list, filtered by name and sorted by index or the SHAP value of a feature
+  observations(query: {
+    group: number; filter: string; sort: ObservationSort; feature: number; output: number; offset: number; limit: number;
+  }): Promise<ObservationPage> {
+    return this.request('observations', query);
+  }
+
+  // Waterfall of a row, or of the values of a row read from a split report
+  waterfall(query: { row: number; values?: RowValues | null; output: number; base: number }): Promise<Waterfall> {
+    return this.request('waterfall', { values: null, ...query });
+  }
+
+  // Split reports: decoded shard columns, copied because the shard loader keeps them
+  setColumns(columns: { [matrix: string]: { [index: number]: Column } }) {
+    const copies: { [matrix: string]: { [index: number]: Column } } = {};
+    for (const [matrix, decoded] of Object.entries(columns)) {
+      copies[matrix] = Object.fromEntries(Object.entries(decoded).map(([index, column]) => [index, compactCopy(column)]));
+    }
+    this.send({ type: 'columns', columns: copies }, columnBuffers(Object.values(copies).flatMap((decoded) => Object.values(decoded))));
+  }
+
+  setGroups(codes: Column, order: Column) {
+    const copies = [compactCopy(codes), compactCopy(order)];
+    this.send({ type: 'groups', codes: copies[0], order: copies[1] }, columnBuffers(copies));
+  }
+
+  terminate() {
+    this.port.terminate?.();
+    if (this.url) {
+      URL.revokeObjectURL(this.url);
+    }
+    this.pending.forEach(({ reject }) => reject(new Error('Data engine terminated')));
+    this.pending.clear();
+  }
+
+  private request<T>(type: string, query: any): Promise<T> {
+    const id = this.nextId++;
+    return new Promise<T>((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      this.send({ ...query, type, id }, []);
+    });
+  }
+
+  // Messages wait until the engine is ready, so nothing is transferred to a worker that failed to start
+  private send(message: any, transfer: Transferable[]) {
+    if (this.ready) {
+      this.port.postMessage(message, transfer);
+    } else {
+      this.queue.push({ message, transfer });
+    }
+  }
+
+  private receive(message: any) {
+    if (message.type === 'ready') {
+      this.ready = true;
+      const queue = this.queue;
+      this.queue = [];
+      queue.forEach(({ message, transfer }) => this.port.postMessage(message, transfer));
+      return;
+    }
+    const pending = this.pending.get(message.id);
+    if (!pending) {
+      return;
+    }
+    this.pending.delete(message.id);
+    if (message.error !== undefined) {
+      pending.reject(new Error(message.error));
+    } else {
+      pending.resolve(message.result);
+    }
+  }
+
+  private startWorker(): EnginePort | null {
+    if (typeof Worker === 'undefined' || typeof Blob === 'undefined' || typeof URL.createObjectURL !== 'function') {
+      return null;
+    }
+    // assets/worker.js, embedded by report.html (absent if it has not been built)
+    const source = typeof document !== 'undefined' ? document.getElementById('xaiflow-worker')?.textContent : null;
+    if (!source) {
+      return null;
+    }
+    try {
+      this.url = URL.createObjectURL(new Blob([source], { type: 'text/javascript' }));
+      const worker = new Worker(this.url);
+      worker.onmessage = (event) => this.receive(event.data);
+      worker.onerror = (event) => {
+        if (!this.ready) {
+          // e.g. blob: workers blocked by a content security policy, nothing was sent yet
+          event.preventDefault();
+          worker.terminate();
+          console.warn('DataEngine: worker failed to start, running on the main thread');
+          this.port = this.startLocal();
+        }
+      };
+      return worker;
+    } catch (error) {
+      console.warn('DataEngine: cannot start a worker, running on the main thread', error);
+      return null;
+    }
+  }
+
+  private startLocal(): EnginePort {
+    const engineScope: EnginePort = {
+      onmessage: null,
+      postMessage: (message) => queueMicrotask(() => this.receive(message)),
+    };
+    dataEngine(engineScope);
+    return {
+      onmessage: null,
+      postMessage: (message) => queueMicrotask(() => engineScope.onmessage!({ data: message })),
+    };
+  }
+}
+
+// A copy of a column, typed arrays get their own buffer (shard columns are views into the whole file)
+function compactCopy(column: Column): Column {
+  return column.slice();
+}
+
+// Distinct buffers of the typed arrays among columns
+function columnBuffers(columns: (Column | null)[]): Transferable[] {
+  const buffers = new Set<ArrayBuffer>();
+  for (const column of columns) {
+    if (column && ArrayBuffer.isView(column)) {
+      buffers.add(column.buffer as ArrayBuffer);
+    }
+  }
+  return Array.from(buffers);
+}
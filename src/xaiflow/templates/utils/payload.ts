@@ -0,0 +1,487 @@
+// Decoder for the report payload written by xaiflow/encoding.py
+// Matrices arrive column-major: one encoded column per feature.
+
+export type Column = Float32Array | Float64Array | Int32Array | Uint8Array | any[];
+
+export interface EncodedColumn {
+  dtype: 'float32' | 'float64' | 'int32' | 'uint8' | 'bits' | 'json';
+  data: string | any[] | Uint8Array; // bytes once a compressed column is inflated by report.html
+  length?: number; // number of rows of a bit-packed column
+  compression?: string; // codec of the bytes before base64, see compression.py
+  categories?: string[]; // labels of dictionary-encoded columns, data holds the codes
+}
+
+export interface EncodedMatrix {
+  shape: number[]; // [rows, features] or [rows, features, outputs]
+  columns: EncodedColumn[];
+}
+
+export interface ReportPayload {
+  importanceData: { features: string[]; values: number[] };
+  shapValues: Column[];
+  featureValues: Column[];
+  baseValues: number[];
+  featureEncodings: { [key: string]: any };
+  featureNames: string[];
+  groupIndex: GroupIndex | null;
+  scatterSamples: ScatterSamples | null;
+  summaries: FeatureSummaries | null;
+  outputs: Outputs | null;
+  density: Density | null;
+  observationIndex: ObservationIndex | null;
+  correlations: Correlations | null;
+  shards: ShardLoader | null; // split reports: the columns above are filled in from shards on demand
+}
+
+// Outputs of a multi-output explanation. SHAP columns (and the per-column tables of
+// groupIndex, summaries and scatterSamples) are feature-major: column j * names.length + o
+export interface Outputs {
+  names: string[];
+  importance: number[][] | null; // outputs x features, normalized per output
+}
+
+// 2D histograms of (feature value, SHAP value) per SHAP column (see density.py), drawn as the
+// heatmap of the SHAP scatter. Always embedded inline, also in split reports
+export interface Density {
+  bins: number; // per axis
+  threshold: number; // points are drawn while at most this many rows are in view
+  columns: (DensityColumn | null)[]; // null for feature columns that are not numeric
+}
+
+export interface DensityColumn {
+  x: [number, number]; // feature value range of the bins
+  y: [number, number]; // SHAP value range of the bins
+  counts: Column; // groups x bins (y) x bins (x), one group without group labels
+}
+
+// Strongest correlated partners of every feature (see correlations.py), suggested as interaction
+// partners in the SHAP scatter. Partners are feature indices, strongest (by absolute value) first
+export interface Correlations {
+  top: number;
+  shap: CorrelationPartners; // per SHAP column, partners of the same output
+  features: CorrelationPartners | null; // per feature, null without feature values
+}
+
+export interface CorrelationPartners {
+  partners: number[][];
+  values: number[][];
+}
+
+// A suggested interaction partner of the selected feature
+export interface InteractionPartner {
+  feature: number;
+  name: string;
+  shap: number | null; // correlation of the SHAP values
+  values: number | null; // correlation of the feature values
+}
+
+// Precomputed row lists and similarity index of the deep dive (see observations.py). Always
+// embedded inline, split reports have no similarity index
+export interface ObservationIndex {
+  k: number;
+  groups: number | null; // number of groups with their own lists, null without group labels
+  extremes: Column[]; // per SHAP column (1 + groups) x [k highest, k lowest] rows, -1 pads short lists
+  predictions: Column[]; // per output the same lists of the predictions (base value + sum of SHAP values)
+  similar: {
+    ranges: [number, number][]; // per SHAP column, code c stands for low + c * (high - low) / 255
+    centroids: number[][]; // clusters x SHAP columns
+    clusters: Column; // cluster of every row
+    codes: Column[]; // 8 bit code of every row per SHAP column
+  } | null;
+}
+
+// Dictionary-encoded group labels (see groups.py): rows of group g are order[offsets[g]:offsets[g + 1]]
+export interface GroupIndex {
+  labels: string[];
+  codes: Column;
+  order: Column;
+  offsets: number[];
+  importance: number[][]; // groups x features, mean |SHAP|
+}
+
+// Per-feature SHAP statistics (see summaries.py), tables are fields x features
+export interface FeatureSummaries {
+  fields: string[];
+  overall: (number | null)[][];
+  groups: {
+    labels: string[];
+    counts: number[];
+    values: (number | null)[][][];
+  } | null;
+}
+
+// Row indices per feature for the downsampled SHAP scatter (see sampling.py)
+export interface ScatterSamples {
+  totalRows: number;
+  indices: Column[];
+}
+
+// Split reports (see shards.py): column headers without "data" live in binary shard files
+export interface ShardColumn {
+  matrix: 'shap_values' | 'feature_values' | 'scatter_samples' | 'groups';
+  index: number; // column index in the matrix, for groups 0 = codes and 1 = order
+  offset: number;
+  nbytes: number;
+}
+
+export interface ShardFile {
+  path: string;
+  start?: number; // rows start:stop of a row block, all rows otherwise
+  stop?: number;
+  columns: ShardColumn[];
+}
+
+// Columns split into one file per batch (appended reports, see incremental.py), concatenated on load
+export interface ShardParts {
+  parts: ShardFile[];
+}
+
+export interface ShardManifest {
+  url: string; // directory of the shard files, relative to the report
+  rows: number;
+  features: (ShardFile | ShardParts)[];
+  row_blocks: ShardFile[];
+  groups: ShardFile | ShardParts | null;
+}
+
+// Decoded columns of a shard file per matrix, keyed by column index
+export type ShardColumns = { [matrix: string]: { [index: number]: Column } };
+
+// Fetches shard files on first use (each file once) and decodes their columns in place
+export class ShardLoader {
+  readonly manifest: ShardManifest;
+  private headers: { [matrix: string]: EncodedColumn[] };
+  private baseUrl: URL;
+  private files = new Map<string, Promise<ShardColumns>>();
+
+  constructor(manifest: ShardManifest, headers: { [matrix: string]: EncodedColumn[] }, baseUrl: string) {
+    this.manifest = manifest;
+    this.headers = headers;
+    this.baseUrl = new URL(manifest.url, baseUrl);
+  }
+
+  get rows(): number {
+    return this.manifest.rows;
+  }
+
+  // SHAP columns, feature values and scatter sample indices of one feature
+  loadFeature(featureIndex: number): Promise<ShardColumns> {
+    return this.load(this.manifest.features[featureIndex]);
+  }
+
+  // All SHAP and feature columns of the row block containing rowIndex, with the first row of the block
+  async loadRows(rowIndex: number): Promise<{ start: number; columns: ShardColumns }> {
+    const block = this.manifest.row_blocks.find((file) => rowIndex >= file.start! && rowIndex < file.stop!);
+    if (!block) {
+      throw new Error(`Row ${rowIndex} is not in any shard`);
+    }
+    return { start: block.start!, columns: await this.load(block) };
+  }
+
+  // codes (index 0) and order (index 1) of the group index
+  async loadGroups(): Promise<ShardColumns> {
+    if (!this.manifest.groups) {
+      return {};
+    }
+    const columns = await this.load(this.manifest.groups);
+    // appended reports only store the codes of every batch
+    if (columns.groups && columns.groups[1] === undefined) {
+      columns.groups[1] = groupOrder(columns.groups[0]);
+    }
+    return columns;
+  }
+
+  private load(file: ShardFile | ShardParts): Promise<ShardColumns> {
+    if ('parts' in file) {
+      return Promise.all(file.parts.map((part) => this.loadFile(part))).then(concatShardColumns);
+    }
+    return this.loadFile(file);
+  }
+
+  private loadFile(file: ShardFile): Promise<ShardColumns> {
+    let columns = this.files.get(file.path);
+    if (!columns) {
+      columns = fetch(new URL(file.path, this.baseUrl))
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`Failed to fetch shard ${file.path}: ${response.status}`);
+          }
+          return response.arrayBuffer();
+        })
+        .then((buffer) => decodeShard(buffer, file, this.headers, this.manifest.rows));
+      // a failed fetch is retried on the next use
+      columns.catch(() => this.files.delete(file.path));
+      this.files.set(file.path, columns);
+    }
+    return columns;
+  }
+}
+
+// Columns of a shard file, views into buffer for typed arrays (offsets are 8 byte aligned)
+export function decodeShard(buffer: ArrayBuffer, file: ShardFile, headers: { [matrix: string]: EncodedColumn[] }, nRows: number): ShardColumns {
+  const rows = (file.stop ?? nRows) - (file.start ?? 0);
+  const columns: ShardColumns = {};
+  for (const entry of file.columns) {
+    const bytes = new Uint8Array(buffer, entry.offset, entry.nbytes);
+    let column: Column;
+    switch (headers[entry.matrix][entry.index].dtype) {
+      case 'json':
+        column = JSON.parse(new TextDecoder().decode(bytes));
+        break;
+      case 'float32':
+        column = new Float32Array(buffer, entry.offset, entry.nbytes / 4);
+        break;
+      case 'float64':
+        column = new Float64Array(buffer, entry.offset, entry.nbytes / 8);
+        break;
+      case 'int32':
+        column = new Int32Array(buffer, entry.offset, entry.nbytes / 4);
+        break;
+      case 'bits':
+        column = unpackBits(bytes, rows);
+        break;
+      default:
+        column = bytes;
+    }
+    (columns[entry.matrix] ??= {})[entry.index] = column;
+  }
+  return columns;
+}
+
+// Columns of consecutive row ranges joined into one column per matrix and index
+export function concatShardColumns(parts: ShardColumns[]): ShardColumns {
+  const joined: ShardColumns = {};
+  for (const matrix of new Set(parts.flatMap((part) => Object.keys(part)))) {
+    joined[matrix] = {};
+    for (const index of Object.keys(parts[0][matrix] ?? {})) {
+      joined[matrix][Number(index)] = concatColumns(parts.map((part) => part[matrix][Number(index)]));
+    }
+  }
+  return joined;
+}
+
+function concatColumns(columns: Column[]): Column {
+  if (columns.length === 1) {
+    return columns[0];
+  }
+  if (Array.isArray(columns[0])) {
+    return (columns as any[][]).flat();
+  }
+  const typed = columns as Exclude<Column, any[]>[];
+  const joined = new (typed[0].constructor as any)(typed.reduce((total, column) => total + column.length, 0));
+  let offset = 0;
+  for (const column of typed) {
+    joined.set(column, offset);
+    offset += column.length;
+  }
+  return joined;
+}
+
+// Row indices sorted by group code (stable), the order column of the group index
+export function groupOrder(codes: Column): Int32Array {
+  let nGroups = 0;
+  for (let i = 0; i < codes.length; i++) {
+    nGroups = Math.max(nGroups, Number(codes[i]) + 1);
+  }
+  const starts = new Int32Array(nGroups + 1);
+  for (let i = 0; i < codes.length; i++) {
+    starts[Number(codes[i]) + 1]++;
+  }
+  for (let g = 0; g < nGroups; g++) {
+    starts[g + 1] += starts[g];
+  }
+  const order = new Int32Array(codes.length);
+  for (let i = 0; i < codes.length; i++) {
+    order[starts[Number(codes[i])]++] = i;
+  }
+  return order;
+}
+
+export function base64ToBytes(b64: string): Uint8Array {
+  const binary = atob(b64);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+}
+
+export function decodeColumn(column: EncodedColumn): Column {
+  if (column.dtype === 'json') {
+    return column.data as any[];
+  }
+  const bytes = typeof column.data === 'string' ? base64ToBytes(column.data) : (column.data as Uint8Array);
+  switch (column.dtype) {
+    case 'float32':
+      return new Float32Array(bytes.buffer, 0, bytes.length / 4);
+    case 'float64':
+      return new Float64Array(bytes.buffer, 0, bytes.length / 8);
+    case 'int32':
+      return new Int32Array(bytes.buffer, 0, bytes.length / 4);
+    case 'bits':
+      return unpackBits(bytes, column.length ?? bytes.length * 8);
+    default:
+      return bytes;
+  }
+}
+
+// Bit-packed booleans (little bit order) to 0/1 codes, labelled False/True via the column categories
+export function unpackBits(bytes: Uint8Array, length: number): Uint8Array {
+  const codes = new Uint8Array(length);
+  for (let i = 0; i < length; i++) {
+    codes[i] = (bytes[i >> 3] >> (i & 7)) & 1;
+  }
+  return codes;
+}
+
+export function decodeMatrix(matrix: EncodedMatrix | null): Column[] {
+  if (!matrix) {
+    return [];
+  }
+  return matrix.columns.map(decodeColumn);
+}
+
+// Columns without data are loaded from shards, they start out empty
+function decodeHeader(column: EncodedColumn): Column {
+  return column.data === undefined ? [] : decodeColumn(column);
+}
+
+export function decodePayload(raw: any, baseUrl: string = typeof document !== 'undefined' ? document.baseURI : ''): ReportPayload {
+  if (raw.shards) {
+    const headers = {
+      shap_values: raw.shap_values.columns,
+      feature_values: raw.feature_values ? raw.feature_values.columns : [],
+      scatter_samples: raw.scatter_samples ? raw.scatter_samples.indices : [],
+      groups: raw.groups ? [raw.groups.codes, raw.groups.order] : [],
+    };
+    return {
+      ...decodeInlinePayload(raw, decodeHeader),
+      shards: new ShardLoader(raw.shards, headers, baseUrl),
+    };
+  }
+  return decodeInlinePayload(raw, decodeColumn);
+}
+
+function decodeInlinePayload(raw: any, decode: (column: EncodedColumn) => Column): ReportPayload {
+  const decodeColumns = (matrix: EncodedMatrix | null) => (matrix ? matrix.columns.map(decode) : []);
+  return {
+    importanceData: raw.importance_data,
+    shapValues: decodeColumns(raw.shap_values),
+    featureValues: decodeColumns(raw.feature_values),
+    baseValues: raw.base_values,
+    featureEncodings: mergeCategories(raw.feature_encodings || {}, raw.feature_names || [], raw.feature_values),
+    featureNames: raw.feature_names || [],
+    groupIndex: raw.groups
+      ? { ...raw.groups, codes: decode(raw.groups.codes), order: decode(raw.groups.order) }
+      : null,
+    scatterSamples: raw.scatter_samples
+      ? { totalRows: raw.scatter_samples.total_rows, indices: raw.scatter_samples.indices.map(decode) }
+      : null,
+    summaries: raw.summaries || null,
+    outputs: decodeOutputs(raw),
+    density: raw.density
+      ? {
+          ...raw.density,
+          columns: raw.density.columns.map((column: any) => (column ? { ...column, counts: decodeColumn(column.counts) } : null)),
+        }
+      : null,
+    correlations: raw.correlations ?? null,
+    observationIndex: raw.observation_index
+      ? {
+          ...raw.observation_index,
+          extremes: raw.observation_index.extremes.map(decodeColumn),
+          predictions: raw.observation_index.predictions.map(decodeColumn),
+          similar: raw.observation_index.similar
+            ? {
+                ...raw.observation_index.similar,
+                clusters: decodeColumn(raw.observation_index.similar.clusters),
+                codes: raw.observation_index.similar.codes.map(decodeColumn),
+              }
+            : null,
+        }
+      : null,
+    shards: null,
+  };
+}
+
+// Add the categories of dictionary-encoded feature columns as {code: label} encodings,
+// mappings passed to log_xai_report take precedence
+function mergeCategories(featureEncodings: { [key: string]: any }, featureNames: string[], featureValues: EncodedMatrix | null): { [key: string]: any } {
+  const merged = { ...featureEncodings };
+  (featureValues ? featureValues.columns : []).forEach((column, j) => {
+    const name = featureNames[j];
+    if (column.categories && name !== undefined && !merged[name]) {
+      merged[name] = Object.fromEntries(column.categories.map((label, code) => [code, label]));
+    }
+  });
+  return merged;
+}
+
+function decodeOutputs(raw: any): Outputs | null {
+  if (raw.outputs) {
+    return raw.outputs;
+  }
+  const shape = raw.shap_values ? raw.shap_values.shape : [];
+  if (shape.length < 3) {
+    return null;
+  }
+  return { names: Array.from({ length: shape[2] }, (_, i) => `Output ${i}`), importance: null };
+}
+
+// Index of the column holding feature featureIndex of output `output`
+export function outputColumnIndex(featureIndex: number, output: number, nOutputs: number): number {
+  return featureIndex * nOutputs + output;
+}
+
+// The per-feature entries of one output, e.g. its SHAP columns (no copies)
+export function outputColumns<T>(columns: T[], output: number, nOutputs: number): T[] {
+  if (nOutputs <= 1) {
+    return columns;
+  }
+  return Array.from({ length: Math.floor(columns.length / nOutputs) }, (_, j) => columns[outputColumnIndex(j, output, nOutputs)]);
+}
+
+// Summary table of a group, or the overall table if the group is unknown
+export function summaryTable(summaries: FeatureSummaries, group: string | null): (number | null)[][] {
+  const groupIndex = group && summaries.groups ? summaries.groups.labels.indexOf(group) : -1;
+  return groupIndex >= 0 ? summaries.groups!.values[groupIndex] : summaries.overall;
+}
+
+// All summary fields of one feature as {field: value}
+export function featureSummary(summaries: FeatureSummaries, group: string | null, featureIndex: number): { [field: string]: number | null } {
+  const table = summaryTable(summaries, group);
+  return Object.fromEntries(summaries.fields.map((field, i) => [field, table[i][featureIndex]]));
+}
+
+// Number of observations stored in a list of columns
+export function columnLength(columns: Column[]): number {
+  return columns.length > 0 ? columns[0].length : 0;
+}
+
+// The base value of the deep dive: the positive class of a binary classifier, else the first (only) one
+export function baseValueOf(baseValues: number[] | number): number {
+  if (typeof baseValues === 'number') {
+    return baseValues;
+  }
+  return baseValues.length == 2 ? baseValues[1] : baseValues[0];
+}
+
+// Partners of a feature for one output: the SHAP partners first, then the feature-value partners
+// that are not among them, at most top of each
+export function interactionPartners(correlations: Correlations, feature: number, output: number, nOutputs: number, featureNames: string[]): InteractionPartner[] {
+  const partners = new Map<number, InteractionPartner>();
+  const add = (entries: CorrelationPartners | null, index: number, key: 'shap' | 'values') => {
+    if (!entries || !entries.partners[index]) {
+      return;
+    }
+    entries.partners[index].forEach((partner, i) => {
+      if (!partners.has(partner)) {
+        partners.set(partner, { feature: partner, name: featureNames[partner], shap: null, values: null });
+      }
+      partners.get(partner)![key] = entries.values[index][i];
+    });
+  };
+  add(correlations.shap, feature * nOutputs + output, 'shap');
+  add(correlations.features, feature, 'values');
+  return Array.from(partners.values());
+}
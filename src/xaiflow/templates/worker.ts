@@ -0,0 +1,5 @@
+// Entry point of assets/worker.js, built by rollup next to bundle.js: the data engine of the
+// report in its own script, which report.html embeds and DataEngine starts as a Web Worker
+import { dataEngine } from './utils/dataEngine';
+
+dataEngine(self);
@@ -0,0 +1,62 @@
+import functools
+import http.server
+import json
+import re
+import threading
+
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+
+@pytest.fixture
+def local_tracking(tmp_path, monkeypatch):
+    """Point MLflow to a throw-away local file store."""
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    previous_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri((tmp_path / "mlruns").as_uri())
+    yield tmp_path
+    mlflow.set_tracking_uri(previous_uri)
+
+
+@pytest.fixture
+def static_server():
+    """Serve a directory over HTTP, like a browser would load the report."""
+    servers = []
+
+    def serve(directory) -> str:
+        handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(directory))
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def extract_payload(html_content: str) -> dict:
+    """Helper function to read the embedded data block back from a report."""
+    match = re.search(r'<script type="application/json" id="xaiflow-payload">(.*?)</script>', html_content, re.S)
+    assert match is not None, "payload script tag not found in report"
+    return json.loads(match.group(1))
+
+
+def make_explanation(n_rows=50, n_features=4, seed=0) -> shap.Explanation:
+    """Helper function to build a synthetic regression explanation."""
+    rng = np.random.default_rng(seed)
+    return shap.Explanation(
+        values=rng.normal(size=(n_rows, n_features)),
+        base_values=np.full(n_rows, 0.5),
+        data=rng.uniform(0, 10, size=(n_rows, n_features)),
+        feature_names=[f"feature_{i}" for i in range(n_features)],
+    )
+
+
+def logged_payload(run_id, report_name="feature_importance_report.html"):
+    """Helper function to read the payload of a report logged to an MLflow run."""
+    local_path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=f"reports/{report_name}")
+    return extract_payload(open(local_path, encoding='utf-8').read())
@@ -0,0 +1,72 @@
+import threading
+
+import mlflow
+import pytest
+
+from xaiflow import XaiflowPlugin
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def test_async_report_is_logged_to_run_active_at_call_time(local_tracking):
+    plugin = XaiflowPlugin(max_workers=1)
+    explanation = make_explanation()
+    with mlflow.start_run() as run:
+        future = plugin.log_xai_report_async(explanation.feature_names, explanation, report_name="async.html")
+    # the run has ended and another one is active while the report is still pending
+    with mlflow.start_run():
+        assert plugin.flush(timeout=60) == ["reports/async.html"]
+    assert future.result() == "reports/async.html"
+
+    local_path = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path="reports/async.html")
+    payload = extract_payload(open(local_path, encoding='utf-8').read())
+    assert payload["shap_values"]["shape"] == [50, 4]
+    assert mlflow.get_run(run.info.run_id).data.params["report_artifact_path"] == "reports/async.html"
+    plugin.close()
+
+
+def test_async_validates_in_calling_thread(local_tracking):
+    plugin = XaiflowPlugin()
+    explanation = make_explanation()
+    with pytest.raises(ValueError, match="No active MLflow run"):
+        plugin.log_xai_report_async(explanation.feature_names, explanation)
+    with pytest.raises(ValueError, match="shap.Explanation"):
+        plugin.log_xai_report_async(explanation.feature_names, explanation.values, run_id="any")
+
+
+def test_flush_raises_background_errors(local_tracking, mocker):
+    plugin = XaiflowPlugin()
+    explanation = make_explanation()
+    mocker.patch.object(plugin.report_generator, "write", side_effect=RuntimeError("upload failed"))
+    with mlflow.start_run():
+        future = plugin.log_xai_report_async(explanation.feature_names, explanation)
+    with pytest.raises(RuntimeError, match="upload failed"):
+        plugin.flush(timeout=60)
+    assert isinstance(future.exception(), RuntimeError)
+    # errors are reported once, the next flush starts from an empty queue
+    assert plugin.flush() == []
+
+
+def test_pending_reports_are_bounded(local_tracking, mocker):
+    plugin = XaiflowPlugin(max_workers=1, max_pending=1)
+    explanation = make_explanation()
+    release = threading.Event()
+    mocker.patch.object(plugin.report_generator, "write", side_effect=lambda *args, **kwargs: release.wait(60))
+    with mlflow.start_run() as run:
+        plugin.log_xai_report_async(explanation.feature_names, explanation)
+        second_submitted = threading.Event()
+
+        def submit_second():
+            plugin.log_xai_report_async(
+                explanation.feature_names, explanation, run_id=run.info.run_id
+            )
+            second_submitted.set()
+
+        thread = threading.Thread(target=submit_second)
+        thread.start()
+        assert not second_submitted.wait(0.2)
+        release.set()
+        thread.join(60)
+    assert second_submitted.is_set()
+    assert plugin.flush(timeout=60) == ["reports/feature_importance_report.html"] * 2
+    plugin.close()
@@ -0,0 +1,73 @@
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.batch import SharedArray, SharedArrays, _attach
+from xaiflow.encoding import decode_column
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def test_shared_arrays_copy_each_array_once():
+    values = np.arange(12, dtype=np.float32).reshape(4, 3)
+    labels = np.array(["a", None, "b", "a"], dtype=object)
+    with SharedArrays() as shared:
+        first = shared.share_job({"shap_values": values, "feature_values": values, "group_labels": labels})
+        assert isinstance(first["shap_values"], SharedArray)
+        assert first["shap_values"] == first["feature_values"]
+        assert first["group_labels"] is labels
+
+        segments = []
+        view = _attach(first["shap_values"], segments)
+        np.testing.assert_array_equal(view, values)
+        assert not view.flags.writeable
+        del view
+        for segment in segments:
+            segment.close()
+
+
+def test_log_xai_reports_renders_on_process_pool(local_tracking):
+    explanation = make_explanation(n_rows=60)
+    per_class = shap.Explanation(
+        values=np.stack([explanation.values, -explanation.values], axis=-1),
+        base_values=np.zeros((60, 2)),
+        data=explanation.data,
+        feature_names=explanation.feature_names,
+    )
+    with mlflow.start_run() as run:
+        reports = [
+            {
+                "feature_names": explanation.feature_names,
+                "shap_values": per_class[..., k],
+                "group_labels": ["x", "y", "z"] * 20,
+                "report_name": f"class_{k}.html",
+            }
+            for k in range(2)
+        ]
+        reports.append({"run_id": run.info.run_id, "feature_names": [], "shap_values": explanation,
+                        "report_name": "broken.html", "importance_values": [1.0, "a"]})
+        results = XaiflowPlugin().log_xai_reports(reports, max_workers=2)
+
+    assert [r["artifact_path"] for r in results] == ["reports/class_0.html", "reports/class_1.html", None]
+    assert all(r["run_id"] == run.info.run_id for r in results)
+    assert isinstance(results[2]["error"], ValueError)
+    assert results[0]["timings"]["render"] > 0 and results[0]["timings"]["log"] > 0
+
+    local_path = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path="reports/class_1.html")
+    payload = extract_payload(open(local_path, encoding='utf-8').read())
+    np.testing.assert_allclose(
+        decode_column(payload["shap_values"]["columns"][0]), np.round(-explanation.values[:, 0], 4), rtol=1e-5
+    )
+    assert payload["groups"]["labels"] == ["x", "y", "z"]
+    assert mlflow.get_run(run.info.run_id).data.params["report_artifact_path"] == "reports/class_0.html"
+
+
+def test_log_xai_reports_validates_before_rendering(local_tracking):
+    explanation = make_explanation()
+    with pytest.raises(ValueError, match="group_labels length"):
+        XaiflowPlugin().log_xai_reports([
+            {"run_id": "any", "feature_names": explanation.feature_names, "shap_values": explanation,
+             "group_labels": ["a"]},
+        ])
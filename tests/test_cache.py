@@ -0,0 +1,80 @@
+import mlflow
+import numpy as np
+import pytest
+
+from xaiflow import ReportGenerator, XaiflowPlugin
+from xaiflow.cache import ReportCache, content_hash
+
+from tests.conftest import make_explanation
+
+
+def test_rendering_is_deterministic():
+    explanation = make_explanation()
+    report_data = dict(
+        importance_data={'features': explanation.feature_names, 'values': [0.25] * 4},
+        shap_values=explanation.values,
+        feature_values=explanation.data,
+        feature_names=explanation.feature_names,
+        compression="gzip",
+    )
+    assert ReportGenerator().render(**report_data) == ReportGenerator().render(**report_data)
+
+
+def test_content_hash_covers_arrays_and_options():
+    values = np.arange(12.0).reshape(4, 3)
+    key = content_hash({"shap_values": values, "group_labels": ["a", "b", "a", "b"]}, {"round_decimals": 4}, ["bundle"])
+    assert key == content_hash({"shap_values": values.copy(), "group_labels": ["a", "b", "a", "b"]}, {"round_decimals": 4}, ["bundle"])
+    changed = values.copy()
+    changed[3, 2] = -1
+    assert key != content_hash({"shap_values": changed, "group_labels": ["a", "b", "a", "b"]}, {"round_decimals": 4}, ["bundle"])
+    assert key != content_hash({"shap_values": values, "group_labels": ["a", "b", "a", "c"]}, {"round_decimals": 4}, ["bundle"])
+    assert key != content_hash({"shap_values": values, "group_labels": ["a", "b", "a", "b"]}, {"round_decimals": 3}, ["bundle"])
+    assert key != content_hash({"shap_values": values, "group_labels": ["a", "b", "a", "b"]}, {"round_decimals": 4}, ["bundle v2"])
+
+
+def test_identical_reports_are_rendered_and_uploaded_once(local_tracking, monkeypatch):
+    explanation = make_explanation(n_rows=100)
+    plugin = XaiflowPlugin(cache_dir=str(local_tracking / "cache"))
+    renders, uploads = [], []
+    write = plugin.report_generator.write
+    monkeypatch.setattr(plugin.report_generator, "write", lambda *args, **kwargs: renders.append(1) or write(*args, **kwargs))
+    log_artifact = mlflow.log_artifact
+    # uploads of report files, each comes with its summary sidecar
+    monkeypatch.setattr(mlflow, "log_artifact", lambda path, *args, **kwargs: (
+        path.endswith(".html") and uploads.append(1)) or log_artifact(path, *args, **kwargs))
+
+    with mlflow.start_run() as first:
+        assert plugin.log_xai_report(explanation.feature_names, explanation) == "reports/feature_importance_report.html"
+        # a retried step: neither rendered nor uploaded again
+        assert plugin.log_xai_report(explanation.feature_names, explanation) == "reports/feature_importance_report.html"
+    assert (len(renders), len(uploads)) == (1, 1)
+
+    with mlflow.start_run():
+        plugin.log_xai_report(explanation.feature_names, explanation)
+    assert (len(renders), len(uploads)) == (1, 2)
+
+    with mlflow.start_run() as third:
+        reference = plugin.log_xai_report(explanation.feature_names, explanation, on_duplicate="reference")
+        plugin.log_xai_report(explanation.feature_names, explanation, round_decimals=2, report_name="rounded.html")
+    assert reference == f"runs:/{first.info.run_id}/reports/feature_importance_report.html"
+    tags = mlflow.get_run(third.info.run_id).data.tags
+    assert tags["xaiflow.report_reference.reports/feature_importance_report.html"] == reference
+    assert (len(renders), len(uploads)) == (2, 3)
+
+    with pytest.raises(ValueError, match="on_duplicate"):
+        plugin.log_xai_report(explanation.feature_names, explanation, on_duplicate="skip", run_id="any")
+
+
+def test_cache_removes_least_recently_used_entries(tmp_path):
+    cache = ReportCache(str(tmp_path), max_bytes=2500)
+
+    def render(path):
+        with open(path, "w") as f:
+            f.write("x" * 1000)
+
+    for key in ("first", "second"):
+        cache.put(key, render)
+    assert cache.get("first") is not None
+    cache.put("third", render)
+    assert cache.get("second") is None
+    assert cache.get("first") is not None and cache.get("third") is not None
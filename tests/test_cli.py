@@ -0,0 +1,52 @@
+import os
+
+import mlflow
+import numpy as np
+
+from xaiflow.cli import main
+
+from tests.conftest import extract_payload, logged_payload, make_explanation
+
+
+def save_inputs(directory):
+    """One .npz input and one directory of .npy files"""
+    first, second = make_explanation(n_rows=40, seed=1), make_explanation(n_rows=30, seed=2)
+    np.savez(directory / "fold_1.npz", shap_values=first.values, data=first.data, base_values=np.float64(0.5),
+             feature_names=np.array(first.feature_names), group_labels=np.array(["a", "b"] * 20))
+    os.makedirs(directory / "fold_2")
+    np.save(directory / "fold_2" / "shap_values.npy", second.values)
+    np.save(directory / "fold_2" / "data.npy", second.data)
+    return [str(directory / "fold_1.npz"), str(directory / "fold_2")], first, second
+
+
+def test_render_writes_reports_to_disk(tmp_path, capsys):
+    inputs, first, second = save_inputs(tmp_path)
+    output_dir = tmp_path / "out"
+    assert main(["render", *inputs, "--output-dir", str(output_dir), "--workers", "2"]) == 0
+
+    with open(output_dir / "fold_1.html", encoding="utf-8") as f:
+        payload = extract_payload(f.read())
+    assert payload["feature_names"] == first.feature_names
+    assert payload["groups"]["labels"] == ["a", "b"]
+    assert (output_dir / "fold_1.summary.json").exists()
+    with open(output_dir / "fold_2.html", encoding="utf-8") as f:
+        assert extract_payload(f.read())["feature_names"] == ["Feature 0", "Feature 1", "Feature 2", "Feature 3"]
+
+    # one progress line per report with its timings, then the total
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 3 and all("render" in line for line in lines[:2])
+    assert lines[2].startswith("2/2 reports in")
+
+
+def test_render_logs_reports_to_a_run(local_tracking):
+    inputs, first, _ = save_inputs(local_tracking)
+    with mlflow.start_run() as run:
+        pass
+    assert main(["render", inputs[0], "--run-id", run.info.run_id, "--split"]) == 0
+    assert logged_payload(run.info.run_id, "fold_1.html")["shards"]["rows"] == 40
+
+
+def test_render_rejects_incomplete_inputs(tmp_path, capsys):
+    np.savez(tmp_path / "values.npz", shap_values=np.zeros((3, 2)))
+    assert main(["render", str(tmp_path / "values.npz"), "--output-dir", str(tmp_path)]) == 2
+    assert "holds no data array" in capsys.readouterr().err
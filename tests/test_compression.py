@@ -0,0 +1,119 @@
+import json
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from xaiflow import ReportGenerator, XaiflowPlugin
+from xaiflow import compression
+from xaiflow.compression import COMPRESSION_CODECS, decompress, iter_compressed
+from xaiflow.encoding import decode_column, encode_column
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def extract_block(html_content: str, block_id: str) -> tuple:
+    """Helper function to read a compressed block and its codec back from a report."""
+    match = re.search(
+        rf'<script type="application/octet-stream" id="{block_id}" data-compression="([a-z-]+)">(.*?)</script>',
+        html_content,
+        re.S,
+    )
+    assert match is not None, f"compressed {block_id} block not found in report"
+    return match.group(1), match.group(2)
+
+
+def render(**kwargs) -> str:
+    values = np.random.default_rng(0).normal(size=(300, 3))
+    return ReportGenerator().render(
+        importance_data={'features': ['a', 'b', 'c'], 'values': [0.2, 0.3, 0.5]},
+        shap_values=values,
+        feature_values=np.round(values, 1),
+        feature_names=['a', 'b', 'c'],
+        round_decimals=3,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("codec", list(COMPRESSION_CODECS))
+def test_streamed_compression_round_trip(codec, monkeypatch):
+    monkeypatch.setattr(compression, "_PIECE_BYTES", 30)
+    rng = np.random.default_rng(0)
+    pieces = [f'{{"row":{i},"value":{rng.random()}}},' for i in range(20_000)]
+    streamed = list(iter_compressed(pieces, codec, level=1))
+    assert len(streamed) > 1
+    assert all("=" not in piece for piece in streamed[:-1])
+    assert decompress("".join(streamed), codec) == "".join(pieces)
+
+
+def decoded_columns(payload: dict) -> list:
+    return [decode_column(column) for key in ("shap_values", "feature_values") for column in payload[key]["columns"]]
+
+
+def test_compressed_report_compresses_every_column():
+    plain = extract_payload(render())
+    html_content = render(compression="gzip", compression_level=9, compress_bundle=True)
+
+    # the metadata stays plain JSON, base64 is applied once to the compressed column bytes
+    payload = extract_payload(html_content)
+    assert payload["feature_names"] == plain["feature_names"]
+    assert {column["compression"] for column in payload["shap_values"]["columns"]} == {"gzip"}
+    for compressed, expected in zip(decoded_columns(payload), decoded_columns(plain)):
+        np.testing.assert_array_equal(compressed, expected)
+    codec, data = extract_block(html_content, "xaiflow-bundle")
+    assert decompress(data, codec) == ReportGenerator().load_bundle()
+    plain_size = len(json.dumps(plain)) + len(ReportGenerator().load_bundle())
+    assert len(json.dumps(payload)) + len(data) < plain_size / 2
+
+
+def test_compressed_column_round_trip():
+    values = np.repeat(np.arange(50, dtype=np.float32), 400)
+    column = encode_column(values, compression="deflate-raw")
+
+    assert column["compression"] == "deflate-raw" and column["dtype"] == "float32"
+    assert len(column["data"]) < len(encode_column(values)["data"]) / 10
+    np.testing.assert_array_equal(decode_column(column), values)
+    # JSON columns are never compressed
+    assert "compression" not in encode_column(values, "json", compression="gzip")
+
+
+def test_compressed_json_report_embeds_same_payload():
+    plain = extract_payload(render(payload_encoding="json"))
+    codec, data = extract_block(render(payload_encoding="json", compression="gzip"), "xaiflow-payload")
+    assert codec == "gzip"
+    assert json.loads(decompress(data, codec)) == plain
+
+
+def test_invalid_compression_is_rejected():
+    with pytest.raises(ValueError, match="compression must be one of"):
+        render(compression="brotli")
+    with pytest.raises(ValueError, match="requires a compression codec"):
+        render(compress_bundle=True)
+    explanation = make_explanation()
+    with pytest.raises(ValueError, match="compression must be one of"):
+        XaiflowPlugin().log_xai_report(explanation.feature_names, explanation, run_id="any", compression="zip")
+
+
+# inflate, readBlock and inflateColumns of report.html
+IN_PAGE_DECODER = r"(async function inflate\(.*?async function inflateColumns\(node\) \{.*?\n        \})"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the in-page decoder")
+@pytest.mark.parametrize("codec", list(COMPRESSION_CODECS))
+@pytest.mark.parametrize("payload_encoding", ["binary", "json"])
+def test_in_page_decoder_reads_compressed_payload(codec, payload_encoding):
+    html_content = render(compression=codec, payload_encoding=payload_encoding)
+    # the decoder of report.html, run against a stand-in for the script element
+    decoder = re.search(IN_PAGE_DECODER, html_content, re.S).group(1)
+    match = re.search(r'id="xaiflow-payload"(?: data-compression="([a-z-]+)")?>(.*?)</script>', html_content, re.S)
+    script = (
+        f"{decoder}\n"
+        f"readBlock({{dataset: {{compression: {json.dumps(match.group(1))}}}, textContent: {json.dumps(match.group(2))}}})"
+        ".then(async (text) => { const raw = JSON.parse(text); await inflateColumns(raw);"
+        " process.stdout.write(JSON.stringify(raw, (key, value) =>"
+        " value instanceof Uint8Array ? Buffer.from(value).toString('base64') : value)); });"
+    )
+    output = subprocess.run(["node", "-e", script], check=True, capture_output=True, text=True).stdout
+    assert json.loads(output) == extract_payload(render(payload_encoding=payload_encoding))
@@ -0,0 +1,61 @@
+import mlflow
+import numpy as np
+
+from xaiflow import XaiflowPlugin
+from xaiflow.correlations import correlation_matrix, correlation_payload, strongest_partners
+
+from tests.conftest import logged_payload, make_explanation
+
+
+def test_correlation_matrix_matches_numpy_across_blocks_and_threads():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(1000, 5)) + 1e6
+    matrix[:, 1] = 2 * matrix[:, 0] + rng.normal(scale=0.1, size=1000)
+    # a block budget of a few rows spreads the rows over many blocks
+    result = correlation_matrix(matrix, max_bytes=5 * 4 * 8 * 16, max_workers=3)
+    np.testing.assert_allclose(result, np.corrcoef(matrix, rowvar=False), atol=1e-9)
+
+
+def test_correlation_matrix_leaves_out_missing_and_constant_columns():
+    matrix = np.array([[1.0, 2.0, 5.0, "a"], [2.0, 4.0, 5.0, "b"], [3.0, np.nan, 5.0, "c"], [4.0, 8.0, 5.0, "d"]], dtype=object)
+    result = correlation_matrix(matrix, max_workers=2)
+    # rows with a NaN count for the pairs of the other columns
+    assert result[0, 1] == 1.0
+    assert np.isnan(result[2]).all() and np.isnan(result[3]).all()
+
+
+def test_strongest_partners_rank_by_absolute_correlation():
+    correlations = np.array([[1.0, -0.9, 0.5], [-0.9, 1.0, np.nan], [0.5, np.nan, 1.0]])
+    partners = strongest_partners(correlations, top=1)
+    assert partners == {"partners": [[1], [0], [0]], "values": [[-0.9], [-0.9], [0.5]]}
+
+
+def test_correlation_payload_pairs_shap_columns_of_the_same_output():
+    rng = np.random.default_rng(1)
+    shap_values = rng.normal(size=(500, 3, 2))
+    shap_values[:, 2, 0] = shap_values[:, 0, 0]
+    shap_values[:, 1, 1] = -shap_values[:, 2, 1]
+    payload = correlation_payload(shap_values, None, top=1)
+    # SHAP column j * outputs + o
+    assert payload["shap"]["partners"][0] == [2] and payload["shap"]["partners"][3] == [2]
+    np.testing.assert_allclose(payload["shap"]["values"][3], [-1.0])
+    assert payload["features"] is None
+    # a transposed (non-contiguous) tensor gives the same partners
+    transposed = correlation_payload(np.asfortranarray(shap_values), None, top=1)
+    assert transposed["shap"]["partners"] == payload["shap"]["partners"]
+    np.testing.assert_allclose(transposed["shap"]["values"], payload["shap"]["values"])
+
+
+def test_correlations_are_embedded_in_the_report(local_tracking):
+    explanation = make_explanation(n_rows=200)
+    explanation.values[:, 3] = 0.5 * explanation.values[:, 0]
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, correlation_top=2, report_name="partners.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, report_name="none.html")
+
+    correlations = logged_payload(run.info.run_id, "partners.html")["correlations"]
+    assert correlations["top"] == 2
+    assert correlations["shap"]["partners"][0][0] == 3
+    assert len(correlations["features"]["partners"]) == 4
+    assert logged_payload(run.info.run_id, "none.html")["correlations"] is None
@@ -0,0 +1,66 @@
+import mlflow
+import numpy as np
+
+from xaiflow import XaiflowPlugin
+from xaiflow import mlflow_plugin
+from xaiflow.density import density_column, density_histograms
+from xaiflow.encoding import decode_column
+
+from tests.conftest import logged_payload, make_explanation
+
+
+def test_density_column_counts_finite_rows_per_group():
+    feature_column = np.array([0.0, 1.0, 2.0, 3.0, np.nan, 3.0])
+    shap_column = np.array([0.0, 0.0, 1.0, 1.0, 1.0, np.inf])
+    histogram = density_column(feature_column, shap_column, n_bins=2, group_codes=np.array([0, 1, 0, 1, 0, 1]), n_groups=2)
+
+    assert histogram["x"] == [0.0, 3.0] and histogram["y"] == [0.0, 1.0]
+    # (groups x SHAP bins x feature bins), the maxima fall into the last bins
+    np.testing.assert_array_equal(histogram["counts"][0], [[1, 0], [0, 1]])
+    np.testing.assert_array_equal(histogram["counts"][1], [[1, 0], [0, 1]])
+    assert density_column(np.full(3, np.nan), np.zeros(3)) is None
+
+
+def test_density_histograms_bin_encoded_features_per_output():
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(size=(300, 2, 3))
+    feature_values = np.column_stack([rng.normal(size=300), np.array(["b", "a", "c"] * 100, dtype=object)])
+    histograms = density_histograms(shap_values, feature_values, n_bins=8)
+
+    assert len(histograms) == 6
+    assert all(histogram["counts"].sum() == 300 for histogram in histograms)
+    # the dictionary codes of the report ("a", "b", "c" -> 0, 1, 2)
+    assert histograms[3]["x"] == [0.0, 2.0]
+    np.testing.assert_array_equal(histograms[3]["counts"][0].sum(axis=0)[[0, 4, 7]], [100, 100, 100])
+
+
+def test_density_is_embedded_above_the_threshold(local_tracking):
+    explanation = make_explanation(n_rows=400)
+    group_labels = ["a", "b"] * 200
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, group_labels=group_labels,
+                              density_bins=16, density_threshold=100, report_name="density.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, density_bins=None, report_name="points.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, report_name="small.html")
+
+    density = logged_payload(run.info.run_id, "density.html")["density"]
+    assert density["bins"] == 16 and density["threshold"] == 100
+    counts = decode_column(density["columns"][1]["counts"]).reshape(2, 16, 16)
+    assert counts[0].sum() == counts[1].sum() == 200
+    assert density["columns"][1]["y"] == [explanation.values[:, 1].min(), explanation.values[:, 1].max()]
+    assert logged_payload(run.info.run_id, "points.html")["density"] is None
+    # below the default threshold the points are always drawn
+    assert logged_payload(run.info.run_id, "small.html")["density"] is None
+
+
+def test_no_histograms_are_computed_up_to_the_threshold(local_tracking, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("density_histograms called below the threshold")
+
+    monkeypatch.setattr(mlflow_plugin, "density_histograms", fail)
+    explanation = make_explanation(n_rows=100)
+    with mlflow.start_run() as run:
+        XaiflowPlugin().log_xai_report(explanation.feature_names, explanation, density_bins=16, density_threshold=100)
+
+    assert logged_payload(run.info.run_id)["density"] is None
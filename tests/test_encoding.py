@@ -0,0 +1,172 @@
+import json
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from xaiflow import ReportGenerator
+from xaiflow.encoding import decode_column, dumps_for_script, encode_column, encode_matrix, iter_encoded_matrix
+from xaiflow.mlflow_plugin import XaiflowPlugin
+
+from tests.conftest import extract_payload
+
+
+# The decoding functions of report.html run in node on its payload block, for a bundle.js
+# without decodeXaiflowPayload
+LEGACY_PROPS = """
+%(functions)s
+const element = { textContent: %(block)s, dataset: %(dataset)s };
+readBlock(element).then(async (text) => {
+  const raw = JSON.parse(text);
+  await inflateColumns(raw);
+  const props = legacyProps(raw);
+  process.stdout.write(JSON.stringify(props, (key, value) => ArrayBuffer.isView(value) ? Array.from(value) : value));
+});
+"""
+
+
+@pytest.mark.parametrize("values, expected_dtype", [
+    (np.array([0.5, 1.25, -3.0]), "float32"),
+    (np.array([0, 3, 255]), "uint8"),
+    (np.array([-1, 70000]), "int32"),
+    (np.array([0, 2 ** 40]), "float64"),
+    (np.array([True, False, True]), "bits"),
+    (np.array([1.0, 2.0], dtype=object), "float32"),
+])
+def test_encode_column_picks_smallest_dtype(values, expected_dtype):
+    column = encode_column(values)
+    assert column["dtype"] == expected_dtype
+    np.testing.assert_allclose(decode_column(column).astype(float), values.astype(float))
+
+
+def test_encode_column_falls_back_to_json():
+    column = encode_column(np.array([1.0, np.nan]), payload_encoding="json")
+    assert column == {"dtype": "json", "data": [1.0, None]}
+
+
+def test_string_columns_are_dictionary_encoded():
+    values = np.array(["State-gov", "Private", None, "Self-emp-not-inc"] * 1000, dtype=object)
+    column = encode_column(values)
+    assert column["dtype"] == "uint8"
+    assert column["categories"] == ["None", "Private", "Self-emp-not-inc", "State-gov"]
+    np.testing.assert_array_equal(np.asarray(column["categories"])[decode_column(column)], values.astype(str))
+    assert len(json.dumps(column)) < len(json.dumps(values.tolist())) / 8
+
+    column = encode_column(np.array(["x", "y", "x"]), payload_encoding="json")
+    assert column == {"dtype": "json", "categories": ["x", "y"], "data": [0, 1, 0]}
+
+
+def test_numeric_looking_strings_are_dictionary_encoded():
+    column = encode_column(np.array(["001", "002", "010", "002"], dtype=object))
+    assert column["categories"] == ["001", "002", "010"]
+    np.testing.assert_array_equal(decode_column(column), [0, 1, 2, 1])
+    # actual numbers (and None) are still numeric
+    column = encode_column(np.array([1, 2.5, None, True], dtype=object))
+    assert "categories" not in column
+    np.testing.assert_array_equal(decode_column(column), [1, 2.5, np.nan, 1])
+
+
+def test_mixed_dtype_matrix_shrinks_by_an_order_of_magnitude():
+    rng = np.random.default_rng(0)
+    n_rows = 20_000
+    matrix = np.empty((n_rows, 4), dtype=object)
+    matrix[:, 0] = rng.choice(["Private", "Self-emp-not-inc", "State-gov", "Local-gov"], n_rows)
+    matrix[:, 1] = (rng.random(n_rows) > 0.5).tolist()
+    matrix[:, 2] = rng.choice(["Married-civ-spouse", "Never-married", "Divorced"], n_rows)
+    matrix[:, 3] = rng.integers(0, 50, n_rows).tolist()
+    encoded = encode_matrix(matrix)
+    assert [column["dtype"] for column in encoded["columns"]] == ["uint8", "bits", "uint8", "uint8"]
+    assert len(json.dumps(encoded)) * 10 < len(json.dumps(matrix.tolist()))
+
+
+@pytest.mark.parametrize("n_rows", [1, 8, 13, 100])
+def test_booleans_are_bit_packed(n_rows):
+    values = np.random.default_rng(n_rows).random(n_rows) > 0.5
+    column = json.loads("".join(iter_encoded_matrix(values[:, None], block_rows=5)))["columns"][0]
+    assert column["dtype"] == "bits"
+    assert column["length"] == n_rows
+    assert column["categories"] == ["False", "True"]
+    np.testing.assert_array_equal(decode_column(column), values)
+
+    column = encode_column(values, payload_encoding="json")
+    assert column["data"] == values.astype(int).tolist()
+
+
+def test_encode_matrix_is_column_major():
+    matrix = np.arange(6, dtype=float).reshape(3, 2) / 3
+    encoded = encode_matrix(matrix, round_decimals=2)
+    assert encoded["shape"] == [3, 2]
+    assert len(encoded["columns"]) == 2
+    np.testing.assert_allclose(decode_column(encoded["columns"][1]), np.round(matrix[:, 1], 2), rtol=1e-6)
+
+
+def test_multi_output_tensor_is_encoded_feature_major():
+    tensor = np.arange(24, dtype=float).reshape(2, 3, 4)[:, :, ::2]  # non-contiguous view
+    encoded = json.loads("".join(iter_encoded_matrix(tensor)))
+    assert encoded["shape"] == [2, 3, 2]
+    assert len(encoded["columns"]) == 6
+    np.testing.assert_array_equal(decode_column(encoded["columns"][1 * 2 + 1]), tensor[:, 1, 1])
+
+
+def test_dumps_for_script_escapes_closing_tags():
+    dumped = dumps_for_script({"label": "</script>", "value": np.float32(1.5)})
+    assert "</script>" not in dumped
+    assert json.loads(dumped) == {"label": "</script>", "value": 1.5}
+
+
+@pytest.mark.parametrize("payload_encoding", ["binary", "json"])
+def test_generate_html_content_embeds_payload(payload_encoding):
+    plugin = XaiflowPlugin()
+    shap_values = np.array([[0.1, -0.2], [0.3, 0.4], [0.5, 0.6]])
+    html_content = plugin._generate_html_content(
+        importance_data={'features': ['a', 'b'], 'values': [0.5, 0.5]},
+        shap_values=shap_values,
+        feature_values=np.array([[1, True], [2, False], [3, True]], dtype=object),
+        base_values=np.float64(0.25),
+        feature_names=['a', 'b'],
+        group_labels=np.array(['x', 'y', 'x']),
+        payload_encoding=payload_encoding,
+    )
+    payload = extract_payload(html_content)
+    assert payload["shap_values"]["shape"] == [3, 2]
+    assert payload["base_values"] == [0.25]
+    assert payload["groups"]["labels"] == ['x', 'y']
+    np.testing.assert_array_equal(decode_column(payload["groups"]["codes"]), [0, 1, 0])
+    np.testing.assert_allclose(decode_column(payload["shap_values"]["columns"][0]), shap_values[:, 0], rtol=1e-6)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the template script")
+@pytest.mark.parametrize("payload_encoding, compression", [("binary", None), ("binary", "gzip"), ("json", "deflate")])
+def test_report_renders_with_a_bundle_older_than_the_payload(payload_encoding, compression):
+    shap_values = np.arange(24, dtype=float).reshape(4, 3, 2) / 8
+    html_content = ReportGenerator().render(
+        importance_data={'features': ['a', 'b', 'c'], 'values': [0.2, 0.3, 0.5]},
+        shap_values=shap_values,
+        feature_values=np.array([[1.5, True, 'x'], [2.5, False, 'y'], [3.5, True, 'x'], [4.5, True, 'z']], dtype=object),
+        base_values=np.array([0.25, 0.75]),
+        feature_names=['a', 'b', 'c'],
+        feature_encodings={'a': {0: 'unused'}},
+        group_labels=np.array(['g1', 'g2', 'g1', 'g2']),
+        payload_encoding=payload_encoding,
+        compression=compression,
+    )
+    script = re.search(r"(async function inflate\(.*?)document\.addEventListener", html_content, re.S).group(1)
+    block = re.search(r'<script [^>]*id="xaiflow-payload"[^>]*>(.*?)</script>', html_content, re.S).group(1)
+    source = LEGACY_PROPS % {
+        "functions": script,
+        "block": json.dumps(block),
+        "dataset": json.dumps({"compression": compression} if compression and payload_encoding == "json" else {}),
+    }
+    props = json.loads(subprocess.run(["node", "-e", source], check=True, capture_output=True, text=True).stdout)
+
+    # the first output, row-major as the baseline bundle reads it
+    np.testing.assert_allclose(props["shapValues"], shap_values[:, :, 0], rtol=1e-6)
+    assert props["featureValues"] == [[1.5, 1, 0], [2.5, 0, 1], [3.5, 1, 0], [4.5, 1, 2]]
+    assert props["baseValues"] == 0.25
+    assert props["featureEncodings"] == {
+        'a': {'0': 'unused'}, 'b': {'0': 'False', '1': 'True'}, 'c': {'0': 'x', '1': 'y', '2': 'z'},
+    }
+    assert props["featureNames"] == ['a', 'b', 'c']
+    assert props["groupLabels"] == ['g1', 'g2', 'g1', 'g2']
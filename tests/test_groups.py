@@ -0,0 +1,33 @@
+import numpy as np
+
+from xaiflow.groups import GroupIndex
+from xaiflow.summaries import summarize_features
+
+
+def test_group_index_encodes_labels_and_rows():
+    group_index = GroupIndex(["b", "a", "b", "c", "a", "b"])
+
+    assert group_index.labels == ["a", "b", "c"]
+    np.testing.assert_array_equal(group_index.codes, [1, 0, 1, 2, 0, 1])
+    assert group_index.counts == [2, 3, 1]
+    np.testing.assert_array_equal(group_index.rows(0), [1, 4])
+    np.testing.assert_array_equal(group_index.rows(1), [0, 2, 5])
+    np.testing.assert_array_equal(group_index.rows(2), [3])
+
+
+def test_group_mean_abs_matches_masked_mean():
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(size=(1000, 4))
+    group_labels = rng.choice(["x", "y", "z"], size=1000)
+    group_index = GroupIndex(group_labels)
+
+    importance = group_index.mean_abs(shap_values, block_rows=64)
+    for group, label in enumerate(group_index.labels):
+        np.testing.assert_allclose(importance[group], np.abs(shap_values[group_labels == label]).mean(axis=0))
+
+    summaries = summarize_features(shap_values, group_index)
+    assert summaries["groups"]["counts"] == group_index.counts
+
+
+def test_numeric_group_labels_become_strings():
+    assert GroupIndex(np.array([3, 1, 3])).labels == ["1", "3"]
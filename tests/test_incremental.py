@@ -0,0 +1,129 @@
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.encoding import decode_column
+from xaiflow.incremental import ReportStore
+from xaiflow.shards import decode_shard, payload_headers
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def batch(explanation, rows):
+    return shap.Explanation(
+        values=explanation.values[rows], base_values=explanation.base_values[rows],
+        data=explanation.data[rows], feature_names=explanation.feature_names,
+    )
+
+
+def logged(run_id, name):
+    directory = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="reports")
+    with open(f"{directory}/{name}", encoding="utf-8") as f:
+        return directory, extract_payload(f.read())
+
+
+def read_parts(directory, payload, shard_file):
+    """Decode the per-batch parts of a shard entry and concatenate them like ShardLoader"""
+    headers = payload_headers(payload)
+    decoded = [
+        decode_shard(open(f"{directory}/{payload['shards']['url']}{part['path']}", "rb").read(), part, headers, 0)
+        for part in shard_file["parts"]
+    ]
+    return {key: np.concatenate([part[key] for part in decoded]) for key in decoded[0]}
+
+
+def test_appended_report_matches_full_report(local_tracking):
+    explanation = make_explanation(n_rows=300)
+    group_labels = np.array(["a", "b", "c"] * 100)
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, group_labels=list(group_labels), report_name="full.html")
+        for rows in (slice(0, 120), slice(120, 250), slice(250, 300)):
+            artifact = plugin.append_xai_report(explanation.feature_names, batch(explanation, rows),
+                                                group_labels=list(group_labels[rows]), report_name="live.html")
+    assert artifact == "reports/live.html"
+    _, expected = logged(run.info.run_id, "full.html")
+    directory, payload = logged(run.info.run_id, "live.html")
+
+    np.testing.assert_allclose(payload["importance_data"]["values"], expected["importance_data"]["values"], atol=1e-4)
+    overall, expected_overall = np.array(payload["summaries"]["overall"]), np.array(expected["summaries"]["overall"])
+    np.testing.assert_allclose(overall[:4], expected_overall[:4], atol=1e-6)
+    assert payload["groups"]["labels"] == ["a", "b", "c"]
+    assert payload["groups"]["offsets"] == expected["groups"]["offsets"]
+    np.testing.assert_allclose(payload["groups"]["importance"], expected["groups"]["importance"], atol=1e-6)
+
+    manifest = payload["shards"]
+    assert manifest["rows"] == 300
+    assert [part["path"] for part in manifest["features"][1]["parts"]] == [
+        "batch_0/feature_1.bin", "batch_1/feature_1.bin", "batch_2/feature_1.bin",
+    ]
+    feature = read_parts(directory, payload, manifest["features"][1])
+    np.testing.assert_allclose(feature[("shap_values", 1)], np.round(explanation.values[:, 1], 4), rtol=1e-5)
+    np.testing.assert_allclose(feature[("feature_values", 1)], np.round(explanation.data[:, 1], 4), rtol=1e-5)
+    codes = read_parts(directory, payload, manifest["groups"])[("groups", 0)]
+    np.testing.assert_array_equal(codes, np.tile([0, 1, 2], 100))
+    assert [(block["start"], block["stop"]) for block in manifest["row_blocks"]] == [(0, 120), (120, 250), (250, 300)]
+
+
+def test_window_evicts_old_batches(local_tracking):
+    explanation = make_explanation(n_rows=300)
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, batch(explanation, slice(100, 300)), report_name="recent.html")
+        for rows in (slice(0, 100), slice(100, 200), slice(200, 300)):
+            plugin.append_xai_report(explanation.feature_names, batch(explanation, rows), window=2,
+                                     max_points_per_feature=50, report_name="live.html")
+    _, expected = logged(run.info.run_id, "recent.html")
+    directory, payload = logged(run.info.run_id, "live.html")
+
+    np.testing.assert_allclose(payload["importance_data"]["values"], expected["importance_data"]["values"], atol=1e-4)
+    np.testing.assert_allclose(payload["summaries"]["overall"][:4], expected["summaries"]["overall"][:4], atol=1e-6)
+    manifest = payload["shards"]
+    assert manifest["rows"] == 200
+    assert [part["path"] for part in manifest["features"][0]["parts"]] == ["batch_1/feature_0.bin", "batch_2/feature_0.bin"]
+    assert payload["scatter_samples"]["total_rows"] == 200
+    for column, indices in enumerate(payload["scatter_samples"]["indices"]):
+        indices = decode_column(indices)
+        assert len(indices) <= 50 and indices.max() < 200
+        assert explanation.values[100:, column].argmax() in indices
+    shap_column = read_parts(directory, payload, manifest["features"][0])[("shap_values", 0)]
+    np.testing.assert_allclose(shap_column, np.round(explanation.values[100:, 0], 4), rtol=1e-5)
+
+    with mlflow.start_run():
+        plugin.append_xai_report(explanation.feature_names, batch(explanation, slice(0, 10)), group_labels=["a"] * 10)
+        with pytest.raises(ValueError, match="every appended batch or for none"):
+            plugin.append_xai_report(explanation.feature_names, batch(explanation, slice(10, 20)))
+
+
+def test_store_extends_feature_categories(tmp_path):
+    store = ReportStore(str(tmp_path / "store"))
+    store.create(["size", "flag"], (2,))
+    first = np.array([["small", True], ["large", False]], dtype=object)
+    second = np.array([["medium", False], ["small", True]], dtype=object)
+    store.append(np.ones((2, 2)), first)
+    store.append(np.ones((2, 2)), second)
+
+    payload = store.report_data("store/")
+    size, flag = payload["shards"].headers["feature_values"]
+    assert size["categories"] == ["small", "large", "medium"]
+    assert flag["categories"] == ["True", "False"]
+    part = payload["shards"].manifest["features"][0]["parts"][1]
+    column = decode_shard((tmp_path / "store" / part["path"]).read_bytes(), part, payload["shards"].headers, 0)
+    np.testing.assert_array_equal(column[("feature_values", 0)], [2, 0])
+
+
+def test_failed_append_keeps_the_store_state(tmp_path, monkeypatch):
+    store = ReportStore(str(tmp_path / "store"))
+    store.create(["size"], (1,))
+    store.append(np.ones((2, 1)), np.array([["small"], ["large"]], dtype=object), group_labels=["a", "b"])
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("xaiflow.incremental.write_shards", fail)
+    with pytest.raises(OSError):
+        store.append(np.ones((1, 1)), np.array([["medium"]], dtype=object), group_labels=["c"])
+    assert store.state["categories"] == [["small", "large"]]
+    assert store.state["group_labels"] == ["a", "b"]
@@ -0,0 +1,45 @@
+import mlflow
+import numpy as np
+
+from xaiflow import XaiflowPlugin
+from xaiflow.instrumentation import STAGES, StageRecorder
+
+from tests.conftest import make_explanation
+
+
+def test_report_stages_are_recorded_and_logged(local_tracking):
+    explanation = make_explanation(n_rows=200)
+    received = []
+    plugin = XaiflowPlugin(trace_memory=True, log_stage_metrics=True, stage_callback=received.append)
+    with mlflow.start_run() as run:
+        path = plugin.log_xai_report(explanation.feature_names, explanation, split=True, shard_rows=50)
+
+    assert path == "reports/feature_importance_report.html"
+    assert list(path.stages) == list(STAGES)
+    assert received == list(path.stages.values())
+    for record in path.stages.values():
+        assert record.run_id == run.info.run_id and record.report_name == "feature_importance_report.html"
+        assert record.seconds >= 0 and record.peak_bytes >= 0
+    # the shards count towards the output of a split report
+    assert path.stages["render"].output_bytes == path.stages["log"].output_bytes > 200 * 4 * 4
+    assert path.stages["aggregate"].output_bytes is None
+
+    metrics = mlflow.get_run(run.info.run_id).data.metrics
+    assert metrics["xaiflow/feature_importance_report.html/render/output_bytes"] == path.stages["render"].output_bytes
+    assert "xaiflow/feature_importance_report.html/prepare/seconds" in metrics
+
+
+def test_recorder_adds_up_repeated_stages():
+    recorder = StageRecorder("report.html", trace_memory=True)
+    with recorder.stage("aggregate"):
+        first = np.ones(1_000_000)
+    del first
+    with recorder.stage("aggregate") as measured:
+        measured["output_bytes"] = 10
+    recorder.record("render", 0.5)
+    records = recorder.finish()
+
+    assert list(records) == ["aggregate", "render"]
+    assert records["aggregate"].peak_bytes >= 8_000_000
+    assert records["aggregate"].output_bytes == 10
+    assert records["render"].seconds == 0.5 and records["render"].peak_bytes is None
@@ -0,0 +1,76 @@
+import mlflow
+import numpy as np
+
+from xaiflow import XaiflowPlugin
+from xaiflow.encoding import decode_column
+from xaiflow.groups import GroupIndex
+from xaiflow.observations import SimilarityIndex, extreme_rows, predictions, top_bottom
+
+from tests.conftest import logged_payload, make_explanation
+
+
+def test_top_bottom_skips_nan_and_pads_short_lists():
+    values = np.array([0.5, np.nan, 3.0, -1.0, 3.0])
+    np.testing.assert_array_equal(top_bottom(values, 2), [2, 4, 3, 0])
+    # rows restrict the lists, row indices refer to the full column
+    np.testing.assert_array_equal(top_bottom(values, 3, rows=np.array([1, 3])), [3, -1, -1, 3, -1, -1])
+    # integer columns, and float32 columns compared without converting them
+    np.testing.assert_array_equal(top_bottom(np.array([3, 1, 2]), 1), [0, 1])
+    np.testing.assert_array_equal(top_bottom(np.array([0.5, 2.0, -1.0], dtype=np.float32), 1, rows=np.array([0, 2])), [0, 2])
+
+
+def test_extreme_rows_keep_lists_per_group():
+    column = np.arange(6, dtype=float)
+    group_index = GroupIndex(["a", "b", "a", "b", "a", "b"])
+    (lists,) = extreme_rows([column], 1, group_index)
+    # overall, then "a" and "b": [highest, lowest] each
+    np.testing.assert_array_equal(lists, [5, 0, 4, 0, 5, 1])
+
+
+def test_predictions_add_base_values_per_output():
+    shap_values = np.array([[[1.0, 2.0], [np.nan, 1.0]], [[0.0, -1.0], [1.0, 0.0]]])
+    np.testing.assert_allclose(predictions(shap_values, [0.5, -0.5], block_rows=1), [[1.5, 2.5], [1.5, -1.5]])
+
+
+def test_similarity_index_clusters_close_rows_together():
+    rng = np.random.default_rng(0)
+    centers = np.array([[-5.0, -5.0], [5.0, 5.0]])
+    shap_values = np.concatenate([center + rng.normal(scale=0.1, size=(200, 2)) for center in centers])
+    index = SimilarityIndex(shap_values, seed=0, sample_size=100, block_rows=64)
+
+    assert len(index.centroids) == 20
+    # no cluster mixes rows of both blobs
+    assert not set(index.clusters[:200]) & set(index.clusters[200:])
+    codes = index.codes(shap_values[:, 0], 0)
+    assert codes.dtype == np.uint8 and codes.min() == 0 and codes.max() == 255
+
+
+def test_observation_index_is_embedded_in_the_report(local_tracking):
+    explanation = make_explanation(n_rows=60)
+    group_labels = ["a", "b", "c"] * 20
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, group_labels=group_labels,
+                              observation_k=3, similar_observations=True, report_name="index.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, report_name="lists.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, observation_k=None, report_name="none.html")
+        plugin.log_xai_report(explanation.feature_names, explanation, split=True, similar_observations=True,
+                              report_name="split.html")
+
+    index = logged_payload(run.info.run_id, "index.html")["observation_index"]
+    assert index["k"] == 3 and index["groups"] == 3
+    assert len(index["extremes"]) == 4 and len(index["predictions"]) == 1
+    lists = decode_column(index["extremes"][1])
+    assert len(lists) == 4 * 2 * 3
+    np.testing.assert_array_equal(lists[:3], np.argsort(-explanation.values[:, 1], kind="stable")[:3])
+    prediction = explanation.values.sum(axis=1) + 0.5
+    np.testing.assert_array_equal(decode_column(index["predictions"][0])[3:6], np.argsort(prediction)[:3])
+    similar = index["similar"]
+    assert len(similar["codes"]) == 4 and len(decode_column(similar["clusters"])) == 60
+
+    lists = logged_payload(run.info.run_id, "lists.html")["observation_index"]
+    assert lists["k"] == 10 and lists["groups"] is None and lists["similar"] is None
+    assert logged_payload(run.info.run_id, "none.html")["observation_index"] is None
+    # the lists stay in the shell of a split report, the similarity codes would bloat it
+    split = logged_payload(run.info.run_id, "split.html")["observation_index"]
+    assert len(split["extremes"]) == 4 and split["similar"] is None
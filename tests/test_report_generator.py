@@ -0,0 +1,150 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import ReportGenerator, XaiflowPlugin
+from xaiflow.encoding import decode_column
+from xaiflow.report_generator import get_environment, read_cached
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def test_write_matches_render(tmp_path):
+    generator = ReportGenerator()
+    explanation = make_explanation()
+    report_data = dict(
+        importance_data={'features': explanation.feature_names, 'values': [0.25] * 4},
+        shap_values=explanation.values,
+        feature_values=explanation.data,
+        group_labels=["a", "b"] * 25,
+        base_values=0.5,
+        feature_names=explanation.feature_names,
+        round_decimals=3,
+        block_rows=9,
+    )
+    path = tmp_path / "report.html"
+    generator.write(str(path), **report_data)
+    written = path.read_text(encoding='utf-8')
+    payload = extract_payload(written)
+
+    np.testing.assert_allclose(
+        decode_column(payload["feature_values"]["columns"][2]),
+        np.round(explanation.data[:, 2], 3),
+        rtol=1e-6,
+    )
+    assert payload["groups"]["offsets"] == [0, 25, 50]
+    np.testing.assert_array_equal(decode_column(payload["groups"]["order"])[:25], np.arange(0, 50, 2))
+    assert written == generator.render(**report_data)
+
+
+@pytest.mark.parametrize("payload_encoding", ["binary", "json"])
+def test_write_peak_memory_is_bounded_by_block(tmp_path, payload_encoding):
+    shap_values = np.random.default_rng(0).normal(size=(50_000, 20))
+    generator = ReportGenerator()
+    tracemalloc.start()
+    generator.write(
+        str(tmp_path / "report.html"),
+        importance_data={'features': [str(i) for i in range(20)], 'values': [0.05] * 20},
+        shap_values=shap_values,
+        feature_values=shap_values,
+        base_values=0.0,
+        payload_encoding=payload_encoding,
+        round_decimals=4,
+        block_rows=3000,
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < shap_values.nbytes / 4
+
+
+def test_log_xai_report_local_store(local_tracking):
+    explanation = make_explanation()
+    with mlflow.start_run() as run:
+        artifact_path = XaiflowPlugin().log_xai_report(
+            feature_names=explanation.feature_names,
+            shap_values=explanation,
+        )
+    local_path = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path=artifact_path)
+    assert artifact_path == "reports/feature_importance_report.html"
+    payload = extract_payload(open(local_path, encoding='utf-8').read())
+    assert payload["shap_values"]["shape"] == [50, 4]
+    assert abs(sum(payload["importance_data"]["values"]) - 1) < 1e-9
+
+
+def test_multi_output_report_embeds_features_once(local_tracking):
+    explanation = make_explanation(n_rows=40, n_features=3)
+    rng = np.random.default_rng(1)
+    multi_output = shap.Explanation(
+        values=rng.normal(size=(40, 3, 4)),
+        base_values=np.tile([0.1, 0.2, 0.3, 0.4], (40, 1)),
+        data=explanation.data,
+        feature_names=explanation.feature_names,
+    )
+    with mlflow.start_run() as run:
+        artifact_path = XaiflowPlugin().log_xai_report(
+            feature_names=explanation.feature_names,
+            shap_values=multi_output,
+            group_labels=["a", "b"] * 20,
+            max_points_per_feature=30,
+            output_names=["w", "x", "y", "z"],
+        )
+    local_path = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path=artifact_path)
+    payload = extract_payload(open(local_path, encoding='utf-8').read())
+
+    assert payload["shap_values"]["shape"] == [40, 3, 4]
+    assert payload["feature_values"]["shape"] == [40, 3]
+    assert payload["base_values"] == [0.1, 0.2, 0.3, 0.4]
+    # column j * n_outputs + o holds feature j of output o
+    np.testing.assert_allclose(
+        decode_column(payload["shap_values"]["columns"][2 * 4 + 1]), np.round(multi_output.values[:, 2, 1], 4), rtol=1e-5
+    )
+    importance = np.abs(multi_output.values).mean(axis=0)
+    np.testing.assert_allclose(payload["outputs"]["importance"], (importance / importance.sum(axis=0)).T, rtol=1e-5)
+    assert payload["outputs"]["names"] == ["w", "x", "y", "z"]
+    np.testing.assert_allclose(payload["importance_data"]["values"], payload["outputs"]["importance"][-1])
+    assert len(payload["scatter_samples"]["indices"]) == 12
+    assert len(payload["groups"]["importance"][0]) == 12
+    assert len(payload["summaries"]["overall"][0]) == 12
+
+
+def test_more_than_one_output_axis_is_rejected():
+    explanation = make_explanation(n_rows=10, n_features=2)
+    nested = shap.Explanation(values=np.zeros((10, 2, 3, 2)), base_values=np.zeros(10), data=explanation.data)
+    with pytest.raises(NotImplementedError, match="more than one output axis"):
+        XaiflowPlugin().log_xai_report(feature_names=["a", "b"], shap_values=nested, run_id="any")
+
+
+def test_import_does_not_load_mlflow_or_shap():
+    code = (
+        "import sys; from xaiflow import XaiflowPlugin; XaiflowPlugin(); "
+        "print(sorted(m for m in ('mlflow', 'shap', 'jinja2') if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_assets_are_cached_until_mtime_changes(tmp_path):
+    asset = tmp_path / "bundle.js"
+    asset.write_text("first")
+    assert read_cached(str(asset)) == "first"
+
+    # same mtime: the cached content is returned even though the file changed
+    stat = os.stat(asset)
+    asset.write_text("other")
+    os.utime(asset, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert read_cached(str(asset)) == "first"
+
+    os.utime(asset, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert read_cached(str(asset)) == "other"
+    assert read_cached(str(tmp_path / "missing.js")) is None
+
+
+def test_environment_is_shared_between_generators():
+    assert ReportGenerator().env is ReportGenerator().env
+    assert get_environment(ReportGenerator().template_dir).auto_reload
@@ -0,0 +1,299 @@
+import os
+
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.encoding import decode_column
+
+from tests.conftest import extract_payload, make_explanation
+
+IMPORTANCE_CANVAS = ".importance-chart-container canvas"
+SCATTER_CANVAS = ".scatter-canvas canvas"
+
+# Chart.js draws titles and tick labels onto the canvas: record every text with its position
+# (CSS pixels within the canvas) so the tests can read the charts and click on their labels
+RECORD_CANVAS_TEXT = """
+window.canvasText = [];
+const fillText = CanvasRenderingContext2D.prototype.fillText;
+CanvasRenderingContext2D.prototype.fillText = function (text, x, y, ...rest) {
+    const point = this.getTransform().transformPoint(new DOMPoint(x, y));
+    const scale = this.canvas.width / (this.canvas.clientWidth || this.canvas.width);
+    window.canvasText.push({ canvas: this.canvas, text: String(text), x: point.x / scale, y: point.y / scale });
+    return fillText.call(this, text, x, y, ...rest);
+};
+"""
+
+# Count the streams the page decompresses the report with
+COUNT_DECOMPRESSIONS = """
+window.decompressions = [];
+const NativeDecompressionStream = window.DecompressionStream;
+window.DecompressionStream = class extends NativeDecompressionStream {
+    constructor(format) {
+        super(format);
+        window.decompressions.push(format);
+    }
+};
+"""
+
+HAS_TEXT = """
+([selector, text]) => window.canvasText.some(
+    (item) => item.canvas === document.querySelector(selector) && item.text.includes(text)
+)
+"""
+
+
+@pytest.fixture(scope="module")
+def browser():
+    """Headless Chromium, the checks are skipped where it cannot be started."""
+    sync_api = pytest.importorskip("playwright.sync_api")
+    with sync_api.sync_playwright() as p:
+        try:
+            browser = p.chromium.launch()
+        except sync_api.Error as error:
+            pytest.skip(f"Chromium cannot be started: {error.message.splitlines()[0]}")
+        yield browser
+        browser.close()
+
+
+@pytest.fixture
+def open_report(browser):
+    """Open a report (file path or URL) and wait until its charts are mounted."""
+    pages = []
+
+    def open_page(location, init_script=None):
+        page = browser.new_page()
+        pages.append(page)
+        page.errors, page.requests = [], []
+        page.on("pageerror", page.errors.append)
+        page.on("request", lambda request: page.requests.append(request.url))
+        page.add_init_script(RECORD_CANVAS_TEXT)
+        if init_script:
+            page.add_init_script(init_script)
+        page.goto(location if "://" in location else f"file://{location}")
+        page.wait_for_selector("#deepdive-button, .traditional-display")
+        if page.evaluate("() => typeof window.decodeXaiflowPayload") == "undefined":
+            pytest.skip("bundle.js predates the report payload, run make build")
+        page.wait_for_function(HAS_TEXT, arg=[IMPORTANCE_CANVAS, "Feature Importance"])
+        return page
+
+    yield open_page
+    for page in pages:
+        page.close()
+
+
+def log_report(explanation, report_name="report.html", **kwargs) -> str:
+    """Log a report to a new run, returns its local path."""
+    with mlflow.start_run() as run:
+        XaiflowPlugin().log_xai_report(explanation.feature_names, explanation, report_name=report_name, **kwargs)
+    # the whole directory, split reports keep their shards next to the report
+    directory = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path="reports")
+    return os.path.join(directory, report_name)
+
+
+def read_report(path) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def wait_for_text(page, selector, text):
+    page.wait_for_function(HAS_TEXT, arg=[selector, text])
+
+
+def listed_rows(page, first):
+    """Rows of the deep dive observation list once it starts with the given row."""
+    page.wait_for_function(
+        "(first) => document.querySelector('.job-list li')?.textContent.trim() === first", arg=f"#{first + 1}"
+    )
+    return [int(text.strip().lstrip("#")) - 1 for text in page.locator(".job-list li").all_inner_texts()]
+
+
+def select_feature(page, name):
+    """Click the bar of a feature in the importance chart, next to its tick label."""
+    label = page.evaluate(
+        "([selector, name]) => window.canvasText.filter("
+        "(item) => item.canvas === document.querySelector(selector) && item.text === name).pop()",
+        [IMPORTANCE_CANVAS, name],
+    )
+    box = page.query_selector(IMPORTANCE_CANVAS).bounding_box()
+    page.mouse.click(box["x"] + label["x"] + 20, box["y"] + label["y"])
+    wait_for_text(page, SCATTER_CANVAS, f"Shap Values for {name}")
+
+
+def test_sampled_scatter_plot_shows_the_true_count(local_tracking, open_report):
+    path = log_report(make_explanation(n_rows=500), max_points_per_feature=100)
+    payload = extract_payload(read_report(path))
+    page = open_report(path)
+    select_feature(page, "feature_1")
+
+    plotted = len(decode_column(payload["scatter_samples"]["indices"][1]))
+    assert plotted < 500
+    wait_for_text(page, SCATTER_CANVAS, f"Showing {plotted} of 500 observations (sampled)")
+    assert not page.errors
+
+
+def test_group_switch_filters_the_scatter_plot_through_the_group_index(local_tracking, open_report):
+    group_labels = ["a"] * 150 + ["b"] * 350
+    path = log_report(make_explanation(n_rows=500), max_points_per_feature=100, group_labels=group_labels)
+    payload = extract_payload(read_report(path))
+    page = open_report(path)
+    select_feature(page, "feature_1")
+
+    sampled = decode_column(payload["scatter_samples"]["indices"][1])
+    page.select_option("#group-dropdown", "b")
+    wait_for_text(page, SCATTER_CANVAS, f"Showing {int((sampled >= 150).sum())} of 350 observations (sampled)")
+    page.select_option("#group-dropdown", "a")
+    wait_for_text(page, SCATTER_CANVAS, f"Showing {int((sampled < 150).sum())} of 150 observations (sampled)")
+    assert not page.errors
+
+
+def test_output_selector_switches_the_summaries(local_tracking, open_report):
+    explanation = make_explanation(n_rows=200, n_features=3)
+    values = np.random.default_rng(1).normal(size=(200, 3, 2))
+    # feature_1 has a mean SHAP value of 1.5 for the first output and -2.5 for the second
+    values[:, 1] += np.array([1.5, -2.5]) - values[:, 1].mean(axis=0)
+    multi_output = shap.Explanation(
+        values=values,
+        base_values=np.tile([0.1, 0.2], (200, 1)),
+        data=explanation.data,
+        feature_names=explanation.feature_names,
+    )
+    path = log_report(multi_output, output_names=["low", "high"])
+    page = open_report(path)
+    select_feature(page, "feature_1")
+
+    # the last output is selected first
+    assert page.input_value("#output-dropdown") == "1"
+    page.wait_for_selector(".selected-info:has-text('mean SHAP -2.50')")
+    page.select_option("#output-dropdown", label="low")
+    page.wait_for_selector(".selected-info:has-text('mean SHAP 1.50')")
+    assert not page.errors
+
+
+def test_scatter_axis_shows_category_and_boolean_labels(local_tracking, open_report):
+    explanation = make_explanation(n_rows=300, n_features=3)
+    rng = np.random.default_rng(2)
+    data = explanation.data.astype(object)
+    data[:, 1] = rng.choice(["small", "medium", "large"], 300)
+    data[:, 2] = rng.random(300) > 0.5
+    explanation.data = data
+    path = log_report(explanation)
+    payload = extract_payload(read_report(path))
+    page = open_report(path)
+
+    for j, name in [(1, "feature_1"), (2, "feature_2")]:
+        categories = payload["feature_values"]["columns"][j]["categories"]
+        select_feature(page, name)
+        for label in categories:
+            wait_for_text(page, SCATTER_CANVAS, label)
+    assert set(payload["feature_values"]["columns"][2]["categories"]) == {"False", "True"}
+    assert not page.errors
+
+
+@pytest.mark.parametrize("payload_encoding, compression", [("binary", "gzip"), ("json", "deflate-raw")])
+def test_compressed_report_is_decompressed_in_the_browser(local_tracking, open_report, payload_encoding, compression):
+    path = log_report(
+        make_explanation(n_rows=300),
+        payload_encoding=payload_encoding,
+        compression=compression,
+        compress_bundle=True,
+    )
+    page = open_report(path, init_script=COUNT_DECOMPRESSIONS)
+    select_feature(page, "feature_2")
+
+    # the bundle, then the payload as a whole (json) or every column of it (binary)
+    html_content = read_report(path)
+    compressed = html_content.count(f'data-compression="{compression}"') + html_content.count(f'"compression":"{compression}"')
+    assert compressed == (2 if payload_encoding == "json" else 1 + 2 * 4)
+    assert page.evaluate("() => window.decompressions") == [compression] * compressed
+    assert not page.errors
+
+
+def test_split_report_fetches_the_shard_of_the_selected_feature(local_tracking, open_report, static_server):
+    path = log_report(make_explanation(n_rows=600), split=True, shard_rows=200)
+    page = open_report(static_server(os.path.dirname(path)) + "report.html")
+
+    def fetched_shards():
+        return [url.rsplit("/", 1)[1] for url in page.requests if url.endswith(".bin")]
+
+    assert fetched_shards() == []
+    with page.expect_request(lambda request: request.url.endswith("report_data/feature_2.bin")):
+        select_feature(page, "feature_2")
+    with page.expect_request(lambda request: request.url.endswith("report_data/feature_0.bin")):
+        select_feature(page, "feature_0")
+    assert fetched_shards() == ["feature_2.bin", "feature_0.bin"]
+    # the deep dive reads the row block of the first observation only
+    with page.expect_request(lambda request: request.url.endswith("report_data/rows_0.bin")):
+        page.click("#deepdive-button")
+    page.wait_for_selector("#deepdive-canvas")
+    assert fetched_shards() == ["feature_2.bin", "feature_0.bin", "rows_0.bin"]
+    assert not page.errors
+
+
+def test_density_heatmap_gives_way_to_points_when_zoomed_in(local_tracking, open_report):
+    path = log_report(make_explanation(n_rows=3000), density_threshold=1000, density_bins=32)
+    page = open_report(path)
+    select_feature(page, "feature_1")
+    wait_for_text(page, SCATTER_CANVAS, "Density of 3,000 observations, zoom in to see points")
+
+    box = page.query_selector(SCATTER_CANVAS).bounding_box()
+    page.mouse.move(box["x"] + box["width"] / 2, box["y"] + box["height"] / 2)
+    for _ in range(10):
+        page.mouse.wheel(0, -100)
+    page.wait_for_timeout(500)
+    # the last redraw shows the points in view, not the histogram
+    page.evaluate("() => { window.canvasText.length = 0; }")
+    page.mouse.wheel(0, -100)
+    wait_for_text(page, SCATTER_CANVAS, "Shap Values for feature_1")
+    assert not page.evaluate(HAS_TEXT, [SCATTER_CANVAS, "Density of"])
+    assert not page.errors
+
+
+def test_deep_dive_jumps_to_extreme_and_similar_observations(local_tracking, open_report):
+    explanation = make_explanation(n_rows=300)
+    path = log_report(explanation, similar_observations=True)
+    page = open_report(path)
+    select_feature(page, "feature_1")
+    page.click("#deepdive-button")
+
+    predictions = 0.5 + explanation.values.sum(axis=1)
+    top_predictions = list(np.argsort(-predictions)[:10])
+    page.select_option("#observation-jump", "prediction-top")
+    assert listed_rows(page, top_predictions[0]) == top_predictions
+    lowest_shap = list(np.argsort(explanation.values[:, 1])[:10])
+    page.select_option("#observation-jump", "shap-bottom")
+    assert listed_rows(page, lowest_shap[0]) == lowest_shap
+
+    # the neighbours of the observation shown when the list is opened, the first of the list before
+    page.select_option("#observation-jump", "all")
+    listed_rows(page, 0)
+    page.select_option("#observation-jump", "similar")
+    page.wait_for_function("() => document.querySelector('.job-list li')?.textContent.trim() !== '#1'")
+    similar = [int(text.strip().lstrip("#")) - 1 for text in page.locator(".job-list li").all_inner_texts()]
+    distances = np.linalg.norm(explanation.values - explanation.values[0], axis=1)
+    assert len(similar) == 10 and 0 not in similar
+    assert distances[similar].mean() < distances[1:].mean() / 2
+    assert not page.errors
+
+
+def test_interaction_partner_selects_its_scatter_plot(local_tracking, open_report):
+    explanation = make_explanation(n_rows=400)
+    # the SHAP values of feature_3 follow those of feature_1
+    explanation.values[:, 3] = 0.9 * explanation.values[:, 1] + 0.1 * explanation.values[:, 3]
+    path = log_report(explanation, correlation_top=2)
+    correlations = extract_payload(read_report(path))["correlations"]
+    page = open_report(path)
+    select_feature(page, "feature_1")
+
+    # the SHAP partners first, then those whose feature values correlate
+    expected = list(dict.fromkeys(correlations["shap"]["partners"][1] + correlations["features"]["partners"][1]))
+    page.wait_for_selector(".interaction-partners button")
+    partners = [text.strip() for text in page.locator(".interaction-partners button").all_inner_texts()]
+    assert partners == [f"feature_{j}" for j in expected]
+    assert partners[0] == "feature_3"
+    page.click(".interaction-partners button >> nth=0")
+    wait_for_text(page, SCATTER_CANVAS, "Shap Values for feature_3")
+    page.wait_for_selector(".interaction-partners button:has-text('feature_1')")
+    assert not page.errors
@@ -0,0 +1,59 @@
+import numpy as np
+
+from xaiflow.encoding import decode_column
+from xaiflow.mlflow_plugin import XaiflowPlugin
+from xaiflow.sampling import sample_scatter_indices, stratified_sample
+
+from tests.conftest import extract_payload
+
+
+def test_stratified_sample_keeps_extremes_and_budget():
+    rng = np.random.default_rng(1)
+    feature_column = rng.normal(size=10_000)
+    shap_column = rng.normal(size=10_000)
+    indices = stratified_sample(feature_column, shap_column, 500, np.random.default_rng(0))
+
+    assert len(indices) == 500
+    assert np.all(np.diff(indices) > 0)
+    assert shap_column.argmin() in indices
+    assert shap_column.argmax() in indices
+
+
+def test_stratified_sample_covers_feature_quantiles():
+    feature_column = np.arange(100_000, dtype=float)
+    shap_column = np.zeros(100_000)
+    indices = stratified_sample(feature_column, shap_column, 1000, np.random.default_rng(0), n_strata=10, n_extremes=0)
+    counts, _ = np.histogram(feature_column[indices], bins=10, range=(0, 100_000))
+    assert np.all(counts == 100)
+
+
+def test_sample_scatter_indices_is_deterministic():
+    rng = np.random.default_rng(2)
+    shap_values = rng.normal(size=(5000, 3))
+    feature_values = np.column_stack([rng.normal(size=5000), rng.integers(0, 4, size=5000), np.array(["a", "b"] * 2500, dtype=object)])
+
+    first = sample_scatter_indices(shap_values, feature_values, 300, seed=7)
+    second = sample_scatter_indices(shap_values, feature_values, 300, seed=7)
+    other = sample_scatter_indices(shap_values, feature_values, 300, seed=8)
+
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not all(np.array_equal(a, b) for a, b in zip(first, other))
+    assert [len(indices) for indices in first] == [300, 300, 300]
+
+
+def test_small_explanations_are_not_sampled():
+    assert np.array_equal(stratified_sample(np.ones(10), np.ones(10), 20, np.random.default_rng(0)), np.arange(10))
+
+
+def test_scatter_samples_in_payload():
+    shap_values = np.random.default_rng(3).normal(size=(1000, 2))
+    samples = sample_scatter_indices(shap_values, shap_values, 100)
+    html_content = XaiflowPlugin().report_generator.render(
+        importance_data={'features': ['a', 'b'], 'values': [0.5, 0.5]},
+        shap_values=shap_values,
+        feature_values=shap_values,
+        scatter_samples=samples,
+    )
+    payload = extract_payload(html_content)
+    assert payload["scatter_samples"]["total_rows"] == 1000
+    np.testing.assert_array_equal(decode_column(payload["scatter_samples"]["indices"][1]), samples[1])
@@ -0,0 +1,110 @@
+import os
+import urllib.parse
+import urllib.request
+
+import mlflow
+import numpy as np
+import pytest
+
+from xaiflow import ReportGenerator, XaiflowPlugin
+from xaiflow.shards import decode_shard, payload_headers
+
+from tests.conftest import extract_payload, make_explanation
+
+
+def write_split_report(path, n_rows=1000, shard_rows=300):
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(size=(n_rows, 3, 2))
+    feature_values = np.empty((n_rows, 3), dtype=object)
+    feature_values[:, 0] = rng.normal(size=n_rows)
+    feature_values[:, 1] = rng.choice(["low", "high"], n_rows)
+    feature_values[:, 2] = rng.random(n_rows) > 0.5
+    ReportGenerator().write(
+        str(path),
+        split=True,
+        shard_rows=shard_rows,
+        importance_data={'features': ['a', 'b', 'c'], 'values': [0.2, 0.3, 0.5]},
+        shap_values=shap_values,
+        feature_values=feature_values,
+        group_labels=rng.choice(["x", "y"], n_rows),
+        feature_names=['a', 'b', 'c'],
+        round_decimals=4,
+        scatter_samples=[np.arange(j, n_rows, 7) for j in range(6)],
+    )
+    return shap_values, feature_values
+
+
+def test_split_report_shards_every_matrix(tmp_path):
+    shap_values, feature_values = write_split_report(tmp_path / "report.html")
+    shard_dir = tmp_path / "report_data"
+    assert sorted(os.listdir(shard_dir)) == [
+        "feature_0.bin", "feature_1.bin", "feature_2.bin", "groups.bin",
+        "rows_0.bin", "rows_1.bin", "rows_2.bin", "rows_3.bin",
+    ]
+    payload = extract_payload((tmp_path / "report.html").read_text(encoding='utf-8'))
+    manifest = payload["shards"]
+    assert manifest["url"] == "report_data/"
+    assert all("data" not in column for column in payload["shap_values"]["columns"])
+    assert payload["feature_values"]["columns"][1]["categories"] == ["high", "low"]
+    headers = payload_headers(payload)
+
+    feature = decode_shard((shard_dir / "feature_1.bin").read_bytes(), manifest["features"][1], headers, 1000)
+    np.testing.assert_allclose(feature[("shap_values", 3)], np.round(shap_values[:, 1, 1], 4), rtol=1e-5)
+    np.testing.assert_array_equal(feature[("feature_values", 1)], feature_values[:, 1] == "low")
+    np.testing.assert_array_equal(feature[("scatter_samples", 2)], np.arange(2, 1000, 7))
+
+    # the row blocks concatenate to the full columns
+    blocks = [
+        decode_shard((shard_dir / block["path"]).read_bytes(), block, headers, 1000)
+        for block in manifest["row_blocks"]
+    ]
+    assert [(block["start"], block["stop"]) for block in manifest["row_blocks"]] == [(0, 300), (300, 600), (600, 900), (900, 1000)]
+    np.testing.assert_array_equal(
+        np.concatenate([block[("feature_values", 2)] for block in blocks]), feature_values[:, 2].astype(bool)
+    )
+    np.testing.assert_allclose(
+        np.concatenate([block[("shap_values", 5)] for block in blocks]), np.round(shap_values[:, 2, 1], 4), rtol=1e-5
+    )
+
+    groups = decode_shard((shard_dir / "groups.bin").read_bytes(), manifest["groups"], headers, 1000)
+    assert payload["groups"]["labels"] == ["x", "y"]
+    assert len(groups[("groups", 0)]) == 1000
+
+
+def test_split_report_requires_binary_encoding(tmp_path):
+    with pytest.raises(ValueError, match="payload_encoding must be 'binary'"):
+        ReportGenerator().write(
+            str(tmp_path / "report.html"), split=True, payload_encoding="json",
+            importance_data={'features': ['a'], 'values': [1.0]}, shap_values=np.zeros((3, 1)),
+        )
+
+
+def test_split_report_is_served_from_artifact_store(local_tracking, static_server):
+    explanation = make_explanation(n_rows=500)
+    with mlflow.start_run() as run:
+        artifact = XaiflowPlugin().log_xai_report(
+            explanation.feature_names, explanation, group_labels=["a", "b"] * 250, split=True, shard_rows=200,
+        )
+    assert artifact == "reports/feature_importance_report.html"
+    logged = {info.path for info in mlflow.MlflowClient().list_artifacts(run.info.run_id, "reports/feature_importance_report_data")}
+    assert "reports/feature_importance_report_data/feature_3.bin" in logged
+    assert "reports/feature_importance_report_data/rows_2.bin" in logged
+
+    local_dir = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path="reports")
+    report_url = urllib.parse.urljoin(static_server(local_dir), "feature_importance_report.html")
+    with urllib.request.urlopen(report_url) as response:
+        payload = extract_payload(response.read().decode("utf-8"))
+    # resolve the shards like the page does: manifest url relative to the report
+    manifest = payload["shards"]
+    shard_url = urllib.parse.urljoin(report_url, manifest["url"])
+    headers = payload_headers(payload)
+
+    with urllib.request.urlopen(urllib.parse.urljoin(shard_url, manifest["features"][2]["path"])) as response:
+        feature = decode_shard(response.read(), manifest["features"][2], headers, manifest["rows"])
+    np.testing.assert_allclose(feature[("shap_values", 2)], np.round(explanation.values[:, 2], 4), rtol=1e-5)
+    np.testing.assert_allclose(feature[("feature_values", 2)], np.round(explanation.data[:, 2], 4), rtol=1e-5)
+
+    block = manifest["row_blocks"][2]
+    with urllib.request.urlopen(urllib.parse.urljoin(shard_url, block["path"])) as response:
+        rows = decode_shard(response.read(), block, headers, manifest["rows"])
+    np.testing.assert_allclose(rows[("shap_values", 0)], np.round(explanation.values[400:, 0], 4), rtol=1e-5)
@@ -0,0 +1,106 @@
+import json
+import os
+
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.sidecar import compare_summaries
+
+from tests.conftest import make_explanation
+
+
+def summary(feature_names, importance, output_names=None, rows=10):
+    return {"feature_names": feature_names, "importance": importance, "output_names": output_names, "rows": rows}
+
+
+def test_compare_summaries_matches_features_by_name():
+    comparison = compare_summaries({
+        "a": summary(["x", "y"], [[0.75, 0.25]]),
+        "b": summary(["y", "z"], [[0.5, 0.5]]),
+    })
+    assert comparison["feature_names"] == ["x", "z", "y"]
+    assert comparison["importance"] == [[0.75, None], [None, 0.5], [0.25, 0.5]]
+    assert comparison["spread"] == [0.0, 0.0, 0.25]
+    assert comparison["drift"] == [[0.0, None], [None, None], [0.0, 0.25]]
+
+
+def test_compare_summaries_picks_the_output():
+    summaries = {"a": summary(["x", "y"], [[0.1, 0.9], [0.8, 0.2]], ["no", "yes"])}
+    assert compare_summaries(summaries)["output"] == "yes"
+    assert compare_summaries(summaries, output="no")["importance"] == [[0.9], [0.1]]
+    with pytest.raises(ValueError, match="no output 'maybe'"):
+        compare_summaries(summaries, output="maybe")
+
+
+def test_sidecar_is_logged_next_to_the_report(local_tracking):
+    explanation = make_explanation(n_rows=80)
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, group_labels=["a", "b"] * 40)
+
+    path = mlflow.artifacts.download_artifacts(
+        run_id=run.info.run_id, artifact_path="reports/feature_importance_report.summary.json"
+    )
+    with open(path, encoding="utf-8") as f:
+        sidecar = json.load(f)
+    importance = np.abs(explanation.values).mean(axis=0)
+    np.testing.assert_allclose(sidecar["importance"], [importance / importance.sum()])
+    assert sidecar["rows"] == 80 and sidecar["output_names"] is None
+    assert sidecar["summaries"]["groups"]["counts"] == [40, 40]
+
+
+def test_compare_runs_fetches_and_caches_sidecars(local_tracking, monkeypatch):
+    plugin = XaiflowPlugin()
+    run_ids = []
+    for seed in range(3):
+        explanation = make_explanation(seed=seed)
+        with mlflow.start_run(run_name=f"sweep-{seed}") as run:
+            plugin.log_xai_report(explanation.feature_names, explanation)
+        run_ids.append(run.info.run_id)
+    with mlflow.start_run() as empty:
+        pass
+
+    downloads = []
+    download = plugin.client.download_artifacts
+    monkeypatch.setattr(plugin.client, "download_artifacts", lambda *args: downloads.append(args[1]) or download(*args))
+    cache_dir = str(local_tracking / "summaries")
+    output_path = str(local_tracking / "comparison.html")
+    comparison = plugin.compare_runs(run_ids + [empty.info.run_id], output_path=output_path, cache_dir=cache_dir)
+
+    # only the sidecars are downloaded
+    assert downloads == ["reports/feature_importance_report.summary.json"] * 3
+    assert comparison["run_names"] == ["sweep-0", "sweep-1", "sweep-2"]
+    assert comparison["missing"] == [empty.info.run_id]
+    assert len(comparison["importance"][0]) == 3 and comparison["path"] == output_path
+    with open(output_path, encoding="utf-8") as f:
+        assert "sweep-2" in f.read()
+
+    # cached: logged to the active run without downloading again
+    with mlflow.start_run() as summary_run:
+        logged = plugin.compare_runs(run_ids, cache_dir=cache_dir)
+    assert len(downloads) == 3
+    assert logged["path"] == "reports/comparison_report.html"
+    assert mlflow.artifacts.download_artifacts(run_id=summary_run.info.run_id, artifact_path=logged["path"])
+
+
+def test_compare_runs_reads_multi_output_and_appended_reports(local_tracking):
+    rng = np.random.default_rng(0)
+    explanation = shap.Explanation(
+        values=rng.normal(size=(30, 3, 2)),
+        base_values=np.zeros((30, 2)),
+        data=rng.normal(size=(30, 3)),
+        feature_names=["a", "b", "c"],
+    )
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as first:
+        plugin.log_xai_report(explanation.feature_names, explanation, output_names=["no", "yes"])
+    with mlflow.start_run() as second:
+        plugin.append_xai_report(explanation.feature_names, explanation, output_names=["no", "yes"])
+
+    comparison = plugin.compare_runs([first.info.run_id, second.info.run_id], output="no",
+                                     output_path=os.devnull)
+    assert comparison["output"] == "no"
+    np.testing.assert_allclose(np.array(comparison["drift"], dtype=float), 0, atol=1e-6)
@@ -0,0 +1,118 @@
+import mlflow
+import numpy as np
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.encoding import decode_column
+from xaiflow.sampling import StreamingScatterSample, hash_uniform
+from xaiflow.streaming import load_npz
+from xaiflow.summaries import RunningSummary, summarize
+
+from tests.conftest import logged_payload, make_explanation
+
+
+def feed(summary, matrix, block_rows):
+    for start in range(0, len(matrix), block_rows):
+        rows = np.arange(start, min(start + block_rows, len(matrix)))
+        summary.update(matrix[rows], hash_uniform(rows, matrix.shape[1]))
+
+
+def test_running_summary_matches_summarize():
+    matrix = np.random.default_rng(0).normal(size=(3000, 4))
+    summary = RunningSummary(4)
+    feed(summary, matrix, 700)
+    np.testing.assert_allclose(summary.table(), summarize(matrix), rtol=1e-9)
+
+    # beyond sample_size the percentiles are estimated from a uniform sample
+    sampled = RunningSummary(4, sample_size=1500)
+    feed(sampled, matrix, 700)
+    np.testing.assert_allclose(sampled.table()[:4], summarize(matrix)[:4], rtol=1e-9)
+    np.testing.assert_allclose(sampled.table()[4:9], summarize(matrix)[4:9], atol=0.1)
+
+
+def test_streaming_scatter_sample_does_not_depend_on_blocks():
+    matrix = np.random.default_rng(1).normal(size=(5000, 3))
+    samples = []
+    for block_rows in (5000, 333):
+        sample = StreamingScatterSample(3, max_points=200, seed=7)
+        for start in range(0, len(matrix), block_rows):
+            sample.update(matrix[start:start + block_rows])
+        samples.append(sample.indices())
+    for first, second, column in zip(*samples, range(3)):
+        np.testing.assert_array_equal(first, second)
+        assert len(first) <= 200
+        assert {matrix[:, column].argmin(), matrix[:, column].argmax()} <= set(first.tolist())
+
+
+def test_load_npz_maps_uncompressed_arrays(tmp_path):
+    values = np.arange(12, dtype=np.float32).reshape(4, 3)
+    np.savez(tmp_path / "explanation.npz", values=values, data=np.asfortranarray(values * 2), base_values=0.5)
+    arrays = load_npz(str(tmp_path / "explanation.npz"))
+    assert isinstance(arrays["values"], np.memmap)
+    np.testing.assert_array_equal(arrays["values"], values)
+    np.testing.assert_array_equal(arrays["data"], values * 2)
+    assert arrays["base_values"] == 0.5
+
+    np.savez_compressed(tmp_path / "compressed.npz", values=values)
+    with pytest.raises(ValueError, match="compressed"):
+        load_npz(str(tmp_path / "compressed.npz"))
+
+
+def test_memory_mapped_explanation_matches_in_memory_report(local_tracking, tmp_path):
+    explanation = make_explanation(n_rows=400)
+    np.save(tmp_path / "values.npy", explanation.values)
+    np.save(tmp_path / "data.npy", explanation.data)
+    mapped = shap.Explanation(
+        values=np.load(tmp_path / "values.npy", mmap_mode="r"),
+        base_values=explanation.base_values,
+        data=np.load(tmp_path / "data.npy", mmap_mode="r"),
+        feature_names=explanation.feature_names,
+    )
+    group_labels = ["a", "b", "c", "d"] * 100
+    plugin = XaiflowPlugin()
+    with mlflow.start_run() as run:
+        plugin.log_xai_report(explanation.feature_names, explanation, group_labels=group_labels, report_name="memory.html")
+        plugin.log_xai_report(explanation.feature_names, mapped, group_labels=group_labels, report_name="mapped.html",
+                              max_points_per_feature=100)
+    expected = logged_payload(run.info.run_id, "memory.html")
+    payload = logged_payload(run.info.run_id, "mapped.html")
+
+    np.testing.assert_allclose(payload["importance_data"]["values"], expected["importance_data"]["values"], rtol=1e-9)
+    np.testing.assert_allclose(payload["summaries"]["overall"], expected["summaries"]["overall"], atol=1e-6)
+    np.testing.assert_allclose(payload["summaries"]["groups"]["values"], expected["summaries"]["groups"]["values"], atol=1e-6)
+    assert payload["groups"] == expected["groups"]
+    for column, expected_column in zip(payload["shap_values"]["columns"], expected["shap_values"]["columns"]):
+        np.testing.assert_array_equal(decode_column(column), decode_column(expected_column))
+    assert payload["scatter_samples"]["total_rows"] == 400
+    assert all(len(decode_column(indices)) <= 100 for indices in payload["scatter_samples"]["indices"])
+
+
+def test_iterator_of_batches_is_streamed(local_tracking):
+    explanation = make_explanation(n_rows=300)
+    region = np.array(["north", "south", "east"] * 100, dtype=object)
+
+    def batches():
+        for start in range(0, 300, 70):
+            rows = slice(start, start + 70)
+            data = np.column_stack([explanation.data[rows, :3], region[rows]]).astype(object)
+            yield shap.Explanation(values=explanation.values[rows], base_values=explanation.base_values[rows],
+                                   data=data, feature_names=explanation.feature_names)
+
+    with mlflow.start_run() as run:
+        XaiflowPlugin().log_xai_report(explanation.feature_names, batches(), group_labels=list(region))
+    payload = logged_payload(run.info.run_id)
+
+    assert payload["shap_values"]["shape"] == [300, 4]
+    np.testing.assert_allclose(
+        decode_column(payload["shap_values"]["columns"][1]), np.round(explanation.values[:, 1], 4), rtol=1e-5
+    )
+    assert payload["feature_encodings"]["feature_3"] == {"0": "north", "1": "south", "2": "east"}
+    np.testing.assert_array_equal(decode_column(payload["feature_values"]["columns"][3])[:3], [0, 1, 2])
+    assert payload["groups"]["labels"] == ["east", "north", "south"]
+
+    with mlflow.start_run():
+        with pytest.raises(ValueError, match="group_labels length"):
+            XaiflowPlugin().log_xai_report(explanation.feature_names, batches(), group_labels=["a"] * 299)
+    with pytest.raises(ValueError, match="must be an instance of shap.Explanation"):
+        XaiflowPlugin().log_xai_report(explanation.feature_names, explanation.values, run_id="any")
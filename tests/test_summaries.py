@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from xaiflow.summaries import SUMMARY_FIELDS, mean_abs, summarize, summarize_features
+
+
+@pytest.fixture
+def shap_matrix():
+    return np.random.default_rng(0).normal(size=(1000, 5))
+
+
+def test_summarize_matches_numpy(shap_matrix):
+    table = summarize(shap_matrix, max_block_bytes=8 * 1000 * 2)  # two columns per block
+    expected = {
+        "mean": shap_matrix.mean(axis=0),
+        "std": shap_matrix.std(axis=0),
+        "min": shap_matrix.min(axis=0),
+        "max": shap_matrix.max(axis=0),
+        "percentile_25": np.percentile(shap_matrix, 25, axis=0),
+        "percentile_90": np.percentile(shap_matrix, 90, axis=0),
+        "importance": np.abs(shap_matrix).mean(axis=0),
+    }
+    for field, values in expected.items():
+        np.testing.assert_allclose(table[SUMMARY_FIELDS.index(field)], values)
+    np.testing.assert_allclose(table[SUMMARY_FIELDS.index("importance")], mean_abs(shap_matrix, block_rows=7))
+
+
+def test_summarize_reads_a_transposed_tensor_by_column():
+    # outputs x samples x features, transposed to samples x features x outputs without copying
+    tensor = np.random.default_rng(1).normal(size=(2, 300, 3)).transpose(1, 2, 0)
+    rows = np.arange(0, 300, 3)
+    flat = np.ascontiguousarray(tensor).reshape(300, 6)
+    np.testing.assert_allclose(summarize(tensor, max_block_bytes=8 * 300 * 4), summarize(flat))
+    np.testing.assert_allclose(summarize(tensor, rows), summarize(flat[rows]))
+
+
+def test_summarize_features_per_group(shap_matrix):
+    group_labels = np.array(["b", "a", "c", "a"] * 250)
+    summaries = summarize_features(shap_matrix, group_labels)
+
+    assert summaries["fields"] == list(SUMMARY_FIELDS)
+    assert summaries["groups"]["labels"] == ["a", "b", "c"]
+    assert summaries["groups"]["counts"] == [500, 250, 250]
+    group_a = np.array(summaries["groups"]["values"][0])
+    np.testing.assert_allclose(group_a[SUMMARY_FIELDS.index("percentile_50")], np.median(shap_matrix[group_labels == "a"], axis=0), atol=1e-6)
+
+
+def test_summarize_features_empty_input():
+    summaries = summarize_features(np.empty((0, 2)))
+    assert summaries["groups"] is None
+    assert summaries["overall"][0] == [None, None]
@@ -0,0 +1,90 @@
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+import shap
+
+from xaiflow import XaiflowPlugin
+from xaiflow.groups import GroupIndex
+from xaiflow.tables import table_features
+
+from tests.conftest import logged_payload, make_explanation
+
+
+def mixed_frame():
+    return pd.DataFrame({
+        "income": [1.5, 2.5, np.nan, 4.0],
+        "segment": pd.Categorical(["b", "a", None, "b"], categories=["a", "b", "c"]),
+        "city": ["x", "y", "x", None],
+        "owner": [True, False, True, True],
+        "children": pd.array([1, None, 3, 0], dtype="Int64"),
+    })
+
+
+def test_numeric_frame_is_not_copied():
+    frame = pd.DataFrame(np.random.default_rng(0).normal(size=(100, 3)), columns=["a", "b", "c"])
+    names, matrix, encodings = table_features(frame)
+
+    assert names == ["a", "b", "c"] and encodings == {}
+    assert matrix.flags.f_contiguous and np.shares_memory(matrix, frame["a"].to_numpy())
+    np.testing.assert_array_equal(matrix, frame.to_numpy())
+
+
+def test_mixed_frame_is_coded_from_the_schema():
+    names, matrix, encodings = table_features(mixed_frame())
+
+    assert names == ["income", "segment", "city", "owner", "children"]
+    assert matrix.flags.f_contiguous and matrix.dtype == np.float64
+    # categories come from the dtype (unused ones included), missing values stay missing
+    assert encodings == {1: {0: "a", 1: "b", 2: "c"}, 2: {0: "x", 1: "y"}, 3: {0: "False", 1: "True"}}
+    np.testing.assert_array_equal(matrix[:, 1], [1, 0, np.nan, 1])
+    np.testing.assert_array_equal(matrix[:, 2], [0, 1, 0, np.nan])
+    np.testing.assert_array_equal(matrix[:, 3], [1, 0, 1, 1])
+    np.testing.assert_array_equal(matrix[:, 4], [1, np.nan, 3, 0])
+
+
+def test_arrow_table_columns():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({
+        "x": pa.chunked_array([[1.0, 2.0], [3.0]]),
+        "level": pa.array(["lo", "hi", "lo"]).dictionary_encode(),
+        "name": pa.array(["p", None, "q"]),
+    })
+    names, matrix, encodings = table_features(table)
+
+    assert names == ["x", "level", "name"]
+    np.testing.assert_array_equal(matrix, [[1, 0, 0], [2, 1, np.nan], [3, 0, 1]])
+    assert encodings == {1: {0: "lo", 1: "hi"}, 2: {0: "p", 1: "q"}}
+
+
+def test_categorical_group_labels_use_their_codes():
+    labels = pd.Series(pd.Categorical(["y", "x", "y", None], categories=["z", "y", "x"]))
+    group_index = GroupIndex(labels)
+
+    # sorted like the labels of a list, unused categories dropped
+    assert group_index.labels == ["nan", "x", "y"]
+    np.testing.assert_array_equal(group_index.codes, [2, 1, 2, 0])
+    assert group_index.counts == [1, 1, 2]
+
+
+def test_log_xai_report_reads_a_dataframe(local_tracking):
+    explanation = make_explanation(n_rows=4, n_features=5)
+    frame = mixed_frame()
+    with mlflow.start_run() as run:
+        XaiflowPlugin().log_xai_report(
+            None,
+            shap.Explanation(values=explanation.values, base_values=explanation.base_values, data=frame),
+            feature_encodings={"owner": {0: "rents", 1: "owns"}},
+            group_labels=frame["segment"].cat.add_categories("none").fillna("none"),
+        )
+
+    payload = logged_payload(run.info.run_id)
+    assert payload["feature_names"] == list(frame.columns)
+    assert payload["feature_encodings"]["segment"] == {"0": "a", "1": "b", "2": "c"}
+    assert payload["feature_encodings"]["owner"] == {"0": "rents", "1": "owns"}
+    assert payload["groups"]["labels"] == ["a", "b", "none"]
+
+
+def test_feature_names_are_required_without_a_table(local_tracking):
+    with mlflow.start_run(), pytest.raises(ValueError, match="feature_names is required"):
+        XaiflowPlugin().log_xai_report(None, make_explanation())
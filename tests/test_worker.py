@@ -0,0 +1,65 @@
+import json
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from xaiflow import ReportGenerator
+
+
+WORKER_BLOCK = r'<script type="text/x-xaiflow-worker" id="xaiflow-worker">(.*?)</script>'
+
+# worker.js run against a stand-in for the worker scope: init, then a scatter query of
+# feature 1 in group 1 (rows 1 and 3)
+SCATTER_QUERY = """
+const replies = [];
+const scope = { postMessage: (message) => replies.push(message) };
+new Function('self', %(source)s)(scope);
+scope.onmessage({ data: { type: 'init', data: {
+  shapValues: [Float32Array.from([0.1, 0.2, 0.3, 0.4]), Float32Array.from([-1, -2, -3, -4])],
+  featureValues: [Float64Array.from([1, 2, 3, 4]), Float64Array.from([10, 20, 30, 40])],
+  sampleIndices: null,
+  groupCodes: Uint8Array.from([0, 1, 0, 1]),
+  groupOrder: Int32Array.from([0, 2, 1, 3]),
+  groupOffsets: [0, 2, 4],
+  density: null,
+  observationIndex: null,
+  nOutputs: 1,
+  nRows: 4,
+} } });
+scope.onmessage({ data: { type: 'scatter', id: 1, feature: 1, output: 0, group: 1 } });
+const reply = replies.find((message) => message.id === 1);
+process.stdout.write(JSON.stringify({
+  ready: replies[0].type, x: Array.from(reply.result.x), y: Array.from(reply.result.y), total: reply.result.total,
+}));
+"""
+
+
+def render() -> str:
+    return ReportGenerator().render(
+        importance_data={'features': ['a', 'b'], 'values': [0.4, 0.6]},
+        shap_values=np.zeros((4, 2)),
+        feature_values=np.zeros((4, 2)),
+        feature_names=['a', 'b'],
+    )
+
+
+def test_report_embeds_the_worker_if_it_is_built(monkeypatch):
+    monkeypatch.setattr(ReportGenerator, "load_worker", lambda self: "self.onmessage = null;")
+    assert re.search(WORKER_BLOCK, render(), re.S).group(1) == "self.onmessage = null;"
+    # without worker.js the data engine runs on the page
+    monkeypatch.setattr(ReportGenerator, "load_worker", lambda self: "")
+    assert 'id="xaiflow-worker"' not in render()
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the worker")
+def test_worker_answers_a_scatter_query():
+    if not ReportGenerator().load_worker():
+        pytest.skip("assets/worker.js has not been built (make build)")
+    source = re.search(WORKER_BLOCK, render(), re.S).group(1)
+    script = SCATTER_QUERY % {"source": json.dumps(source)}
+    output = subprocess.run(["node", "-e", script], check=True, capture_output=True, text=True).stdout
+
+    assert json.loads(output) == {"ready": "ready", "x": [20, 40], "y": [-2, -4], "total": 2}